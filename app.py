@@ -25,7 +25,9 @@ def create_app():
 
         @app.before_first_request
         def create_tables():
+            from models.schema_updates import upgrade_schema
             db.create_all()
+            upgrade_schema(db)
 
         db.init_app(app)
         jwt.init_app(app)
@@ -48,4 +48,5 @@ class AnnexGenerator(DocumentGenerator):
                                                                self.annex.contract.school.nick.strip(),
                                                                self.annex.no,
                                                                self.annex.contract.contract_year,
-                                                               self.annex.contract.contract_no))
+                                                               self.annex.contract.contract_no),
+                                   program_id=self.annex.contract.program_id)
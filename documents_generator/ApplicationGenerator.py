@@ -1,4 +1,3 @@
-from app import create_app
 from helpers.common import DOCX_MIME_TYPE
 from models.product import ProductTypeModel, ProductModel
 from helpers.config_parser import config_parser
@@ -8,9 +7,11 @@ from collections import defaultdict
 
 from helpers.date_converter import DateConverter
 from helpers.google_drive import GoogleDriveCommands
+from helpers.week_calendar import week_calendar
+from models.reference_cache import reference_cache
 from models.application import ApplicationModel, ApplicationType
 from models.contract import ContractModel
-from models.record import RecordModel, RecordState
+from models.record import RecordModel, RecordState, ApplicationRecords
 from models.school import SchoolModel
 from models.week import WeekModel
 from decimal import ROUND_HALF_UP, Decimal
@@ -128,6 +129,7 @@ class RecordsSummaryGenerator(DocumentGenerator):
                                    template_document=_get_template(application.program, _template_doc),
                                    output_directory=_output_dir,
                                    output_name=_output_name,
+                                   program_id=application.program_id,
                                    drive_tool=_drive_tool)
         self.change_mime_type(DOCX_MIME_TYPE)
 
@@ -161,9 +163,9 @@ class StatementsBaseData(DataContainer):
         ApplicationCommonData.add_is_last(self.data, self.is_last)
         self.__prepare_per_week(f"{self.prefix}{WEEK_TEMPLATE}", lambda week: week.str_for_docs())
         self.__prepare_per_week(f"{self.prefix}{KIDS_NO_TEMPLATE}", lambda week: max(
-            record.delivered_kids_no for record in self.records if record.week == week))
+            record.delivered_kids_no for record in self.records if record.week_id == week.id))
         self.__prepare_per_week(f"{self.prefix}{PORTION_TEMPLATE}",
-                                lambda week: len([record for record in self.records if record.week == week]))
+                                lambda week: len([record for record in self.records if record.week_id == week.id]))
         self.maximum_kids_no = self.__max_kids()
         self.data[f"{self.prefix}kids_no"] = self.__max_kids(init_value=self.__kids_on_contract())
 
@@ -210,7 +212,7 @@ class StatementsBaseData(DataContainer):
 
     def __prepare_per_week(self, base_name, fun):
         for no, week in enumerate(self.application.weeks, start=self.start_week):
-            self.data[f"{base_name}_{no}"] = fun(WeekModel.find_by_id(week.id))
+            self.data[f"{base_name}_{no}"] = fun(week_calendar.find_by_id(week.id, week.program_id))
 
 
 def fill_product_data(records: List[RecordModel], product_dict: defaultdict):
@@ -241,6 +243,7 @@ class StatementGenerator(DocumentGenerator):
                                    template_document=self.bd[0].template_doc,
                                    output_directory=self.bd[0].output_dir,
                                    output_name=self.bd[0].output_name,
+                                   program_id=self.bd[0].application.program_id,
                                    drive_tool=_drive_tool)
         self.change_mime_type(DOCX_MIME_TYPE)
 
@@ -285,47 +288,9 @@ class WeekInconsistencyError:
 class ApplicationGenerator(DocumentGenerator):
 
     @staticmethod
-    def check_record_consistency(application: ApplicationModel):
-        errors: List[InconsistencyError] = []
-        for contract in application.contracts:
-            records = ApplicationGenerator.__get_records_all(application, contract)
-            for record in records:
-                ApplicationGenerator.__check_kids_inconsistency(contract, errors, record)
-                ApplicationGenerator.__check_state_inconsistency(contract, errors, record)
-            ApplicationGenerator.__check_week_inconsistency(contract, errors, records, application.weeks)
-        return errors
-
-    @staticmethod
-    def __get_records_all(application: ApplicationModel, contract):
-        records = RecordModel.filter_records_by_contract(application, contract)
-        records.extend(RecordModel.filter_records_by_contract(application, contract, state=RecordState.PLANNED))
-        records.extend(RecordModel.filter_records_by_contract(application, contract, state=RecordState.GENERATED))
-        records.extend(
-            RecordModel.filter_records_by_contract(application, contract, state=RecordState.GENERATION_IN_PROGRESS))
-        records.extend(
-            RecordModel.filter_records_by_contract(application, contract, state=RecordState.DELIVERY_PLANNED))
-        return records
-
-    @staticmethod
-    def __check_state_inconsistency(contract, errors, record):
-        if record.state != RecordState.DELIVERED:
-            errors.append(InconsistencyError(contract.school,
-                                             StateInconsistencyError(record)))
-
-    @staticmethod
-    def __check_kids_inconsistency(contract, errors, record):
-        expected = record.contract.get_kids_no(product_type=record.product_store.product.type,
-                                               date=record.date)
-        if record.delivered_kids_no is not None and record.delivered_kids_no != expected:
-            errors.append(InconsistencyError(contract.school,
-                                             KidsInconsistencyError(record, expected)))
-
-    @staticmethod
-    def __check_week_inconsistency(contract, errors, records, weeks):
-        for week in weeks:
-            if not any(filter(lambda r: r.week_id == week.id, records)):
-                errors.append(InconsistencyError(contract.school,
-                                                 WeekInconsistencyError(week)))
+    def check_record_consistency(application: ApplicationModel) -> List[InconsistencyError]:
+        from helpers.application_consistency import ApplicationConsistency
+        return ApplicationConsistency(application).errors()
 
     def prepare_data(self):
         ApplicationCommonData.add_application_no(self.data, self.application)
@@ -369,17 +334,21 @@ class ApplicationGenerator(DocumentGenerator):
     def __init__(self, application: ApplicationModel,
                  records_summary: List[RecordsSummaryGenerator],
                  statements: List[StatementGenerator], is_last: bool = False,
-                 _output_dir=None, _drive_tool=GoogleDriveCommands):
+                 _output_dir=None, _drive_tool=GoogleDriveCommands, application_records: ApplicationRecords = None):
         if not len(statements):
             raise ValueError("List with statements cannot be empty")
         self.application = application
         self.statements = statements
         self.records_summary = records_summary
         self.is_last = is_last
-        self.records = RecordModel.filter_records(application)
+        if application_records is None:
+            application_records = ApplicationRecords(application, states=[RecordState.DELIVERED])
+        self.records = application_records.in_state(RecordState.DELIVERED)
         self.product_dict = defaultdict(int)
         self.data = dict()
         fill_product_data(self.records, self.product_dict)
+        self.products = reference_cache.products_by_template_names([name for name in self.product_dict
+                                                                    if "all" not in name])
         self.validate_statements_with_application()
         _template_doc = config_parser.get('DocTemplates', 'application').format(
             template_postfix(application.type))
@@ -391,6 +360,7 @@ class ApplicationGenerator(DocumentGenerator):
                                    template_document=_get_template(application.program, _template_doc),
                                    output_directory=_output_dir,
                                    output_name=_output_name,
+                                   program_id=application.program_id,
                                    drive_tool=_drive_tool)
         self.change_mime_type(DOCX_MIME_TYPE)
 
@@ -408,21 +378,19 @@ class ApplicationGenerator(DocumentGenerator):
         return financial_round(price)
 
     def __fill_product_details(self):
-        with create_app().app_context():
-            for name, amount in self.product_dict.items():
-                if "all" not in name:
-                    product = ProductModel.find_by(template_name=name)
-                    all_name = product.type.template_name()
-                    self.__fill_product(all_name, name, amount)
-                    self.__fill_product(all_name, name, amount * self.__product_price(product), postfix="wn")
-                    vat = financial_round(self.data[f"{name}wn"]) * financial_round(product.vat / 100)
-                    self.__fill_product(all_name, name, vat, postfix="vat")
-                    wb = financial_round(self.data[f"{name}wn"]) + financial_round(self.data[f"{name}vat"])
-                    self.__fill_product(all_name, name, wb, postfix="wb")
-            for name, amount in self.data.items():
-                if "wn" in name or "vat" in name or "wb" in name:
-                    self.data[name] = f"{amount:.2f}"
-
+        for name, amount in self.product_dict.items():
+            if "all" not in name:
+                product = self.products[name]
+                all_name = product.type.template_name()
+                self.__fill_product(all_name, name, amount)
+                self.__fill_product(all_name, name, amount * self.__product_price(product), postfix="wn")
+                vat = financial_round(self.data[f"{name}wn"]) * financial_round(product.vat / 100)
+                self.__fill_product(all_name, name, vat, postfix="vat")
+                wb = financial_round(self.data[f"{name}wn"]) + financial_round(self.data[f"{name}vat"])
+                self.__fill_product(all_name, name, wb, postfix="wb")
+        for name, amount in self.data.items():
+            if "wn" in name or "vat" in name or "wb" in name:
+                self.data[name] = f"{amount:.2f}"
 
     def __fill_product(self, all_name, name, amount, postfix=""):
         all_key = f"{all_name}{postfix}"
@@ -468,9 +436,10 @@ def application_factory(application: ApplicationModel, date, start_week, is_last
                         _output_dir=None, _drive_tool=GoogleDriveCommands):
     records_summary = []
     statements = []
+    application_records = ApplicationRecords(application, states=[RecordState.DELIVERED])
     try:
         for contract in application.contracts:
-            records = RecordModel.filter_records_by_contract(application, contract)
+            records = application_records.by_contract(contract.id)
             records_summary.append(
                 RecordsSummaryGenerator(application, records, date, _output_dir=_output_dir, _drive_tool=_drive_tool))
             statements.append(statement_factory(application, records, date, start_week, is_last=is_last,
@@ -478,4 +447,5 @@ def application_factory(application: ApplicationModel, date, start_week, is_last
                                                 _drive_tool=_drive_tool))
     except ValueError as e:
         raise ValueError(f"Error while creating application for {application.get_str_name()}: {e}")
-    return ApplicationGenerator(application, records_summary, statements, is_last, _output_dir, _drive_tool)
+    return ApplicationGenerator(application, records_summary, statements, is_last, _output_dir, _drive_tool,
+                                application_records=application_records)
@@ -43,7 +43,8 @@ class ContractGenerator(DocumentGenerator):
                                    output_name=get_output_name('contract',
                                                                self.contract.school.nick.strip(),
                                                                self.contract.contract_no,
-                                                               self.contract.contract_year))
+                                                               self.contract.contract_year),
+                                   program_id=self.contract.program_id)
 
     def __get_template(self, doc_template):
         return path.join(config_parser.get('DocTemplates', 'directory'),
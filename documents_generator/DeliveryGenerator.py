@@ -120,20 +120,23 @@ class DeliveryGenerator(SummaryRecords, DocumentGenerator):
                                    output_directory=get_output_dir(self.records[0], self.delivery_date),
                                    output_name=DeliveryGenerator.get_delivery_output_name('delivery',
                                                                                           self.delivery_date,
-                                                                                          self.driver))
+                                                                                          self.driver),
+                                   program_id=self.records[0].contract.program_id)
 
 
 class DeliveryRecordsGenerator(DocumentGenerator):
     def prepare_data(self):
-        self.merge_pages([RecordGenerator.prepare_data_to_fill(record) for record in self.records])
+        self.merge_pages(self.pages)
 
     def __init__(self, records: list[RecordModel], date, driver, **_):
         self.records: List[RecordModel] = records
+        self.pages = [RecordGenerator.prepare_data_to_fill(record) for record in self.records]
         output_directory = get_output_dir(self.records[0], date)
         DocumentGenerator.__init__(self,
                                    template_document=RecordGenerator.get_template(),
                                    output_directory=output_directory,
-                                   output_name=DeliveryGenerator.get_delivery_output_name('record_all', date, driver))
+                                   output_name=DeliveryGenerator.get_delivery_output_name('record_all', date, driver),
+                                   program_id=self.records[0].contract.program_id)
 
 
 def mf_product(_day, _type):
@@ -177,4 +180,5 @@ class SummaryGenerator(SummaryRecords, DocumentGenerator):
         DocumentGenerator.__init__(self,
                                    template_document=config_parser.get('DocTemplates', 'week_summary'),
                                    output_directory=get_main_output_dir(self.records[0]),
-                                   output_name=get_output_name('week_summary', self.week.week_no))
+                                   output_name=get_output_name('week_summary', self.week.week_no),
+                                   program_id=self.records[0].contract.program_id)
@@ -1,16 +1,18 @@
 from helpers.logger import app_logger
-from mailmerge import MailMerge
 from abc import ABC, abstractmethod
 from shutil import copy
 from os import path, makedirs, remove, rename
 from typing import List, Dict
 from helpers.google_drive import GoogleDriveCommands
 from helpers.common import PDF_MIME_TYPE, FileData, DOCX_EXT, PDF_EXT, DOC_GOOGLE_MIME_TYPE
+from helpers.template_registry import template_registry
+from helpers.document_renderer import RenderJob, render
 from models.directory_tree import DirectoryTreeModel
 
 
 class DocumentGenerator(ABC):
-    def __init__(self, *, template_document, output_directory, output_name, drive_tool=GoogleDriveCommands):
+    def __init__(self, *, template_document, output_directory, output_name, program_id,
+                 drive_tool=GoogleDriveCommands):
         self.drive_tool = drive_tool
         if not path.exists(template_document):
             app_logger.error("[%s] template document: %s does not exists", __class__.__name__, template_document)
@@ -22,9 +24,11 @@ class DocumentGenerator(ABC):
         self.template_document = template_document
 
         self.file_path = path.join(self.output_directory, self.output_doc_name)
-        self.remote_parent: DirectoryTreeModel = drive_tool.prepare_remote_parent(self.output_directory, self.file_path)
-        self.__document = self.__start_doc_gen()
-        self._fields_to_merge = self.__document.get_merge_fields()
+        self.remote_parent: DirectoryTreeModel = drive_tool.prepare_remote_parent(self.output_directory,
+                                                                                  self.file_path, program_id)
+        template = self.__start_doc_gen()
+        self.__operations = []
+        self._fields_to_merge = set(template.merge_fields)
         self._given_keys = set()
 
         super(DocumentGenerator, self).__init__()
@@ -55,26 +59,45 @@ class DocumentGenerator(ABC):
 
     def merge(self, **fields):
         self.__prepare_data(fields)
-        self.__document.merge(**fields)
+        self.__operations.append(("merge", (), fields))
 
     def merge_rows(self, anchor, fields):
         for field in fields:
             self.__prepare_data(field)
-        self.__document.merge_rows(anchor, fields)
+        self.__operations.append(("merge_rows", (anchor, [dict(field) for field in fields]), {}))
 
     def merge_pages(self, fields: List):
         for field in fields:
             self.__prepare_data(field)
-        self.__document.merge_pages(fields)
+        self.__operations.append(("merge_pages", ([dict(field) for field in fields],), {}))
 
-    def generate(self):
+    def render_job(self, in_memory=False) -> RenderJob:
         self.prepare_data()
         try:
-            self.__end_doc_gen(self.file_path)
-            return self
+            self.__check_for_missing_or_extra_keys()
+        except ValueError as e:
+            app_logger.debug(e)
+        return RenderJob(template_document=self.template_document, operations=tuple(self.__operations),
+                         output_file=self.file_path, in_memory=in_memory)
+
+    def generate(self, in_memory=False):
+        job = self.render_job(in_memory)
+        try:
+            return self.complete(job, render(job))
         except ValueError as e:
             app_logger.error(f"Problem occurred during generating document {self.file_path}. [{e}]")
 
+    def complete(self, job: RenderJob, content=None):
+        generated_file = job.output_file
+        if not job.in_memory and not path.exists(generated_file):
+            raise ValueError(f"Document not generated: {generated_file}")
+        self.generated_document = FileData(_name=generated_file, _mime_type=self.mime_type,
+                                           _parent_id=self.remote_parent.google_id, _content=content)
+        self.generated_documents.append(self.generated_document)
+        app_logger.debug("[%s] Created new output file: %s in_memory: %s", __class__.__name__, generated_file,
+                         job.in_memory)
+        return self
+
     @staticmethod
     def copy_to_path(source, dest):
         old_file_name = path.basename(source)
@@ -96,20 +119,7 @@ class DocumentGenerator(ABC):
 
     def __start_doc_gen(self):
         DocumentGenerator.create_directory(self.output_directory)
-        return MailMerge(self.template_document)
-
-    def __end_doc_gen(self, generated_file):
-        try:
-            self.__check_for_missing_or_extra_keys()
-        except ValueError as e:
-            app_logger.debug(e)
-        self.__document.write(generated_file)
-        if not path.exists(generated_file):
-            ValueError(f"Document not generated: {generated_file}")
-        self.generated_document = FileData(_name=generated_file, _mime_type=self.mime_type,
-                                           _parent_id=self.remote_parent.google_id)
-        self.generated_documents.append(self.generated_document)
-        app_logger.debug("[%s] Created new output file: %s", __class__.__name__, generated_file, )
+        return template_registry.get(self.template_document)
 
     @abstractmethod
     def prepare_data(self):
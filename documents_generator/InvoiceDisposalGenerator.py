@@ -25,13 +25,9 @@ def get_app_title(applications: Set[ApplicationModel], program):
 
 
 def prepare_product_invoice_map(invoice_disposals: List[InvoiceDisposalModel]):
-    output: Dict[ProductModel, List[InvoiceDisposalModel]] = dict()
-    tmp = ProductModel.all()
-    for product in tmp:
-        output[product] = []
-        for _id in invoice_disposals:
-            if _id.invoice_product.product_store.product == product:
-                output[product].append(_id)
+    output: Dict[ProductModel, List[InvoiceDisposalModel]] = {product: [] for product in ProductModel.all()}
+    for _id in invoice_disposals:
+        output[_id.invoice_product.product_store.product].append(_id)
     return output
 
 
@@ -70,6 +66,7 @@ class InvoiceDisposalGenerator(DocumentGenerator):
                                    template_document=config_parser.get('DocTemplates', 'invoice_disposal'),
                                    output_directory=_output_dir,
                                    output_name=_output_name,
+                                   program_id=self.program.id,
                                    drive_tool=_drive_tool)
 
     def __invoice_info(self, product: ProductModel, invoice_disposals: List[InvoiceDisposalModel]):
@@ -6,7 +6,6 @@ from helpers.config_parser import config_parser
 from helpers.date_converter import DateConverter
 from models.product import ProductTypeModel
 from models.record import RecordModel
-from app import create_app
 
 
 def get_record_title_mapping(product_type: ProductTypeModel):
@@ -24,10 +23,11 @@ class RecordGenerator(DocumentGenerator):
                                record.product_store.product.type.name[:3])
 
     def prepare_data(self):
-        self.merge(**RecordGenerator.prepare_data_to_fill(self.record))
+        self.merge(**self.data_to_fill)
 
     def __init__(self, record: RecordModel):
         self.record = record
+        self.data_to_fill = RecordGenerator.prepare_data_to_fill(self.record)
         program_dir = self.record.contract.program.get_main_dir()
 
         DocumentGenerator.__init__(self,
@@ -36,24 +36,27 @@ class RecordGenerator(DocumentGenerator):
                                                               config_parser.get('Directories', 'school'),
                                                               self.record.contract.school.nick,
                                                               config_parser.get('Directories', 'record')),
-                                   output_name=self.get_record_output_name(self.record))
+                                   output_name=self.get_record_output_name(self.record),
+                                   program_id=self.record.contract.program_id)
 
     @staticmethod
     def prepare_data_to_fill(record):
-        with create_app().app_context():
-            return {
-                'city': record.contract.school.city,
-                'current_date': DateConverter.convert_date_to_string(record.date),
-                'name': record.contract.school.name,
-                'address': record.contract.school.address,
-                'nip': record.contract.school.nip,
-                'regon': record.contract.school.regon,
-                'email': record.contract.school.email,
-                'kids_no': record.delivered_kids_no,
-                'product_name': record.product_store.product.name,
-                'record_number': record.get_record_no(),
-                'record_title': get_record_title_mapping(record.product_store.product.type)
-            }
+        """Plain merge data of record, has to be called while record is bound to session"""
+        school = record.contract.school
+        product = record.product_store.product
+        return {
+            'city': school.city,
+            'current_date': DateConverter.convert_date_to_string(record.date),
+            'name': school.name,
+            'address': school.address,
+            'nip': school.nip,
+            'regon': school.regon,
+            'email': school.email,
+            'kids_no': record.delivered_kids_no,
+            'product_name': product.name,
+            'record_number': record.get_record_no(),
+            'record_title': get_record_title_mapping(product.type)
+        }
 
     @staticmethod
     def get_template():
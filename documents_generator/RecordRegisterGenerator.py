@@ -5,11 +5,11 @@ from helpers.date_converter import DateConverter
 from helpers.google_drive import GoogleDriveCommands
 from models.application import ApplicationModel
 from models.product import ProductTypeModel
+from models.reference_cache import reference_cache
 from models.program import ProgramModel
 from helpers.config_parser import config_parser
 from helpers.common import get_output_name
 from models.record import RecordModel, RecordState
-from app import create_app
 
 
 class RecordRegisterGenerator(DocumentGenerator):
@@ -24,19 +24,21 @@ class RecordRegisterGenerator(DocumentGenerator):
         return data
 
     def prepare_data(self):
-        with create_app().app_context():
-            rows = []
-            sorted_records = sorted(self.record_by_school_and_product.items())
-            for contract_component, records in sorted_records:
-                _, component = contract_component
-                for record in records:
-                    rows.append(self.__prepare_record_data(record, component))
-            self.merge_rows('no', rows)
-            self.merge(
-                date=self.date,
-                semester_no=self.program.get_current_semester(),
-                school_year=self.program.school_year
-            )
+        self.merge_rows('no', self.rows)
+        self.merge(
+            date=self.date,
+            semester_no=self.program.get_current_semester(),
+            school_year=self.program.school_year
+        )
+
+    def __prepare_rows(self):
+        rows = []
+        sorted_records = sorted(self.record_by_school_and_product.items())
+        for contract_component, records in sorted_records:
+            _, component = contract_component
+            for record in records:
+                rows.append(self.__prepare_record_data(record, component))
+        return rows
 
     def __init__(self, program: ProgramModel, _output_dir=None, _drive_tool=GoogleDriveCommands):
         self.program = program
@@ -46,12 +48,13 @@ class RecordRegisterGenerator(DocumentGenerator):
         self.record_by_school_and_product: dict[tuple[int, str], list[RecordModel]] = {}
 
         for record in records:
-            product_type = ProductTypeModel.find_by_id(record.product_type_id)
+            product_type = reference_cache.product_type(record.product_type_id)
             key = (record.contract_id, ProductTypeModel.DAIRY_TYPE) if product_type.is_dairy() else (record.contract_id, f"{ProductTypeModel.VEGETABLE_TYPE }-{ProductTypeModel.FRUIT_TYPE}")
             if key not in self.record_by_school_and_product:
                 self.record_by_school_and_product[key] = list()
             if record.state in (RecordState.GENERATED, RecordState.DELIVERED):
                 self.record_by_school_and_product[key].append(record)
+        self.rows = self.__prepare_rows()
 
         if _output_dir is None:
             _output_dir = self.program.get_main_dir()
@@ -60,4 +63,5 @@ class RecordRegisterGenerator(DocumentGenerator):
                                    template_document=config_parser.get('DocTemplates', 'record_register'),
                                    output_directory=_output_dir,
                                    output_name=get_output_name('record_register', self.date),
+                                   program_id=self.program.id,
                                    drive_tool=_drive_tool)
\ No newline at end of file
@@ -1,8 +1,9 @@
 from datetime import datetime
+from io import BytesIO
 from documents_generator.DocumentGenerator import DocumentGenerator
 from helpers.config_parser import config_parser
 from helpers.date_converter import DateConverter
-from helpers.common import get_output_name
+from helpers.common import get_output_name, FileData
 from models.contract import ContractModel, AnnexModel
 from models.program import ProgramModel
 from docx.enum.table import WD_CELL_VERTICAL_ALIGNMENT, WD_TABLE_ALIGNMENT
@@ -29,7 +30,8 @@ class RegisterGenerator(DocumentGenerator):
         DocumentGenerator.__init__(self,
                                    template_document=config_parser.get('DocTemplates', 'register'),
                                    output_directory=self.program.get_main_dir(),
-                                   output_name=get_output_name('register', self.date))
+                                   output_name=get_output_name('register', self.date),
+                                   program_id=self.program.id)
 
     def __prepare_school_data(self):
         for contract in sorted(self.contracts, key=lambda c: int(c.contract_no)):
@@ -75,13 +77,16 @@ class RegisterGenerator(DocumentGenerator):
         record_dict['kids_fruitveg'] = annex.fruitVeg_products
         return record_dict
 
-    def generate(self) -> None:
-        DocumentGenerator.generate(self)
-        generated_docx = self.generated_documents[0].name
-        RegisterGenerator.__merge_cells(generated_docx)
+    def complete(self, job, content=None):
+        DocumentGenerator.complete(self, job, content)
+        RegisterGenerator.__merge_cells(self.generated_document)
+        return self
 
     @staticmethod
-    def __merge_cells(file_with_table_to_merge):
+    def __merge_cells(generated_docx: FileData):
+        file_with_table_to_merge = generated_docx.name
+        if generated_docx.content is not None:
+            file_with_table_to_merge = BytesIO(generated_docx.content)
         document = Document(file_with_table_to_merge)
         for table in document.tables:
             for col in range(0, len(table.columns)):
@@ -93,4 +98,9 @@ class RegisterGenerator(DocumentGenerator):
         table.alignment = WD_TABLE_ALIGNMENT.CENTER
         table.alignment = WD_CELL_VERTICAL_ALIGNMENT.CENTER
         table.allow_autofit = True
-        document.save(file_with_table_to_merge)
+        if generated_docx.content is not None:
+            output = BytesIO()
+            document.save(output)
+            generated_docx.content = output.getvalue()
+        else:
+            document.save(file_with_table_to_merge)
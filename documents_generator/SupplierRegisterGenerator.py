@@ -37,5 +37,6 @@ class SuppliersGenerator(DocumentGenerator):
         DocumentGenerator.__init__(self,
                                    template_document=doc_template,
                                    output_directory=path.join(program.get_main_dir(), suppliers_dir),
-                                   output_name=get_output_name('suppliers_registry', self.date))
+                                   output_name=get_output_name('suppliers_registry', self.date),
+                                   program_id=program.id)
 
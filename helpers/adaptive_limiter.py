@@ -0,0 +1,160 @@
+import asyncio
+import random
+from collections import deque
+from time import monotonic
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import ClientError
+from aiogoogle.excs import HTTPError
+
+from helpers.config_parser import config_parser
+from helpers.logger import app_logger
+
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def get_status_code(error: HTTPError) -> Optional[int]:
+    return error.res.status_code if error.res is not None else None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    if not isinstance(error, HTTPError):
+        return False
+    status_code = get_status_code(error)
+    if status_code == 429:
+        return True
+    if status_code != 403 or not isinstance(error.res.json, dict):
+        return False
+    reasons = {item.get("reason") for item in error.res.json.get("error", {}).get("errors", [])}
+    return bool(reasons & RATE_LIMIT_REASONS)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    if is_rate_limit_error(error):
+        return True
+    if isinstance(error, HTTPError):
+        status_code = get_status_code(error)
+        return status_code is not None and status_code >= 500
+    return isinstance(error, (ClientError, asyncio.TimeoutError))
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for remote calls.
+    Limit grows by one per 'limit' successful calls while error rate and latency in the sliding window stay low,
+    and is cut by decrease_factor on throttling or too many errors. Retryable errors are retried with
+    exponential backoff and full jitter. Limit is kept between jobs, waiting is bound to the running event loop.
+    """
+
+    def __init__(self, *, initial=10, minimum=1, maximum=50, window=50, error_threshold=0.1, latency_threshold=10.0,
+                 decrease_factor=0.5, max_retries=5, base_delay=1.0, max_delay=32.0, name="limiter"):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.error_threshold = error_threshold
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.__window = deque(maxlen=window)
+        self.__last_decrease = float("-inf")
+        self.__condition: Optional[asyncio.Condition] = None
+        self.__loop = None
+
+    def __get_condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            self.__loop = loop
+            self.__condition = asyncio.Condition()
+            self.in_flight = 0
+        return self.__condition
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    async def acquire(self):
+        condition = self.__get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+
+    async def release(self):
+        condition = self.__get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def __error_rate(self):
+        if not self.__window:
+            return 0.0
+        return sum(1 for (_, failed) in self.__window if failed) / len(self.__window)
+
+    def __average_latency(self):
+        latencies = [latency for (latency, failed) in self.__window if not failed]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    def __decrease(self, reason, started):
+        # One decrease per congestion event: calls started before the previous cut do not cut again
+        if started < self.__last_decrease:
+            return
+        self.__last_decrease = monotonic()
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        app_logger.info(f"[{self.name}] Concurrency decreased to {self.current_limit} ({reason})")
+
+    def record(self, started: float, error: Optional[Exception] = None):
+        self.__window.append((monotonic() - started, error is not None))
+        if error is not None and is_rate_limit_error(error):
+            self.throttled += 1
+            self.__decrease("rate limit", started)
+        elif self.__error_rate() > self.error_threshold:
+            self.__decrease(f"error rate {self.__error_rate():.2f}", started)
+        elif error is None and self.__average_latency() > self.latency_threshold:
+            self.__decrease(f"latency {self.__average_latency():.2f}s", started)
+        elif error is None:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def backoff(self, attempt) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, request: Callable[[], Awaitable]):
+        """Calls request() within the limit, request has to create a new awaitable for every retry"""
+        attempt = 0
+        while True:
+            await self.acquire()
+            started = monotonic()
+            try:
+                self.requests += 1
+                result = await request()
+                self.record(started)
+                return result
+            except Exception as e:
+                self.record(started, e)
+                if not is_retryable_error(e) or attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+            finally:
+                await self.release()
+            delay = self.backoff(attempt)
+            attempt += 1
+            self.retries += 1
+            app_logger.warning(f"[{self.name}] Retry {attempt}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {"limit": self.current_limit, "in_flight": self.in_flight, "requests": self.requests,
+                "retries": self.retries, "throttled": self.throttled, "failures": self.failures}
+
+
+drive_limiter = AdaptiveLimiter(
+    initial=config_parser.getint("GoogleDriveConfig", "initial_concurrency", fallback=10),
+    maximum=config_parser.getint("GoogleDriveConfig", "max_concurrency", fallback=50),
+    max_retries=config_parser.getint("GoogleDriveConfig", "max_retries", fallback=5),
+    name="GoogleDrive")
@@ -0,0 +1,156 @@
+import json
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from redis import RedisError
+from sqlalchemy import and_, case, exists, func, or_, select
+from sqlalchemy.orm import aliased
+
+from documents_generator.ApplicationGenerator import InconsistencyError, KidsInconsistencyError, \
+    StateInconsistencyError, WeekInconsistencyError
+from helpers.config_parser import config_parser
+from helpers.db import db
+from helpers.logger import app_logger
+from models.application import ApplicationModel, application_contract, application_week
+from models.contract import ContractModel, AnnexModel, TimedAnnexModel
+from models.product import ProductStoreModel, ProductModel
+from models.program import ProgramModel
+from models.record import RecordModel, RecordState, ApplicationRecords
+from models.reference_cache import reference_cache
+
+APPLICATION_VALIDATION = "applicationValidation:{}:{}"
+APPLICATION_DATA_VERSION = "applicationDataVersion"
+APPLICATION_VALIDATION_TTL = config_parser.getint("Generation", "validation_cache_ttl", fallback=24 * 60 * 60)
+
+
+class InconsistentRecord(namedtuple("InconsistentRecord",
+                                    ["id", "date", "state", "delivered_kids_no", "product_name", "expected"])):
+    def __str__(self):
+        return f"{self.product_name}  {self.delivered_kids_no}"
+
+
+class ApplicationConsistency:
+    """
+    Consistency check of application records done in database: expected kids number of every record
+    (latest annex valid on record date, then contract), records not DELIVERED and weeks without records
+    are found with two queries, only inconsistent rows are returned.
+    """
+
+    def __init__(self, application: ApplicationModel):
+        self.application = application
+
+    def __expected_kids_no(self):
+        product_types = reference_cache.product_types()
+        dairy = [product_type.id for product_type in product_types if product_type.is_dairy()]
+        fruit_veg = [product_type.id for product_type in product_types if product_type.is_fruit_veg()]
+
+        def by_type(dairy_products, fruit_veg_products):
+            return case((RecordModel.product_type_id.in_(dairy), dairy_products),
+                        (RecordModel.product_type_id.in_(fruit_veg), fruit_veg_products))
+
+        annex_end = func.coalesce(TimedAnnexModel.validity_date_end, ProgramModel.end_date)
+        valid_annex = select(AnnexModel.id) \
+            .outerjoin(TimedAnnexModel, TimedAnnexModel.annex_id == AnnexModel.id) \
+            .where(AnnexModel.contract_id == RecordModel.contract_id, AnnexModel.validity_date <= RecordModel.date,
+                   or_(annex_end.is_(None), RecordModel.date <= annex_end)) \
+            .order_by(AnnexModel.validity_date.desc(), AnnexModel.id.desc()).limit(1) \
+            .correlate(RecordModel, ProgramModel).scalar_subquery()
+        has_annex = exists().where(AnnexModel.contract_id == ContractModel.id).correlate(ContractModel)
+        in_contract = and_(ContractModel.validity_date <= RecordModel.date,
+                           or_(ProgramModel.end_date.is_(None), RecordModel.date <= ProgramModel.end_date))
+        annex = aliased(AnnexModel)
+        expected = case((annex.id.isnot(None), by_type(annex.dairy_products, annex.fruitVeg_products)),
+                        (or_(~has_annex, in_contract),
+                         by_type(ContractModel.dairy_products, ContractModel.fruitVeg_products)))
+        return annex, valid_annex, expected
+
+    def inconsistent_records(self) -> Dict[int, List[InconsistentRecord]]:
+        annex, valid_annex, expected = self.__expected_kids_no()
+        rows = db.session.query(RecordModel.contract_id, RecordModel.id, RecordModel.date, RecordModel.state,
+                                RecordModel.delivered_kids_no, ProductModel.name, expected) \
+            .join(ContractModel, RecordModel.contract_id == ContractModel.id) \
+            .join(ProgramModel, ContractModel.program_id == ProgramModel.id) \
+            .join(ProductStoreModel, RecordModel.product_store_id == ProductStoreModel.id) \
+            .join(ProductModel, ProductStoreModel.product_id == ProductModel.id) \
+            .outerjoin(annex, annex.id == valid_annex) \
+            .filter(RecordModel.state.in_(ApplicationRecords.STATES),
+                    *RecordModel.application_criteria(self.application),
+                    or_(RecordModel.state != RecordState.DELIVERED, expected.is_(None),
+                        and_(RecordModel.delivered_kids_no.isnot(None), RecordModel.delivered_kids_no != expected)))
+        records: Dict[int, List[InconsistentRecord]] = dict()
+        for (contract_id, *values) in rows:
+            records.setdefault(contract_id, []).append(InconsistentRecord(*values))
+        for contract_records in records.values():
+            contract_records.sort(key=lambda r: (ApplicationRecords.STATES.index(r.state), r.date, r.id))
+        return records
+
+    def missing_weeks(self) -> Dict[int, List[int]]:
+        covered = exists().where(RecordModel.contract_id == application_contract.c.contract_id,
+                                 RecordModel.week_id == application_week.c.week_id,
+                                 RecordModel.state.in_(ApplicationRecords.STATES),
+                                 *RecordModel.application_criteria(self.application))
+        missing: Dict[int, List[int]] = dict()
+        for (contract_id, week_id) in db.session.execute(
+                select(application_contract.c.contract_id, application_week.c.week_id)
+                .join_from(application_contract, application_week,
+                           application_contract.c.application_id == application_week.c.application_id)
+                .where(application_contract.c.application_id == self.application.id, ~covered)):
+            missing.setdefault(contract_id, []).append(week_id)
+        return missing
+
+    def errors(self) -> List[InconsistencyError]:
+        """Same errors in the same order as ApplicationGenerator.check_record_consistency"""
+        records = self.inconsistent_records()
+        missing = self.missing_weeks()
+        errors: List[InconsistencyError] = []
+        for contract in self.application.contracts:
+            for record in records.get(contract.id, []):
+                if record.expected is None:
+                    raise ValueError(f"Failed to find kids no for {record.date}: {contract}")
+                if record.delivered_kids_no is not None and record.delivered_kids_no != record.expected:
+                    errors.append(InconsistencyError(contract.school, KidsInconsistencyError(record,
+                                                                                             record.expected)))
+                if record.state != RecordState.DELIVERED:
+                    errors.append(InconsistencyError(contract.school, StateInconsistencyError(record)))
+            contract_missing = missing.get(contract.id, [])
+            for week in self.application.weeks:
+                if week.id in contract_missing:
+                    errors.append(InconsistencyError(contract.school, WeekInconsistencyError(week)))
+        return errors
+
+    def json(self) -> dict:
+        return {"application": str(self.application),
+                "errors": [{"school": error.school.nick, "type": error.message.__class__.__name__,
+                            "message": str(error.message)} for error in self.errors()]}
+
+
+def invalidate_validations(redis_connection=None):
+    """Called after commit which changed any data validation result depends on"""
+    if redis_connection is None:
+        from helpers.redis_commands import conn as redis_connection
+    try:
+        redis_connection.incr(APPLICATION_DATA_VERSION)
+    except RedisError as e:
+        app_logger.error(f"Failed to invalidate cached validations: {e}")
+
+
+def validate_application(application: ApplicationModel, redis_connection=None) -> dict:
+    """Validation result of application, reused from Redis until any data it depends on is committed"""
+    if redis_connection is None:
+        from helpers.redis_commands import conn as redis_connection
+    consistency = ApplicationConsistency(application)
+    try:
+        key = APPLICATION_VALIDATION.format(application.id,
+                                            int(redis_connection.get(APPLICATION_DATA_VERSION) or 0))
+        cached: Optional[bytes] = redis_connection.get(key)
+        if cached:
+            return json.loads(cached)
+    except RedisError as e:
+        app_logger.warning(f"Validation of {application} not read from cache: {e}")
+        return consistency.json()
+    result = consistency.json()
+    try:
+        redis_connection.set(key, json.dumps(result), ex=APPLICATION_VALIDATION_TTL)
+    except RedisError as e:
+        app_logger.warning(f"Validation of {application} not saved to cache: {e}")
+    return result
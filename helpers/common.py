@@ -12,6 +12,7 @@ GOOGLE_DRIVE_ID = config_parser.get("GoogleDriveConfig", "google_drive_id")
 DOCX_EXT = ".docx"
 PDF_EXT = ".pdf"
 TMP_DIR = '/app/tmp/'
+IN_MEMORY_DOCUMENTS = config_parser.getboolean("Generation", "in_memory", fallback=False)
 
 
 def get_mime_type(mime_type):
@@ -20,12 +21,13 @@ def get_mime_type(mime_type):
 
 class FileData:
     def __init__(self, _name, _mime_type=get_mime_type(DOC_GOOGLE_MIME_TYPE), _id=None, _parent_id=GOOGLE_DRIVE_ID,
-                 _webViewLink=None):
+                 _webViewLink=None, _content=None):
         self.name = _name
         self.mime_type = _mime_type
         self.id = _id
         self.web_view_link = _webViewLink
         self.parent_id = _parent_id
+        self.content = _content
         super().__init__()
 
     def __str__(self):
@@ -1,23 +1,58 @@
 # helpers/db_context.py
 from contextlib import asynccontextmanager, contextmanager
 from functools import wraps
+from os import register_at_fork
 from app import create_app
+from helpers.config_parser import config_parser
 from helpers.db import db
 from helpers.logger import app_logger
 
+_app = None
+
+
+def get_engine_options():
+    return {
+        "pool_size": config_parser.getint("Worker", "db_pool_size", fallback=5),
+        "max_overflow": config_parser.getint("Worker", "db_max_overflow", fallback=5),
+        "pool_recycle": config_parser.getint("Worker", "db_pool_recycle", fallback=30 * 60),
+        "pool_pre_ping": True,
+    }
+
+
+def get_app():
+    """
+    Process wide application used by background jobs, built once per worker process together with
+    its connection pool. Jobs only push a new app context and get their own session.
+    """
+    global _app
+    if _app is None:
+        app = create_app()
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options()
+        _app = app
+        app_logger.info(f"Worker application created with engine options {app.config['SQLALCHEMY_ENGINE_OPTIONS']}")
+    return _app
+
+
+def _drop_inherited_connections():
+    """Forked work-horse must not reuse connections of the parent process, they are left open for the parent"""
+    if _app is not None:
+        with _app.app_context():
+            db.engine.dispose(close=False)
+
+
+register_at_fork(after_in_child=_drop_inherited_connections)
+
 
 @asynccontextmanager
 async def managed_db_context():
     """
     Context manager for database session management in async tasks.
     Handles:
-    - Creating app context
+    - Pushing context of the process wide app
     - Committing/rolling back transactions
-    - Closing sessions
-    - Disposing connections to prevent pool exhaustion
+    - Closing sessions and returning connections to the pool
     """
-    app = create_app()
-    with app.app_context():
+    with get_app().app_context():
         try:
             yield db
         except Exception as e:
@@ -25,17 +60,14 @@ async def managed_db_context():
             db.session.rollback()
             raise
         finally:
-            # Cleanup in order
             db.session.close()
             db.session.remove()
-            db.engine.dispose()
 
 
 @contextmanager
 def managed_db_context_sync():
     """Context manager for SYNC database session management (for callbacks)"""
-    app = create_app()
-    with app.app_context():
+    with get_app().app_context():
         try:
             yield db
         except Exception as e:
@@ -45,7 +77,6 @@ def managed_db_context_sync():
         finally:
             db.session.close()
             db.session.remove()
-            db.engine.dispose()
 
 
 def async_with_db_context(func):
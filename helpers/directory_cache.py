@@ -0,0 +1,106 @@
+import json
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from redis import RedisError
+
+from helpers.db import db
+from helpers.logger import app_logger
+from models.directory_tree import DirectoryTreeModel, get_directory_path
+
+DIRECTORY_TREE_VERSION = "directoryTreeVersion:{}"
+DIRECTORY_TREE_DICT = "directoryTree:{}:{}"
+DIRECTORY_TREE_TTL = 24 * 60 * 60
+INVALIDATED_PROGRAMS = "invalidated_directory_programs"
+
+
+class DirectoryCache:
+    """
+    Path -> directory cache of the remote directory tree, kept per program.
+    Whole program tree is loaded with one query and shared between processes through Redis,
+    every process checks the program version key and reloads the tree after a folder was created or removed.
+    """
+
+    def __init__(self, redis_connection=None):
+        self.__redis_connection = redis_connection
+        self.__trees: Dict[int, Tuple[int, Dict[str, dict]]] = dict()
+
+    @property
+    def redis_connection(self):
+        if self.__redis_connection is None:
+            from helpers.redis_commands import conn
+            self.__redis_connection = conn
+        return self.__redis_connection
+
+    @staticmethod
+    def load_program_tree(program_id) -> Dict[str, dict]:
+        return {row.path: {"id": row.id, "name": row.name, "google_id": row.google_id, "program_id": row.program_id,
+                           "parent_id": row.parent_id}
+                for row in DirectoryTreeModel.query.filter_by(program_id=program_id).all()}
+
+    def __shared_tree(self, program_id) -> Dict[str, dict]:
+        version = int(self.redis_connection.get(DIRECTORY_TREE_VERSION.format(program_id)) or 0)
+        cached = self.__trees.get(program_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        key = DIRECTORY_TREE_DICT.format(program_id, version)
+        tree = {name.decode(): json.loads(value) for (name, value) in self.redis_connection.hgetall(key).items()}
+        if not tree:
+            tree = DirectoryCache.load_program_tree(program_id)
+            if tree:
+                with self.redis_connection.pipeline() as pipe:
+                    pipe.hset(key, mapping={name: json.dumps(value) for (name, value) in tree.items()})
+                    pipe.expire(key, DIRECTORY_TREE_TTL)
+                    pipe.execute()
+        self.__trees[program_id] = (version, tree)
+        return tree
+
+    def __tree(self, program_id) -> Dict[str, dict]:
+        try:
+            return self.__shared_tree(program_id)
+        except RedisError as e:
+            app_logger.warning(f"[{self.__class__.__name__}] Redis not available, loading tree from database: {e}")
+            self.__trees.pop(program_id, None)
+            return DirectoryCache.load_program_tree(program_id)
+
+    def resolve(self, path_to_file, program_id, contains_file_name=False) -> Optional[DirectoryTreeModel]:
+        """Returns transient DirectoryTreeModel for the path in program tree or None if it is not in the tree yet"""
+        full_path = get_directory_path(path_to_file, contains_file_name)
+        row = self.__tree(program_id).get(full_path)
+        if not row:
+            return None
+        directory = DirectoryTreeModel(name=row["name"], google_id=row["google_id"], program_id=row["program_id"],
+                                       parent_id=row["parent_id"], path=full_path)
+        directory.id = row["id"]
+        return directory
+
+    def invalidate(self, program_id):
+        self.__trees.pop(program_id, None)
+        try:
+            self.redis_connection.incr(DIRECTORY_TREE_VERSION.format(program_id))
+        except RedisError as e:
+            app_logger.error(f"[{self.__class__.__name__}] Failed to invalidate tree of program {program_id}: {e}")
+        app_logger.debug(f"[{self.__class__.__name__}] Invalidated tree of program {program_id}")
+
+
+directory_cache = DirectoryCache()
+
+
+@event.listens_for(DirectoryTreeModel, "after_insert")
+@event.listens_for(DirectoryTreeModel, "after_delete")
+def _directory_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(INVALIDATED_PROGRAMS, set()).add(target.program_id)
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_changed_programs(session):
+    for program_id in session.info.pop(INVALIDATED_PROGRAMS, set()):
+        directory_cache.invalidate(program_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_changed_programs(session):
+    session.info.pop(INVALIDATED_PROGRAMS, None)
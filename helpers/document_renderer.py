@@ -0,0 +1,82 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from multiprocessing import get_context
+from typing import NamedTuple, Optional, Tuple
+
+from helpers.config_parser import config_parser
+from helpers.logger import app_logger
+from helpers.template_registry import template_registry
+
+RENDER_PROCESSES = config_parser.getint("Generation", "render_processes", fallback=0)
+RENDER_START_METHOD = config_parser.get("Generation", "render_start_method", fallback="spawn")
+MAX_JOBS_IN_FLIGHT_PER_PROCESS = 2
+
+
+class RenderJob(NamedTuple):
+    """Serializable description of a document: template path and merge operations replayed on its clone"""
+    template_document: str
+    operations: Tuple[Tuple[str, tuple, dict], ...]
+    output_file: str
+    in_memory: bool = False
+
+
+def render(job: RenderJob) -> Optional[bytes]:
+    """
+    Renders the document in the current process. Returns content of the document when job is in memory,
+    otherwise writes it to job.output_file and returns None.
+    """
+    document = template_registry.get(job.template_document).clone()
+    try:
+        for (operation, args, kwargs) in job.operations:
+            getattr(document, operation)(*args, **kwargs)
+        if job.in_memory:
+            buffer = BytesIO()
+            document.write(buffer)
+            return buffer.getvalue()
+        document.write(job.output_file)
+        return None
+    finally:
+        document.close()
+
+
+class RenderExecutor:
+    """
+    Bounded executor for render jobs backed by a process pool.
+    With processes=0 documents are rendered in a thread of the calling process.
+    Pool is shut down after each batch unless executor is persistent (long-lived worker).
+    """
+
+    def __init__(self, processes=RENDER_PROCESSES, persistent=False, start_method=RENDER_START_METHOD):
+        self.processes = max(processes, 0)
+        self.persistent = persistent
+        self.start_method = start_method
+        self.__pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def max_in_flight(self):
+        return self.processes * MAX_JOBS_IN_FLIGHT_PER_PROCESS
+
+    def __get_pool(self) -> ProcessPoolExecutor:
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(max_workers=self.processes,
+                                              mp_context=get_context(self.start_method))
+            app_logger.debug(f"[{self.__class__.__name__}] Started render pool with {self.processes} processes")
+        return self.__pool
+
+    async def render_async(self, job: RenderJob) -> Optional[bytes]:
+        if not self.processes:
+            return await asyncio.get_running_loop().run_in_executor(None, render, job)
+        return await asyncio.wrap_future(self.__get_pool().submit(render, job))
+
+    def release(self):
+        if not self.persistent:
+            self.shutdown()
+
+    def shutdown(self):
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=True)
+            self.__pool = None
+
+
+render_executor = RenderExecutor()
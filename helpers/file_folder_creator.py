@@ -5,6 +5,7 @@ from models.program import ProgramModel
 from models.directory_tree import DirectoryTreeModel
 from helpers.logger import app_logger
 from collections import namedtuple
+from itertools import accumulate
 
 directory_to_create_list = [
     config_parser.get('Directories', 'annex'),
@@ -42,7 +43,8 @@ class DirectoryCreator:
                 result = DirectoryCreator.create_directory(name=directory_name,
                                                            program_id=program.id,
                                                            google_id=main_dir_obj.google_id,
-                                                           parent_id=main_dir_obj.id)
+                                                           parent_id=main_dir_obj.id,
+                                                           path=f"{main_dir_obj.path}/{directory_name}")
                 if result.should_insert:
                     data_to_update_in_database.append(result.directoryTreeObj)
             return data_to_update_in_database
@@ -77,14 +79,22 @@ class DirectoryCreator:
         return CreateDirectoryResults(should_insert=True, directoryTreeObj=directory)
 
     @staticmethod
-    def create_remote_tree(path_to_file):
-        res = DirectoryTreeModel.get_children_and_parent(path_to_file)
+    def create_remote_tree(path_to_file, program_id) -> DirectoryTreeModel:
+        """Creates missing directories of the path in the tree of the program, returns the last one"""
+        res = DirectoryTreeModel.get_children_and_parent(path_to_file, program_id)
         parent = res.parent
-        while res.children:
-            new_directory = DirectoryCreator.create_directory(name=res.children.pop(0),
-                                                              program_id=parent.program_id,
+        paths = list(accumulate([parent.path] + res.children, lambda parent_path, name: f"{parent_path}/{name}"))[1:]
+        existing = DirectoryTreeModel.find_by_paths(paths, program_id)
+        for (name, directory_path) in zip(res.children, paths):
+            if directory_path in existing:
+                parent = existing[directory_path]
+                continue
+            new_directory = DirectoryCreator.create_directory(name=name,
+                                                              program_id=program_id,
                                                               google_id=parent.google_id,
-                                                              parent_id=parent.id)
+                                                              parent_id=parent.id,
+                                                              path=directory_path)
             parent = new_directory.directoryTreeObj
             if new_directory.should_insert:
                 parent.save_to_db()
+        return parent
@@ -7,20 +7,27 @@ from googleapiclient.http import HttpRequest
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+from io import BytesIO
 import json
-from os import getenv, getcwd, listdir, makedirs, remove
+from os import getenv, getcwd, listdir, makedirs, remove, replace
+from contextlib import asynccontextmanager
+from functools import wraps
 
 
 from helpers.logger import app_logger
+from helpers.config_parser import config_parser
+from helpers.adaptive_limiter import drive_limiter
 from helpers.common import FileData, DOCX_MIME_TYPE, PDF_MIME_TYPE, DIR_MIME_TYPE, GOOGLE_DRIVE_ID, get_mime_type, \
-    DOCX_EXT, PDF_EXT
+    DOCX_EXT, PDF_EXT, IN_MEMORY_DOCUMENTS
 from os import path
 from aiogoogle import Aiogoogle
 from aiogoogle.auth.creds import ServiceAccountCreds
+from aiogoogle.resource import GoogleAPI
 import asyncio
 
 from models.directory_tree import DirectoryTreeModel
+from helpers.directory_cache import directory_cache
 
 
 def validate_google_env_setup():
@@ -32,28 +39,87 @@ def validate_google_env_setup():
 
 validate_google_env_setup()
 SCOPES = ['https://www.googleapis.com/auth/drive']
+BATCH_REQUESTS_LIMIT = 100
 
 service_account_key = json.loads(getenv('GOOGLE_DRIVE_AUTH'))
 google_service = None
 aio_creds = ServiceAccountCreds(scopes=SCOPES, **service_account_key)
+aio_client = Aiogoogle(service_account_creds=aio_creds)
+drive_discovery_cache = config_parser.get("GoogleDriveConfig", "discovery_cache",
+                                          fallback=path.join(getcwd(), "drive_v3_discovery.json"))
+drive_api_service = None
+
+
+@asynccontextmanager
+async def drive_session():
+    """
+    Process wide Aiogoogle client (keeps OAuth token between jobs) with one HTTP session per context.
+    Session opened by the outer caller is shared by all tasks created inside it, otherwise a short-lived one is used.
+    """
+    if aio_client.session_context.get() is not None:
+        yield aio_client
+        return
+    async with aio_client:
+        yield aio_client
+
+
+def load_drive_discovery_document():
+    if not path.exists(drive_discovery_cache):
+        return None
+    try:
+        with open(drive_discovery_cache, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError) as e:
+        app_logger.warning(f"Ignoring Google Drive discovery cache '{drive_discovery_cache}': {e}")
+        return None
+
+
+def save_drive_discovery_document(discovery_document):
+    try:
+        tmp_cache = f"{drive_discovery_cache}.tmp"
+        with open(tmp_cache, "w", encoding="utf-8") as cache_file:
+            json.dump(discovery_document, cache_file)
+        replace(tmp_cache, drive_discovery_cache)
+    except OSError as e:
+        app_logger.warning(f"Failed to save Google Drive discovery cache '{drive_discovery_cache}': {e}")
+
+
+async def drive_api(aiogoogle) -> GoogleAPI:
+    """Drive v3 API built once per process from discovery document cached on disk"""
+    global drive_api_service
+    if drive_api_service is None:
+        discovery_document = load_drive_discovery_document()
+        if discovery_document:
+            drive_api_service = GoogleAPI(discovery_document)
+        else:
+            drive_api_service = await aiogoogle.discover('drive', 'v3')
+            save_drive_discovery_document(drive_api_service.discovery_document)
+            app_logger.info(f"Google Drive discovery document cached in {drive_discovery_cache}")
+    return drive_api_service
+
+
+def init_google_drive_service():
+    global google_service
+    if google_service:
+        return google_service
+
+    def build_request(http, *args, **kwargs):
+        new_http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+        return HttpRequest(new_http, *args, **kwargs)
+
+    creds = service_account.Credentials.from_service_account_info(service_account_key,
+                                                                  scopes=SCOPES)
+    authorized_http = google_auth_httplib2.AuthorizedHttp(credentials=creds, http=httplib2.Http())
+    google_service = build('drive', 'v3', requestBuilder=build_request, http=authorized_http)
+    app_logger.info(
+        f"Google Drive service setup for {SCOPES}")
+    return google_service
 
 
 def setup_google_drive_service(func):
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        global google_service
-        if google_service:
-            return func(*args, **kwargs)
-
-        def build_request(http, *args, **kwargs):
-            new_http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
-            return HttpRequest(new_http, *args, **kwargs)
-
-        creds = service_account.Credentials.from_service_account_info(service_account_key,
-                                                                      scopes=SCOPES)
-        authorized_http = google_auth_httplib2.AuthorizedHttp(credentials=creds, http=httplib2.Http())
-        google_service = build('drive', 'v3', requestBuilder=build_request, http=authorized_http)
-        app_logger.info(
-            f"Google Drive service setup for {SCOPES}")
+        init_google_drive_service()
         return func(*args, **kwargs)
 
     return wrapper
@@ -84,17 +150,20 @@ class DriveCommands(ABC):
 
     @staticmethod
     @abstractmethod
-    def prepare_remote_parent(output_directory, file_path):
+    def prepare_remote_parent(output_directory, file_path, program_id):
         pass
 
 
 class GoogleDriveCommands(DriveCommands):
     @staticmethod
-    def prepare_remote_parent(output_directory, file_path):
+    def prepare_remote_parent(output_directory, file_path, program_id):
         from helpers.file_folder_creator import DirectoryCreator, DirectoryCreatorError
         try:
-            DirectoryCreator.create_remote_tree(output_directory)
-            return DirectoryTreeModel.get_google_parent_directory(file_path)
+            remote_parent = directory_cache.resolve(file_path, program_id, contains_file_name=True)
+            if remote_parent:
+                return remote_parent
+            DirectoryCreator.create_remote_tree(output_directory, program_id)
+            return DirectoryTreeModel.get_google_parent_directory(file_path, program_id)
         except Exception as e:
             app_logger.error(f"During creation of directory tree: {e}")
             raise DirectoryCreatorError()
@@ -159,7 +228,10 @@ class GoogleDriveCommands(DriveCommands):
                 'parents': [file_data.parent_id],
                 'mimeType': file_data.mime_type
             }
-            media = MediaFileUpload(file_data.name)
+            if file_data.content is not None:
+                media = MediaIoBaseUpload(BytesIO(file_data.content), mimetype=file_data.mime_type)
+            else:
+                media = MediaFileUpload(file_data.name)
             file = google_service.files().create(body=file_metadata, fields="id,webViewLink",
                                                  media_body=media).execute()
             app_logger.debug(
@@ -188,6 +260,30 @@ class GoogleDriveCommands(DriveCommands):
             app_logger.error(f"Error during removing directory '{google_id}': {error}")
             raise ValueError(f"'{google_id}' failed to remove")
 
+    @staticmethod
+    @setup_google_drive_service
+    def remove_many(google_ids: List[str]) -> List[str]:
+        """Removes files using Drive batch requests (up to 100 files per HTTP call), returns ids failed to remove"""
+        google_ids = list(dict.fromkeys(google_ids))
+        failed = []
+
+        def on_response(request_id, _, exception):
+            if exception is not None:
+                app_logger.error(f"Error during removing '{request_id}': {exception}")
+                failed.append(request_id)
+
+        for start in range(0, len(google_ids), BATCH_REQUESTS_LIMIT):
+            batch = google_service.new_batch_http_request(callback=on_response)
+            for google_id in google_ids[start:start + BATCH_REQUESTS_LIMIT]:
+                batch.add(google_service.files().delete(fileId=google_id), request_id=google_id)
+            try:
+                batch.execute()
+            except HttpError as error:
+                app_logger.error(f"Error during batch removing of {len(google_ids)} files: {error}")
+                failed.extend(google_ids[start:start + BATCH_REQUESTS_LIMIT])
+        app_logger.debug(f"Removed {len(google_ids) - len(failed)} of {len(google_ids)} files")
+        return failed
+
     @staticmethod
     @setup_google_drive_service
     def clean_main_directory():
@@ -199,30 +295,28 @@ class GoogleDriveCommands(DriveCommands):
         app_logger.info(f"Google '{GOOGLE_DRIVE_ID}' cleaned")
 
 
-async def schedule_task(func, list_of_items):
-    results = [asyncio.create_task(func(item)) for item in list_of_items]
-    return await asyncio.gather(*results)
+async def schedule(func, list_of_items):
+    """Runs func for all items at once, concurrency of Drive calls is controlled by drive_limiter"""
+    return await asyncio.gather(*[func(item) for item in list_of_items])
 
 
-async def schedule(func, list_of_items, limit=30):
-    items = len(list_of_items)
-    (loops, reminder) = divmod(items, limit)
-    if reminder > 0:
-        loops += 1
-    results = []
-    for i in range(loops):
-        start = limit * i
-        estimated_end = limit * (i + 1)
-        end = items if estimated_end > items else estimated_end
-        val = await schedule_task(func, list_of_items[start:end])
-        results.extend(val)
-    return results
+class MemoryPipe:
+    """Collects content downloaded by aiogoogle (pipe_to) in memory instead of a temporary file"""
+
+    def __init__(self):
+        self.buffer = BytesIO()
+
+    async def write(self, chunk):
+        self.buffer.write(chunk)
+
+    def getvalue(self):
+        return self.buffer.getvalue()
 
 
 class GoogleDriveCommandsAsync(DriveCommands):
     @staticmethod
-    def prepare_remote_parent(output_directory, file_path):
-        return GoogleDriveCommands.prepare_remote_parent(output_directory, file_path)
+    def prepare_remote_parent(output_directory, file_path, program_id):
+        return GoogleDriveCommands.prepare_remote_parent(output_directory, file_path, program_id)
 
     @staticmethod
     def create_directory(parent_directory_id, directory_name):
@@ -242,25 +336,38 @@ class GoogleDriveCommandsAsync(DriveCommands):
         return await schedule(GoogleDriveCommandsAsync.convert_to_pdf, files_data)
 
     @staticmethod
-    async def convert_to_pdf(file_data: FileData):
+    async def convert_to_pdf(file_data: FileData, in_memory=IN_MEMORY_DOCUMENTS):
         if file_data.id is None:
             raise Exception(f"Source file Id needs to be specified for converting pdf using Google Drive API")
-        async with Aiogoogle(service_account_creds=aio_creds) as aiogoogle:
-            google_drive = await aiogoogle.discover('drive', 'v3')
+        async with drive_session() as aiogoogle:
+            google_drive = await drive_api(aiogoogle)
             try:
                 pdf_name = path.join(GoogleDriveCommandsAsync.tmp_pdf_dir, file_data.name.replace(DOCX_EXT, PDF_EXT).split("/")[-1])
 
-                await aiogoogle.as_service_account(google_drive.files.export(fileId=file_data.id, mimeType=PDF_MIME_TYPE,
-                                                                             download_file=pdf_name))
+                async def export():
+                    if not in_memory:
+                        await aiogoogle.as_service_account(google_drive.files.export(fileId=file_data.id,
+                                                                                     mimeType=PDF_MIME_TYPE,
+                                                                                     download_file=pdf_name))
+                        return None
+                    pipe = MemoryPipe()
+                    await aiogoogle.as_service_account(google_drive.files.export(fileId=file_data.id,
+                                                                                 mimeType=PDF_MIME_TYPE,
+                                                                                 pipe_to=pipe))
+                    return pipe.getvalue()
+
+                content = await drive_limiter.run(export)
 
                 pdf_file: FileData = FileData(_name=pdf_name, _mime_type=PDF_MIME_TYPE,
-                                              _parent_id=file_data.parent_id)
+                                              _parent_id=file_data.parent_id, _content=content)
                 app_logger.debug(f"Export pdf file on google drive for {file_data.id} Pdf file info: {pdf_file}")
                 return pdf_file
             except HttpError as error:
                 app_logger.error(f"Error during downloading pdf '{file_data.id}': {error}")
+                raise
             except Exception as error:
                 app_logger.error(f"Error during downloading pdf'{file_data.id}': {error}")
+                raise
 
 
     @staticmethod
@@ -269,47 +376,54 @@ class GoogleDriveCommandsAsync(DriveCommands):
 
     @staticmethod
     async def upload_file(file_data: FileData):
-        async with Aiogoogle(service_account_creds=aio_creds) as aiogoogle:
-            google_drive = await aiogoogle.discover('drive', 'v3')
+        async with drive_session() as aiogoogle:
+            google_drive = await drive_api(aiogoogle)
             try:
                 json_body = {
                     'name': path.split(file_data.name)[1],
                     'parents': [file_data.parent_id],
                     'mimeType': file_data.mime_type
                 }
-                command = google_drive.files.create(validate=True,
-                                                    upload_file=file_data.name,
-                                                    fields="id,webViewLink",
-                                                    includePermissionsForView="published",
-                                                    json=json_body)
+                upload_source = file_data.content if file_data.content is not None else file_data.name
+
+                def upload():
+                    command = google_drive.files.create(validate=True,
+                                                        upload_file=upload_source,
+                                                        fields="id,webViewLink",
+                                                        includePermissionsForView="published",
+                                                        json=json_body)
+                    return aiogoogle.as_service_account(command, full_res=True)
 
-                response = await aiogoogle.as_service_account(command, full_res=True)
+                response = await drive_limiter.run(upload)
                 app_logger.info(
                     f"Uploaded file on google drive {response.json.get('id')} {file_data.name} parent_id: {file_data.parent_id}"
                     f" webViewLink:{response.json.get('webViewLink')}")
                 file_data.id = response.json.get("id")
                 file_data.web_view_link = response.json.get('webViewLink')
+                file_data.content = None
                 return file_data
             except HttpError as error:
                 app_logger.error(
                     f"Error during uploading file '{file_data.name}' in '{file_data.parent_id}': {error}")
+                raise
             except Exception as error:
                 app_logger.error(f"Error during uploading file '{file_data.id}': {error}")
+                raise
 
     @staticmethod
     async def search(parent_id=GOOGLE_DRIVE_ID,
                      mime_type_query=get_mime_type(DIR_MIME_TYPE),
                      recursive_search=True) -> List[FileData]:
-        async with Aiogoogle(service_account_creds=aio_creds) as aiogoogle:
-            google_drive = await aiogoogle.discover('drive', 'v3')
+        async with drive_session() as aiogoogle:
+            google_drive = await drive_api(aiogoogle)
             found = []
             page_token = None
             try:
                 while True:
-                    response = await aiogoogle.as_service_account(
+                    response = await drive_limiter.run(lambda: aiogoogle.as_service_account(
                         google_drive.files.list(q=f"mimeType{mime_type_query} and '{parent_id}' in parents",
                                                 spaces="drive",
-                                                fields="nextPageToken,  files(id, name, mimeType)"))
+                                                fields="nextPageToken,  files(id, name, mimeType)")))
                     for file in response.get('files', []):
                         new_file = FileData(_name=file.get("name"), _id=file.get("id"), _mime_type=file.get("mimeType"))
                         found.append(new_file)
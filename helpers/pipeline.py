@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from helpers.config_parser import config_parser
+from helpers.logger import app_logger
+
+UPLOAD_CONCURRENCY = config_parser.getint("Generation", "upload_concurrency", fallback=10)
+PDF_CONCURRENCY = config_parser.getint("Generation", "pdf_concurrency", fallback=10)
+QUEUE_SIZE_FACTOR = 2
+
+
+class Stage(NamedTuple):
+    """
+    Single step of the pipeline. func receives output of the previous stage, returning None drops the item,
+    raising drops the item and reports it in Pipeline.failures, described with label(item).
+    Results of stages with collect=True are returned from the pipeline.
+    """
+    name: str
+    func: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+    collect: bool = False
+    label: Callable[[Any], str] = str
+
+
+class Pipeline:
+    """
+    Streams every item through the stages: an item moves to the next stage as soon as the previous finished.
+    Each stage runs its own workers (concurrency) reading from a bounded queue, so fast stages wait for
+    slow ones instead of piling up items in memory.
+    """
+
+    def __init__(self, stages: List[Stage], on_stage_done: Optional[Callable[[Stage, Any], None]] = None):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.on_stage_done = on_stage_done
+        self.__collected: Dict[str, Dict[int, Any]] = {stage.name: dict() for stage in stages if stage.collect}
+        self.failures: List[str] = []
+
+    async def __run_stage(self, stage_index, queue_in: asyncio.Queue, queue_out: Optional[asyncio.Queue]):
+        stage = self.stages[stage_index]
+        while True:
+            (item_index, item) = await queue_in.get()
+            try:
+                result = await stage.func(item)
+            except Exception as e:
+                app_logger.error(f"[{stage.name}] Problem occurred during processing {stage.label(item)}: {e}")
+                self.failures.append(f"[{stage.name}] {stage.label(item)}: {e}")
+                result = None
+            try:
+                if result is None:
+                    continue
+                if self.on_stage_done:
+                    try:
+                        self.on_stage_done(stage, result)
+                    except Exception as e:
+                        app_logger.error(f"[{stage.name}] Problem occurred after processing {result}: {e}")
+                if stage.collect:
+                    self.__collected[stage.name][item_index] = result
+                if queue_out is not None:
+                    await queue_out.put((item_index, result))
+            finally:
+                queue_in.task_done()
+
+    async def run(self, items: Iterable) -> Dict[str, List]:
+        """Returns results of the collected stages ordered as input items"""
+        queues = [asyncio.Queue(maxsize=max(stage.concurrency, 1) * QUEUE_SIZE_FACTOR) for stage in self.stages]
+        workers = []
+        for (index, stage) in enumerate(self.stages):
+            queue_out = queues[index + 1] if index + 1 < len(queues) else None
+            workers.append([asyncio.create_task(self.__run_stage(index, queues[index], queue_out))
+                            for _ in range(max(stage.concurrency, 1))])
+        try:
+            for item in enumerate(items):
+                await queues[0].put(item)
+            for (queue, stage_workers) in zip(queues, workers):
+                await queue.join()
+                for worker in stage_workers:
+                    worker.cancel()
+        finally:
+            for stage_workers in workers:
+                for worker in stage_workers:
+                    worker.cancel()
+            await asyncio.gather(*[worker for stage_workers in workers for worker in stage_workers],
+                                 return_exceptions=True)
+        return {name: [results[index] for index in sorted(results)] for (name, results) in self.__collected.items()}
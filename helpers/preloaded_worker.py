@@ -0,0 +1,138 @@
+import asyncio
+import resource
+from glob import glob
+from os import path, sysconf, getpid
+from shutil import rmtree
+from tempfile import mkdtemp
+from typing import Callable, List
+
+from rq import SimpleWorker
+
+from helpers.common import TimeMeasure
+from helpers.config_parser import config_parser
+from helpers.logger import app_logger
+
+MAX_JOBS_PER_WORKER = config_parser.getint("Worker", "max_jobs", fallback=200)
+MAX_MEMORY_MB = config_parser.getint("Worker", "max_memory_mb", fallback=1024)
+
+preload_steps: List[Callable[[], None]] = []
+
+
+def register_preload(func):
+    """Registers function run once when worker process starts, before the first job"""
+    preload_steps.append(func)
+    return func
+
+
+def get_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@register_preload
+def preload_app():
+    from sqlalchemy.orm import configure_mappers
+    from helpers.db_context import get_app
+    with get_app().app_context():
+        configure_mappers()
+
+
+@register_preload
+def preload_reference_data():
+    from helpers.db_context import get_app
+    from models.reference_cache import reference_cache
+    with get_app().app_context():
+        reference_cache.data()
+
+
+@register_preload
+def preload_templates():
+    from helpers.template_registry import template_registry
+    for template in glob(path.join(config_parser.get("DocTemplates", "directory"), "*.docx")):
+        try:
+            template_registry.get(template)
+        except Exception as e:
+            app_logger.error(f"Failed to preload template {template}: {e}")
+    app_logger.info(f"Preloaded templates: {template_registry.stats()}")
+
+
+@register_preload
+def preload_google_drive():
+    from helpers.google_drive import init_google_drive_service, drive_session, drive_api
+
+    async def load_drive_api():
+        async with drive_session() as aiogoogle:
+            await drive_api(aiogoogle)
+
+    init_google_drive_service()
+    asyncio.run(load_drive_api())
+
+
+@register_preload
+def preload_render_executor():
+    from helpers.document_renderer import render_executor
+    render_executor.persistent = True
+
+
+def preload():
+    for step in preload_steps:
+        try:
+            with TimeMeasure(step.__name__):
+                step()
+        except Exception as e:
+            app_logger.error(f"Worker preload step {step.__name__} failed: {e}")
+
+
+class PreloadedWorker(SimpleWorker):
+    """
+    Executes jobs in the worker process, so everything preloaded (app with connection pool, templates,
+    Google Drive clients, render pool) is reused by all jobs. Each job gets its own temporary directory
+    and database session. Worker stops after max_jobs jobs or when its memory exceeds max_memory_mb,
+    supervisor starts a fresh one in its place.
+    """
+
+    def __init__(self, *args, max_jobs=MAX_JOBS_PER_WORKER, max_memory_mb=MAX_MEMORY_MB, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_jobs = max_jobs
+        self.max_memory_mb = max_memory_mb
+        self.executed_jobs = 0
+
+    def should_recycle(self) -> bool:
+        if self.max_jobs and self.executed_jobs >= self.max_jobs:
+            app_logger.info(f"Worker {getpid()} executed {self.executed_jobs} jobs, recycling")
+            return True
+        rss_mb = get_rss_mb()
+        if self.max_memory_mb and rss_mb >= self.max_memory_mb:
+            app_logger.info(f"Worker {getpid()} uses {rss_mb:.0f}MB, recycling")
+            return True
+        return False
+
+    def execute_job(self, job, queue):
+        from helpers.google_drive import GoogleDriveCommandsAsync
+        shared_tmp_dir = GoogleDriveCommandsAsync.tmp_pdf_dir
+        job_tmp_dir = mkdtemp(prefix=f"job_{job.id}_", dir=shared_tmp_dir)
+        GoogleDriveCommandsAsync.tmp_pdf_dir = job_tmp_dir
+        try:
+            return super().execute_job(job, queue)
+        finally:
+            GoogleDriveCommandsAsync.tmp_pdf_dir = shared_tmp_dir
+            rmtree(job_tmp_dir, ignore_errors=True)
+            self.__remove_session()
+            self.executed_jobs += 1
+            if self.should_recycle():
+                self._stop_requested = True
+
+    @staticmethod
+    def __remove_session():
+        from helpers.db import db
+        from helpers.db_context import get_app
+        with get_app().app_context():
+            db.session.remove()
+
+    def register_death(self):
+        from helpers.document_renderer import render_executor
+        render_executor.shutdown()
+        super().register_death()
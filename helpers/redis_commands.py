@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Dict
 import json
 import redis
 from os import environ
@@ -8,6 +8,7 @@ from helpers.google_drive import GoogleDriveCommands
 from helpers.logger import app_logger
 
 UPLOADED_FILES_DICT = "uploadedFilesDict"
+DEFERRED_CLEANUP = config_parser.getboolean("Generation", "deferred_cleanup", fallback=False)
 
 
 redis_url = environ.get('REDIS_URL', config_parser.get('Redis', 'url'))
@@ -15,12 +16,13 @@ conn = redis.from_url(redis_url)
 
 
 def save_uploaded_files(files: List[FileData], redis_connection=conn):
-    results = 0
-    for file in files:
-        assert isinstance(file, FileData)
-        value = json.dumps({"name": file.name, "web_view_link": file.web_view_link, "id": file.id})
-        results = results + redis_connection.hset(UPLOADED_FILES_DICT, file.name, value)
-        app_logger.debug(f"Saved to redis {file.name} with id {file.id}")
+    with redis_connection.pipeline() as pipe:
+        for file in files:
+            assert isinstance(file, FileData)
+            value = json.dumps({"name": file.name, "web_view_link": file.web_view_link, "id": file.id})
+            pipe.hset(UPLOADED_FILES_DICT, file.name, value)
+        results = sum(pipe.execute())
+    app_logger.debug(f"Saved to redis {len(files)} files")
     return results
 
 
@@ -38,14 +40,35 @@ def remove_file(file_data: FileData, redis_connection=conn):
     return redis_connection.hdel(UPLOADED_FILES_DICT, file_data.name)
 
 
-def remove_old_save_new(files: List[FileData], redis_connection=conn):
+def get_uploaded_files(names: List[str], redis_connection=conn) -> Dict[str, FileData]:
+    if not names:
+        return dict()
+    found = dict()
+    for value in redis_connection.hmget(UPLOADED_FILES_DICT, names):
+        if not value:
+            continue
+        d = json.loads(value)
+        found[d["name"]] = FileData(_name=d["name"], _webViewLink=d["web_view_link"], _id=d["id"])
+    return found
+
+
+def remove_from_drive(google_ids: List[str], redis_connection=conn, deferred=DEFERRED_CLEANUP):
+    if not google_ids:
+        return
+    if deferred:
+        from rq import Queue
+        Queue(connection=redis_connection).enqueue(GoogleDriveCommands.remove_many, google_ids,
+                                                   result_ttl=60 * 60, job_timeout=10 * 60)
+        app_logger.debug(f"Scheduled removing of {len(google_ids)} superseded files")
+        return
+    GoogleDriveCommands.remove_many(google_ids)
+
+
+def remove_old_save_new(files: List[FileData], redis_connection=conn, deferred=DEFERRED_CLEANUP):
     if redis_connection is None:
         redis_connection = conn
-    for file in files:
-        try:
-            prev_file = get_uploaded_file(file.name, redis_connection)
-            GoogleDriveCommands.remove(prev_file.id)
-            remove_file(prev_file, redis_connection)
-        except ValueError:
-            continue
+    new_ids = {file.id for file in files}
+    previous = get_uploaded_files(list(dict.fromkeys(file.name for file in files)), redis_connection)
     save_uploaded_files(files, redis_connection)
+    remove_from_drive([prev_file.id for prev_file in previous.values() if prev_file.id not in new_ids],
+                      redis_connection, deferred)
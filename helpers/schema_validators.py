@@ -44,7 +44,7 @@ class AmountQuerySchema(NameQuerySchema):
 
 
 class AmountFloatQuerySchema(Schema):
-    amount = fields.Float(required=True)
+    amount = fields.Float(required=True, validate=validate.Range(min=0, min_inclusive=False))
 
 
 class InvoiceProductSchema(AmountFloatQuerySchema):
@@ -55,6 +55,17 @@ class InvoiceDisposalSchema(AmountFloatQuerySchema):
     invoice_product_id = fields.Int(required=True)
     application_id = fields.Int(required=True)
 
+
+class InvoiceProductAmountSchema(AmountFloatQuerySchema):
+    invoice_product_id = fields.Int(required=True)
+
+
+class InvoiceDisposalAssignSchema(Schema):
+    application_id = fields.Int(required=True)
+    invoice_products = fields.List(fields.Nested(InvoiceProductAmountSchema), required=True,
+                                   validate=validate.Length(min=1))
+
+
 class ProductQuerySchema(NameQuerySchema):
     product_type = fields.Str(required=True)
     weight_type = fields.Str(required=True)
@@ -0,0 +1,75 @@
+from copy import deepcopy
+from io import BytesIO
+from os import stat
+from threading import Lock
+from typing import Dict, FrozenSet, Tuple
+from zipfile import ZipFile
+
+from mailmerge import MailMerge
+
+from helpers.logger import app_logger
+
+
+class CachedTemplate:
+    """
+    Parsed docx template kept in memory: raw archive bytes, merge-ready XML parts and merge fields.
+    Every clone() returns an independent MailMerge document without parsing the template again.
+    """
+
+    def __init__(self, template_document):
+        with open(template_document, "rb") as template_file:
+            self.content = template_file.read()
+        prototype = MailMerge(BytesIO(self.content))
+        try:
+            self.parts = {zi.filename: tree for zi, tree in prototype.parts.items()}
+            self.settings = prototype.settings
+            self.settings_file = prototype._settings_info.filename if prototype._settings_info else None
+            self.remove_empty_tables = prototype.remove_empty_tables
+            self.merge_fields: FrozenSet[str] = frozenset(prototype.get_merge_fields())
+        finally:
+            prototype.close()
+
+    def clone(self) -> MailMerge:
+        document = MailMerge.__new__(MailMerge)
+        document.zip = ZipFile(BytesIO(self.content))
+        document.parts = {document.zip.getinfo(name): deepcopy(tree) for name, tree in self.parts.items()}
+        document.settings = deepcopy(self.settings)
+        document._settings_info = document.zip.getinfo(self.settings_file) if self.settings_file else None
+        document.remove_empty_tables = self.remove_empty_tables
+        return document
+
+
+class TemplateRegistry:
+    """Per process cache of parsed templates keyed by template path and its modification time"""
+
+    def __init__(self):
+        self.__templates: Dict[str, Tuple[float, CachedTemplate]] = dict()
+        self.__lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_document) -> CachedTemplate:
+        mtime = stat(template_document).st_mtime
+        with self.__lock:
+            cached = self.__templates.get(template_document)
+            if cached and cached[0] == mtime:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        template = CachedTemplate(template_document)
+        with self.__lock:
+            self.__templates[template_document] = (mtime, template)
+        app_logger.debug(f"[{self.__class__.__name__}] Parsed template {template_document}: {self.stats()}")
+        return template
+
+    def clear(self):
+        with self.__lock:
+            self.__templates.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "templates": len(self.__templates)}
+
+
+template_registry = TemplateRegistry()
@@ -0,0 +1,120 @@
+from bisect import bisect_right
+from typing import Dict, Iterable, Optional, Tuple
+
+from redis import RedisError
+from sqlalchemy.exc import NoResultFound
+
+from helpers.date_converter import DateConverter
+from helpers.logger import app_logger
+from models.snapshot import WeekSnapshot, load_weeks
+from models.week import WeekModel
+
+WEEK_CALENDAR_VERSION = "weekCalendarVersion:{}"
+ALL_PROGRAMS = "all"
+
+
+class WeekCalendar:
+    """
+    Weeks of a program sorted by start date, date -> week is a binary search over start dates.
+    Overlapping weeks are found once when calendar is built, lookups of dates inside them raise ValueError.
+    """
+    __slots__ = ("weeks", "starts", "ends", "by_id", "overlapping")
+
+    def __init__(self, weeks: Iterable[WeekSnapshot]):
+        self.weeks: Tuple[WeekSnapshot, ...] = tuple(sorted(weeks, key=lambda week: (week.start_date, week.id)))
+        self.starts = tuple(week.start_date for week in self.weeks)
+        self.ends = tuple(week.end_date for week in self.weeks)
+        self.by_id: Dict[int, WeekSnapshot] = {week.id: week for week in self.weeks}
+        self.overlapping = WeekCalendar.find_overlapping(self.weeks)
+        if self.overlapping:
+            app_logger.warning(f"[{self.__class__.__name__}] Overlapping weeks: "
+                               f"{', '.join(str(self.weeks[i]) for i in sorted(self.overlapping))}")
+
+    @staticmethod
+    def find_overlapping(weeks: Tuple[WeekSnapshot, ...]) -> frozenset:
+        overlapping = set()
+        latest = None
+        for (i, week) in enumerate(weeks):
+            if latest is not None and week.start_date <= weeks[latest].end_date:
+                overlapping.update((latest, i))
+            if latest is None or week.end_date > weeks[latest].end_date:
+                latest = i
+        return frozenset(overlapping)
+
+    def find_by_date(self, date) -> WeekSnapshot:
+        date = DateConverter.convert_to_date(date)
+        last = bisect_right(self.starts, date) - 1
+        if self.overlapping:
+            found = [i for i in range(last + 1) if date <= self.ends[i]]
+        else:
+            found = [last] if last >= 0 and date <= self.ends[last] else []
+        if len(found) > 1:
+            raise ValueError(f"More than one week found for date: {date}. Weeks should never overlap.")
+        if not found:
+            raise NoResultFound(f"No week found for date: {date}")
+        return self.weeks[found[0]]
+
+    def find_by_id(self, week_id) -> Optional[WeekSnapshot]:
+        return self.by_id.get(week_id)
+
+
+class WeekCalendarCache:
+    """
+    Week calendars kept in memory of the process, per program and one of all programs.
+    Every lookup checks version keys of the program and of all programs in Redis and rebuilds calendar
+    after any week of the program was changed.
+    """
+
+    def __init__(self, redis_connection=None):
+        self.__redis_connection = redis_connection
+        self.__calendars: Dict[object, Tuple[tuple, WeekCalendar]] = dict()
+
+    @property
+    def redis_connection(self):
+        if self.__redis_connection is None:
+            from helpers.redis_commands import conn
+            self.__redis_connection = conn
+        return self.__redis_connection
+
+    @staticmethod
+    def load_calendar(program_id=None) -> WeekCalendar:
+        criteria = [] if program_id is None else [WeekModel.program_id == program_id]
+        return WeekCalendar(load_weeks(*criteria).values())
+
+    def calendar(self, program_id=None) -> WeekCalendar:
+        key = ALL_PROGRAMS if program_id is None else program_id
+        try:
+            version = tuple(int(value or 0) for value in self.redis_connection.mget(
+                [WEEK_CALENDAR_VERSION.format(key) for key in dict.fromkeys((key, ALL_PROGRAMS))]))
+        except RedisError as e:
+            app_logger.warning(f"[{self.__class__.__name__}] Redis not available, loading weeks from database: {e}")
+            self.__calendars.pop(key, None)
+            return WeekCalendarCache.load_calendar(program_id)
+        cached = self.__calendars.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        calendar = WeekCalendarCache.load_calendar(program_id)
+        self.__calendars[key] = (version, calendar)
+        return calendar
+
+    def find_by_date(self, date, program_id=None) -> WeekSnapshot:
+        return self.calendar(program_id).find_by_date(date)
+
+    def find_by_id(self, week_id, program_id=None) -> Optional[WeekSnapshot]:
+        return self.calendar(program_id).find_by_id(week_id)
+
+    def invalidate(self, program_id=None):
+        """Invalidates calendar of the program, without program_id calendars of all programs"""
+        keys = [ALL_PROGRAMS] if program_id is None else [program_id, ALL_PROGRAMS]
+        if program_id is None:
+            self.__calendars.clear()
+        for key in keys:
+            self.__calendars.pop(key, None)
+            try:
+                self.redis_connection.incr(WEEK_CALENDAR_VERSION.format(key))
+            except RedisError as e:
+                app_logger.error(f"[{self.__class__.__name__}] Failed to invalidate weeks of {key}: {e}")
+        app_logger.debug(f"[{self.__class__.__name__}] Invalidated weeks of {keys[0]}")
+
+
+week_calendar = WeekCalendarCache()
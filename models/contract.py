@@ -1,6 +1,12 @@
 import enum
+from bisect import bisect_left
+from datetime import datetime
 
-from helpers.date_converter import DateConverter, is_date_in_range
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.util import identity_key
+
+from helpers.date_converter import DateConverter
 from helpers.db import db
 from models.base_database_query import BaseDatabaseQuery
 from models.product import ProductTypeModel
@@ -8,11 +14,69 @@ from models.program import ProgramModel
 from models.school import SchoolModel
 
 
-def get_kids_no_by_type(contract_or_annex, product_type: ProductTypeModel):
-    if product_type.is_dairy():
-        return contract_or_annex.dairy_products
-    if product_type.is_fruit_veg():
-        return contract_or_annex.fruitVeg_products
+class KidsNoIndex:
+    """
+    Kids numbers of contract and its annexes as sorted, non overlapping date ranges.
+    Range borders are kept in one sorted tuple with a value for every border date and for dates between two borders,
+    so a lookup is one binary search. Values follow the same rules as before: the latest annex valid on the date
+    wins, then the contract itself.
+    """
+    __slots__ = ("name", "constant", "borders", "border_values", "between_values")
+
+    def __init__(self, contract):
+        self.name = str(contract)
+        self.constant = None
+        self.borders = ()
+        self.border_values = ()
+        self.between_values = ()
+        if not len(contract.annex):
+            self.constant = (contract.dairy_products, contract.fruitVeg_products)
+            return
+        ranges = []
+        for annex in contract.annex:
+            end_date = contract.program.end_date if not annex.timed_annex else annex.timed_annex[0].validity_date_end
+            ranges.append((annex.validity_date, end_date, (annex.dairy_products, annex.fruitVeg_products)))
+        ranges.append((contract.validity_date, contract.program.end_date,
+                       (contract.dairy_products, contract.fruitVeg_products)))
+        ranges = [(start or datetime.min, end or datetime.max, kids_no) for (start, end, kids_no) in ranges]
+        self.borders = tuple(sorted({date for (start, end, _) in ranges for date in (start, end)}))
+
+        def kids_no_on(date):
+            return next((kids_no for (start, end, kids_no) in ranges if start <= date <= end), None)
+
+        self.border_values = tuple(kids_no_on(border) for border in self.borders)
+        self.between_values = tuple(kids_no_on(start + (end - start) / 2)
+                                    for (start, end) in zip(self.borders, self.borders[1:]))
+
+    def __key(self):
+        return self.name, self.constant, self.borders, self.border_values, self.between_values
+
+    def __eq__(self, other):
+        return isinstance(other, KidsNoIndex) and self.__key() == other.__key()
+
+    def __hash__(self):
+        return hash(self.__key())
+
+    def find(self, date):
+        if self.constant is not None:
+            return self.constant
+        date = DateConverter.convert_to_date(date)
+        position = bisect_left(self.borders, date)
+        if position < len(self.borders) and self.borders[position] == date:
+            return self.border_values[position]
+        if 0 < position < len(self.borders):
+            return self.between_values[position - 1]
+        return None
+
+    def get_kids_no(self, product_type: ProductTypeModel, date):
+        kids_no = self.find(date)
+        if kids_no is None:
+            raise ValueError(f"Failed to find kids no for {date}: {self.name}")
+        dairy_products, fruit_veg_products = kids_no
+        if product_type.is_dairy():
+            return dairy_products
+        if product_type.is_fruit_veg():
+            return fruit_veg_products
 
 
 class ContractModel(db.Model, BaseDatabaseQuery):
@@ -58,17 +122,15 @@ class ContractModel(db.Model, BaseDatabaseQuery):
         return data
 
     def get_kids_no(self, product_type: ProductTypeModel, date):
-        if not len(self.annex):
-            return get_kids_no_by_type(self, product_type)
-        else:
-            for annex in self.annex:
-                end_date = self.program.end_date if not annex.timed_annex \
-                    else annex.timed_annex[0].validity_date_end
-                if is_date_in_range(date, annex.validity_date, end_date):
-                    return get_kids_no_by_type(annex, product_type)
-            if is_date_in_range(date, self.validity_date, self.program.end_date):
-                return get_kids_no_by_type(self, product_type)
-        raise ValueError(f"Failed to find kids no for {date}: {self}")
+        return self.get_kids_no_index().get_kids_no(product_type, date)
+
+    def get_kids_no_index(self) -> KidsNoIndex:
+        """Index is kept until contract is expired or its annexes change"""
+        index = self.__dict__.get("_kids_no_index")
+        if index is None:
+            index = KidsNoIndex(self)
+            self._kids_no_index = index
+        return index
 
     @classmethod
     def find(cls, program_id, school_id):
@@ -168,3 +230,39 @@ class TimedAnnexModel(db.Model, BaseDatabaseQuery):
 class SuspendType(enum.Enum):
     LOCKDOWN = 0
     QUARANTINE = 1
+
+
+def _drop_kids_no_index(contract):
+    if contract is not None:
+        contract.__dict__.pop("_kids_no_index", None)
+
+
+def _cached_in_session(target, model, _id):
+    session = object_session(target)
+    return session.identity_map.get(identity_key(model, _id)) if session is not None else None
+
+
+@event.listens_for(ContractModel, "expire")
+def _contract_expired(target, attrs):
+    _drop_kids_no_index(target)
+
+
+@event.listens_for(ContractModel, "after_update")
+def _contract_updated(mapper, connection, target):
+    _drop_kids_no_index(target)
+
+
+@event.listens_for(AnnexModel, "after_insert")
+@event.listens_for(AnnexModel, "after_update")
+@event.listens_for(AnnexModel, "after_delete")
+def _annex_changed(mapper, connection, target):
+    _drop_kids_no_index(_cached_in_session(target, ContractModel, target.contract_id))
+
+
+@event.listens_for(TimedAnnexModel, "after_insert")
+@event.listens_for(TimedAnnexModel, "after_update")
+@event.listens_for(TimedAnnexModel, "after_delete")
+def _timed_annex_changed(mapper, connection, target):
+    annex = _cached_in_session(target, AnnexModel, target.annex_id)
+    if annex is not None:
+        _drop_kids_no_index(_cached_in_session(target, ContractModel, annex.contract_id))
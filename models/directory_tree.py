@@ -1,11 +1,21 @@
 from collections import namedtuple
+from typing import Dict, List
+
+from sqlalchemy import func
 
 from helpers.db import db
+from helpers.logger import app_logger
 from models.base_database_query import BaseDatabaseQuery
+from models.schema_updates import register_backfill
 from helpers.common import get_parent_and_children_directories
 ParentDirectoryWithChildren = namedtuple("ParentDirectoryWithChildren", "parent children")
 
 
+def get_directory_path(path_to_file, contains_file_name=False) -> str:
+    (parent_name, children) = get_parent_and_children_directories(path_to_file, skip_last=contains_file_name)
+    return "/".join([parent_name] + children)
+
+
 class DirectoryTreeModel(db.Model, BaseDatabaseQuery):
     __tablename__ = 'directorytree'
 
@@ -15,28 +25,42 @@ class DirectoryTreeModel(db.Model, BaseDatabaseQuery):
     google_id = db.Column(db.String(44), nullable=False)
     parent_id = db.Column(db.Integer, db.ForeignKey('directorytree.id'), nullable=True)
     program_id = db.Column(db.Integer, db.ForeignKey('program.id'), nullable=False)
+    path = db.Column(db.String(500), nullable=True)
 
     program = db.relationship('ProgramModel', backref=db.backref('directorytree', lazy=True))
-    __table_args__ = (db.UniqueConstraint('name', 'program_id', 'parent_id'),)
+    __table_args__ = (db.UniqueConstraint('name', 'program_id', 'parent_id'),
+                      db.Index('ix_directorytree_path_program_id', 'path', 'program_id', unique=True))
 
-    def __init__(self, name, google_id, program_id, parent_id=None):
+    def __init__(self, name, google_id, program_id, parent_id=None, path=None):
         self.name = name
         self.google_id = google_id
         self.program_id = program_id
         self.parent_id = parent_id
+        if path is None:
+            if parent_id is not None:
+                raise ValueError(f"Path of directory '{name}' with parent has to be given")
+            path = name
+        self.path = path
+
+    @classmethod
+    def get_google_parent_directory(cls, path_to_file, program_id):
+        return cls.find_by_path(get_directory_path(path_to_file, contains_file_name=True), program_id)
+
+    @classmethod
+    def find_by_path(cls, directory_path, program_id):
+        return cls.query.filter_by(path=directory_path, program_id=program_id).one()
 
     @classmethod
-    def get_google_parent_directory(cls, path_to_file):
-        res = cls.get_children_and_parent(path_to_file, contains_file_name=True)
-        parent = res.parent
-        while res.children:
-            parent = cls.query.filter_by(parent_id=parent.id, name=res.children.pop(0)).one()
-        return parent
+    def find_by_paths(cls, directory_paths: List[str], program_id) -> Dict[str, 'DirectoryTreeModel']:
+        if not directory_paths:
+            return dict()
+        return {directory.path: directory for directory in
+                cls.query.filter(cls.program_id == program_id, cls.path.in_(set(directory_paths))).all()}
 
     @classmethod
-    def get_children_and_parent(cls, path_to_file, contains_file_name=False):
+    def get_children_and_parent(cls, path_to_file, program_id, contains_file_name=False):
         (parent_name, children) = get_parent_and_children_directories(path_to_file, skip_last=contains_file_name)
-        parent_dir = cls.query.filter_by(name=parent_name).one()
+        parent_dir = cls.query.filter_by(name=parent_name, parent_id=None, program_id=program_id).one()
         return ParentDirectoryWithChildren(parent_dir, children)
 
     @classmethod
@@ -51,3 +75,46 @@ class DirectoryTreeModel(db.Model, BaseDatabaseQuery):
 
     def __repr__(self):
         return f"{self.name}: google_id={self.google_id} program_id={self.program_id} parent_id={self.parent_id if self.parent_id else 'empty'}"
+
+
+@register_backfill
+def backfill_directory_paths(db):
+    if not DirectoryTreeModel.query.filter(DirectoryTreeModel.path.is_(None)).first():
+        return
+    rows = {row.id: row for row in DirectoryTreeModel.query.all()}
+    missing = [row for row in rows.values() if row.path is None]
+    for row in missing:
+        names = [row.name]
+        parent_id = row.parent_id
+        while parent_id is not None:
+            names.append(rows[parent_id].name)
+            parent_id = rows[parent_id].parent_id
+        row.path = "/".join(reversed(names))
+    db.session.commit()
+
+
+def _merge_directory(kept: DirectoryTreeModel, duplicate: DirectoryTreeModel):
+    kept_children = {child.name: child for child in DirectoryTreeModel.query.filter_by(parent_id=kept.id)}
+    for child in DirectoryTreeModel.query.filter_by(parent_id=duplicate.id).all():
+        if child.name in kept_children:
+            _merge_directory(kept_children[child.name], child)
+        else:
+            child.parent_id = kept.id
+    db.session.delete(duplicate)
+    # no relationship orders deletes of parents after their children, each one is flushed right away
+    db.session.flush()
+
+
+@register_backfill
+def merge_duplicated_directories(db):
+    """Directories with the same path in a program are merged into the oldest one before unique index is created"""
+    duplicated = db.session.query(DirectoryTreeModel.path, DirectoryTreeModel.program_id) \
+        .filter(DirectoryTreeModel.path.isnot(None)) \
+        .group_by(DirectoryTreeModel.path, DirectoryTreeModel.program_id).having(func.count() > 1).all()
+    for (directory_path, program_id) in sorted(duplicated, key=lambda row: row[0].count("/")):
+        (kept, *duplicates) = DirectoryTreeModel.query.filter_by(path=directory_path, program_id=program_id) \
+            .order_by(DirectoryTreeModel.id).all()
+        for duplicate in duplicates:
+            app_logger.warning(f"Merging duplicated directory {duplicate} into {kept}")
+            _merge_directory(kept, duplicate)
+    db.session.commit()
@@ -1,8 +1,16 @@
-from typing import List
+from typing import List, Iterable, Tuple
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import contains_eager, joinedload
 
 from helpers.date_converter import DateConverter
 from models.base_database_query import BaseDatabaseQuery
 from helpers.db import db
+from models.product import ProductStoreModel, ProductModel
+from models.schema_updates import register_backfill
+
+AMOUNT_TOLERANCE = 1e-6
+AMOUNT_EXCEEDED = "Suma produktów przypisanych do wniosków przekracza sumę na fakturze"
 
 
 class SupplierModel(db.Model, BaseDatabaseQuery):
@@ -36,7 +44,7 @@ class InvoiceModel(db.Model, BaseDatabaseQuery):
     date = db.Column(db.DateTime, nullable=False)
     supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=False)
     supplier = db.relationship('SupplierModel', backref=db.backref('invoices', lazy=True))
-    program_id = db.Column(db.Integer, db.ForeignKey('program.id'), nullable=False)
+    program_id = db.Column(db.Integer, db.ForeignKey('program.id'), nullable=False, index=True)
     program = db.relationship('ProgramModel', backref=db.backref('invoices', lazy=True))
     __table_args__ = (db.UniqueConstraint('program_id', 'name'),)
 
@@ -67,6 +75,7 @@ class InvoiceProductModel(db.Model, BaseDatabaseQuery):
     product_store_id = db.Column(db.Integer, db.ForeignKey('product_store.id'), nullable=False)
     product_store = db.relationship('ProductStoreModel', backref=db.backref('invoices', lazy=True))
     amount = db.Column(db.Float, nullable=False)
+    disposed_amount = db.Column(db.Float, nullable=False, default=0, server_default="0")
 
     __table_args__ = (db.UniqueConstraint('invoice_id', 'product_store_id'),)
 
@@ -74,11 +83,62 @@ class InvoiceProductModel(db.Model, BaseDatabaseQuery):
         self.invoice_id = invoice_id
         self.product_store_id = product_store_id
         self.amount = amount
+        self.disposed_amount = 0
         self.save_to_db()
 
+    @property
+    def remaining_amount(self):
+        return self.amount - (self.disposed_amount or 0)
+
+    @classmethod
+    def dispose(cls, invoice_product_id, amount):
+        """
+        Adds amount (negative to give back) to disposed amount of invoice product with single conditional UPDATE,
+        fails when disposed amount would exceed amount on invoice. Changes are not committed.
+        """
+        result = db.session.execute(
+            update(cls).where(cls.id == invoice_product_id,
+                              cls.disposed_amount + amount <= cls.amount + AMOUNT_TOLERANCE)
+            .values(disposed_amount=cls.disposed_amount + amount)
+            .execution_options(synchronize_session="fetch"))
+        if result.rowcount != 1:
+            raise ValueError(AMOUNT_EXCEEDED)
+
+    @classmethod
+    def remaining_by_program(cls, program_id):
+        rows = db.session.query(cls.id, cls.invoice_id, cls.product_store_id, cls.amount, cls.disposed_amount) \
+            .join(InvoiceModel, cls.invoice_id == InvoiceModel.id) \
+            .filter(InvoiceModel.program_id == program_id).order_by(cls.id)
+        return [{'id': _id, 'invoice_id': invoice_id, 'product_store_id': product_store_id, 'amount': amount,
+                 'disposed_amount': disposed_amount, 'remaining_amount': amount - disposed_amount}
+                for (_id, invoice_id, product_store_id, amount, disposed_amount) in rows]
+
+    def update_db(self, **update_patch):
+        try:
+            amount = update_patch.get("amount")
+            if amount is not None:
+                disposed_amount = db.session.query(InvoiceProductModel.disposed_amount) \
+                    .filter(InvoiceProductModel.id == self.id).with_for_update().scalar()
+                if disposed_amount > amount + AMOUNT_TOLERANCE:
+                    raise ValueError(AMOUNT_EXCEEDED)
+                self.amount = amount
+            self.update_db_only(**update_patch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
     @classmethod
     def all_filtered_by_program(cls, program_id):
-        return cls.query.join(cls.invoice).filter_by(program_id=program_id)
+        return cls.query.join(cls.invoice).filter(InvoiceModel.program_id == program_id) \
+            .options(contains_eager(cls.invoice),
+                     joinedload(cls.product_store).joinedload(ProductStoreModel.product)
+                     .joinedload(ProductModel.weight))
+
+    def json(self):
+        data: {} = super().json()
+        data['remaining_amount'] = self.remaining_amount
+        return data
 
     def __str__(self):
         return f"Numer faktury {self.invoice.name}: " \
@@ -95,23 +155,65 @@ class InvoiceProductModel(db.Model, BaseDatabaseQuery):
 class InvoiceDisposalModel(db.Model, BaseDatabaseQuery):
     __tablename__ = 'invoice_disposal'
     id = db.Column(db.Integer, primary_key=True)
-    invoice_product_id = db.Column(db.Integer, db.ForeignKey('invoice_product.id'), nullable=False)
+    invoice_product_id = db.Column(db.Integer, db.ForeignKey('invoice_product.id'), nullable=False, index=True)
     invoice_product = db.relationship('InvoiceProductModel', backref=db.backref('invoice_products', lazy=True))
-    application_id = db.Column(db.Integer, db.ForeignKey('application.id'), nullable=False)
+    application_id = db.Column(db.Integer, db.ForeignKey('application.id'), nullable=False, index=True)
     application = db.relationship('ApplicationModel', backref=db.backref('applications', lazy=True))
     amount = db.Column(db.Float, nullable=False)
 
-    def __init__(self, invoice_product_id, application_id, amount):
-        existing_disposals = InvoiceDisposalModel.query.filter_by(invoice_product_id=invoice_product_id).all()
-        existing_disposals_amount = sum(id.amount for id in existing_disposals)
-        if existing_disposals and (existing_disposals_amount + int(amount)) > existing_disposals[0].invoice_product.amount:
-            raise ValueError(
-                "Suma produktów przypisanych do wniosków przekracza sumę na fakturze")
-
+    def __init__(self, invoice_product_id, application_id, amount, commit=True):
         self.invoice_product_id = invoice_product_id
         self.application_id = application_id
         self.amount = amount
-        self.save_to_db()
+        try:
+            InvoiceProductModel.dispose(invoice_product_id, amount)
+        except Exception:
+            if commit:
+                db.session.rollback()
+            raise
+        if commit:
+            self.save_to_db()
+        else:
+            db.session.add(self)
+
+    @classmethod
+    def assign(cls, application_id, invoice_products: Iterable[Tuple[int, float]]):
+        """Disposes all (invoice_product_id, amount) to application in one transaction, none if any fails"""
+        try:
+            disposals = [cls(invoice_product_id, application_id, amount, commit=False)
+                         for (invoice_product_id, amount) in sorted(invoice_products, key=lambda i: i[0])]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return disposals
+
+    def locked_amount(self):
+        """Amount of disposal in database, row stays locked until end of transaction"""
+        return db.session.query(InvoiceDisposalModel.amount).filter(InvoiceDisposalModel.id == self.id) \
+            .with_for_update().scalar()
+
+    def update_db(self, **update_patch):
+        try:
+            amount = update_patch.get("amount")
+            if amount is not None:
+                InvoiceProductModel.dispose(self.invoice_product_id, amount - self.locked_amount())
+                # update_db_only skips falsy values, zero has to be set here
+                self.amount = amount
+            self.update_db_only(**update_patch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def delete_from_db(self):
+        try:
+            InvoiceProductModel.dispose(self.invoice_product_id, -self.locked_amount())
+            db.session.delete(self)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
 
     def __str__(self):
         return f"Wniosek: {self.application} {self.invoice_product}: {self.amount}"
@@ -121,9 +223,28 @@ class InvoiceDisposalModel(db.Model, BaseDatabaseQuery):
 
     @classmethod
     def all_filtered_by_program(cls, program_id):
-        output = InvoiceDisposalModel.all()
-        return list(filter(lambda i: i.invoice_product.invoice.program_id != program_id, output))
+        return cls.query.join(cls.invoice_product).join(InvoiceProductModel.invoice) \
+            .filter(InvoiceModel.program_id == program_id) \
+            .options(contains_eager(cls.invoice_product).contains_eager(InvoiceProductModel.invoice),
+                     contains_eager(cls.invoice_product).joinedload(InvoiceProductModel.product_store)
+                     .joinedload(ProductStoreModel.product).joinedload(ProductModel.weight))
 
     @classmethod
     def all_filtered_by_application(cls, applications: List[int]):
-        return cls.query.filter(cls.application_id.in_(applications)).all()
+        return cls.query.filter(cls.application_id.in_(applications)) \
+            .options(joinedload(cls.application),
+                     joinedload(cls.invoice_product).joinedload(InvoiceProductModel.invoice),
+                     joinedload(cls.invoice_product).joinedload(InvoiceProductModel.product_store)
+                     .joinedload(ProductStoreModel.product).joinedload(ProductModel.weight)).all()
+
+
+@register_backfill
+def backfill_disposed_amounts(db):
+    disposed = select(func.coalesce(func.sum(InvoiceDisposalModel.amount), 0)) \
+        .where(InvoiceDisposalModel.invoice_product_id == InvoiceProductModel.id).scalar_subquery()
+    db.session.execute(update(InvoiceProductModel)
+                       .where(or_(InvoiceProductModel.disposed_amount.is_(None),
+                                  InvoiceProductModel.disposed_amount != disposed))
+                       .values(disposed_amount=disposed)
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
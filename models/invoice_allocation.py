@@ -0,0 +1,150 @@
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, func, update
+
+from helpers.db import db
+from helpers.logger import app_logger
+from models.application import ApplicationModel
+from models.invoice import InvoiceModel, InvoiceProductModel, InvoiceDisposalModel, AMOUNT_TOLERANCE
+from models.record import RecordModel, RecordState
+from models.reference_cache import reference_cache
+
+AMOUNT_DIGITS = 6
+
+
+class InvoiceAllocation:
+    """
+    FIFO allocation of invoice stock to applications. Demand of application is the amount of delivered products
+    (portions times product store weight) which is not disposed yet, it is covered by invoice products
+    with remaining amount from the oldest invoices first. Applications and invoice products are locked until commit,
+    disposals and disposed amounts are written with two statements.
+    """
+
+    def __init__(self, applications: List[ApplicationModel]):
+        if not applications:
+            raise ValueError("List with applications cannot be empty")
+        programs = {application.program_id for application in applications}
+        if len(programs) != 1:
+            raise ValueError("Applications must belong to the same program")
+        self.program_id = programs.pop()
+        self.applications = sorted(applications, key=lambda application: application.id)
+        self.product_stores = {store.id: store for store in reference_cache.product_stores(self.program_id)}
+        self.disposals: List[dict] = []
+        self.disposal_products: List[str] = []
+        self.missing: Dict[int, Dict[str, Optional[float]]] = dict()
+
+    @staticmethod
+    def delivered_portions(application: ApplicationModel) -> Dict[int, int]:
+        return dict(db.session.query(RecordModel.product_store_id,
+                                     func.coalesce(func.sum(RecordModel.delivered_kids_no), 0))
+                    .filter(RecordModel.state == RecordState.DELIVERED,
+                            *RecordModel.application_criteria(application))
+                    .group_by(RecordModel.product_store_id))
+
+    def lock_applications(self):
+        """Concurrent allocation of the same application waits here and computes demand after first one commits"""
+        db.session.query(ApplicationModel.id) \
+            .filter(ApplicationModel.id.in_([application.id for application in self.applications])) \
+            .order_by(ApplicationModel.id).with_for_update().all()
+
+    def demand(self) -> Dict[int, Dict[int, float]]:
+        """
+        Amount of every product store still not disposed per application, product stores without weight
+        cannot be allocated and are reported as missing without amount
+        """
+        application_ids = [application.id for application in self.applications]
+        disposed = defaultdict(float)
+        for (application_id, product_store_id, amount) in db.session.query(
+                InvoiceDisposalModel.application_id, InvoiceProductModel.product_store_id,
+                func.sum(InvoiceDisposalModel.amount)) \
+                .join(InvoiceProductModel, InvoiceDisposalModel.invoice_product_id == InvoiceProductModel.id) \
+                .filter(InvoiceDisposalModel.application_id.in_(application_ids)) \
+                .group_by(InvoiceDisposalModel.application_id, InvoiceProductModel.product_store_id):
+            disposed[(application_id, product_store_id)] = amount
+        demand: Dict[int, Dict[int, float]] = dict()
+        for application in self.applications:
+            for (product_store_id, portions) in InvoiceAllocation.delivered_portions(application).items():
+                weight = self.product_stores[product_store_id].weight
+                if not weight:
+                    if portions:
+                        self.missing.setdefault(application.id, dict())[self.__template_name(product_store_id)] = None
+                    continue
+                amount = round(portions * weight - disposed[(application.id, product_store_id)], AMOUNT_DIGITS)
+                if amount > AMOUNT_TOLERANCE:
+                    demand.setdefault(application.id, dict())[product_store_id] = amount
+        return demand
+
+    @staticmethod
+    def expire_invoice_products(invoice_product_ids):
+        for instance in list(db.session.identity_map.values()):
+            if isinstance(instance, InvoiceProductModel) and instance.id in invoice_product_ids:
+                db.session.expire(instance, ["disposed_amount"])
+
+    def stock(self, product_store_ids) -> Dict[int, deque]:
+        """Invoice products with remaining amount per product store, oldest invoice first, locked in id order"""
+        rows = db.session.query(InvoiceProductModel.id, InvoiceProductModel.product_store_id,
+                                InvoiceProductModel.amount - InvoiceProductModel.disposed_amount,
+                                InvoiceModel.date, InvoiceModel.id) \
+            .join(InvoiceModel, InvoiceProductModel.invoice_id == InvoiceModel.id) \
+            .filter(InvoiceModel.program_id == self.program_id,
+                    InvoiceProductModel.product_store_id.in_(product_store_ids),
+                    InvoiceProductModel.amount - InvoiceProductModel.disposed_amount > AMOUNT_TOLERANCE) \
+            .order_by(InvoiceProductModel.id).with_for_update(of=InvoiceProductModel).all()
+        stock: Dict[int, deque] = defaultdict(deque)
+        for (invoice_product_id, product_store_id, remaining, *_) in sorted(rows, key=lambda r: (r[3], r[4], r[0])):
+            stock[product_store_id].append([invoice_product_id, remaining])
+        return stock
+
+    def __template_name(self, product_store_id):
+        product = self.product_stores[product_store_id].product
+        return product.template_name or product.name
+
+    def __match(self, demand: Dict[int, Dict[int, float]], stock: Dict[int, deque]):
+        for application in self.applications:
+            for (product_store_id, amount) in sorted(demand.get(application.id, dict()).items()):
+                lines = stock[product_store_id]
+                while amount > AMOUNT_TOLERANCE and lines:
+                    line = lines[0]
+                    taken = round(min(amount, line[1]), AMOUNT_DIGITS)
+                    self.disposals.append({'invoice_product_id': line[0], 'application_id': application.id,
+                                           'amount': taken})
+                    self.disposal_products.append(self.__template_name(product_store_id))
+                    amount = round(amount - taken, AMOUNT_DIGITS)
+                    line[1] -= taken
+                    if line[1] <= AMOUNT_TOLERANCE:
+                        lines.popleft()
+                if amount > AMOUNT_TOLERANCE:
+                    self.missing.setdefault(application.id, dict())[self.__template_name(product_store_id)] = amount
+
+    def allocate(self):
+        try:
+            self.lock_applications()
+            demand = self.demand()
+            stock = self.stock({product_store_id for amounts in demand.values() for product_store_id in amounts})
+            self.__match(demand, stock)
+            if self.disposals:
+                db.session.execute(InvoiceDisposalModel.__table__.insert(), self.disposals)
+                disposed = defaultdict(float)
+                for disposal in self.disposals:
+                    disposed[disposal['invoice_product_id']] += disposal['amount']
+                table = InvoiceProductModel.__table__
+                db.session.execute(update(table).where(table.c.id == bindparam("invoice_product_id"))
+                                   .values(disposed_amount=table.c.disposed_amount + bindparam("disposed")),
+                                   [{'invoice_product_id': invoice_product_id, 'disposed': amount}
+                                    for (invoice_product_id, amount) in disposed.items()])
+                InvoiceAllocation.expire_invoice_products(disposed)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        app_logger.info(f"[{self.__class__.__name__}] {len(self.disposals)} disposals for applications "
+                        f"{[application.id for application in self.applications]}, missing: {self.missing}")
+        return self
+
+    def json(self):
+        return {'invoice_disposal': [dict(disposal, product=product)
+                                     for (disposal, product) in zip(self.disposals, self.disposal_products)],
+                'missing': [{'application_id': application_id, 'product': product, 'amount': amount}
+                            for (application_id, products) in self.missing.items()
+                            for (product, amount) in products.items()]}
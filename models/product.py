@@ -1,3 +1,5 @@
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from helpers.db import db
 from models.base_database_query import BaseDatabaseQuery
 
@@ -80,9 +82,10 @@ class ProductModel(db.Model, BaseDatabaseQuery):
     vat = db.Column(db.Float, nullable=False, default=0)
 
     def __init__(self, name, product_type, weight_type, vat=0):
+        from models.reference_cache import reference_cache
         self.name = name
-        self.type_id = ProductTypeModel.find_one_by_name(name=product_type).id
-        self.weight_id = WeightTypeModel.find_one_by_name(name=weight_type).id
+        self.type_id = reference_cache.product_type_by_name(product_type).id
+        self.weight_id = reference_cache.weight_type_by_name(weight_type).id
         self.vat = vat
         self.save_to_db()
 
@@ -104,8 +107,8 @@ class ProductBoxModel(db.Model, BaseDatabaseQuery):
                               backref=db.backref('box', lazy=True))
 
     def __init__(self, name, amount):
-        product = ProductModel.find_one_by_name(name=name)
-        self.product_id = product.id
+        from models.reference_cache import reference_cache
+        self.product_id = reference_cache.product_by_name(name).id
         self.amount = amount
         self.save_to_db()
 
@@ -132,14 +135,45 @@ class ProductStoreModel(db.Model, BaseDatabaseQuery):
     __table_args__ = (db.UniqueConstraint('program_id', 'product_id'),)
 
     def __init__(self, program_id, name, min_amount, weight=0):
+        from models.reference_cache import reference_cache
         self.program_id = program_id
-        self.product_id = ProductModel.find_one_by_name(name).id
+        self.product_id = reference_cache.product_by_name(name).id
         self.min_amount = min_amount
         self.weight = weight
         self.save_to_db()
 
     def is_min_amount_exceeded(self, nick):
-        return [record.contract.school.nick for record in self.records].count(nick) >= self.min_amount
+        from models.record import RecordModel
+        from models.contract import ContractModel
+        from models.school import SchoolModel
+        records_no = db.session.query(db.func.count(RecordModel.id)) \
+            .join(ContractModel, RecordModel.contract_id == ContractModel.id) \
+            .join(SchoolModel, ContractModel.school_id == SchoolModel.id) \
+            .filter(RecordModel.product_store_id == self.id, SchoolModel.nick == nick).scalar()
+        return records_no >= self.min_amount
+
+    @classmethod
+    def remaining_amounts(cls, program_id):
+        """Records left to reach min_amount of every product store for every school in program"""
+        from models.record import RecordModel
+        from models.contract import ContractModel
+        from models.school import SchoolModel
+        stores = db.session.query(cls.id, cls.min_amount, ProductModel.name) \
+            .join(ProductModel, cls.product_id == ProductModel.id) \
+            .filter(cls.program_id == program_id).order_by(ProductModel.name).all()
+        contracts = db.session.query(ContractModel.id, SchoolModel.nick) \
+            .join(SchoolModel, ContractModel.school_id == SchoolModel.id) \
+            .filter(ContractModel.program_id == program_id).order_by(SchoolModel.nick).all()
+        records_no = {(store_id, contract_id): amount for (store_id, contract_id, amount) in
+                      db.session.query(RecordModel.product_store_id, RecordModel.contract_id,
+                                       db.func.count(RecordModel.id))
+                      .join(cls, RecordModel.product_store_id == cls.id)
+                      .filter(cls.program_id == program_id)
+                      .group_by(RecordModel.product_store_id, RecordModel.contract_id)}
+        return [{'nick': nick, 'contract_id': contract_id, 'product_store_id': store_id, 'product': name,
+                 'min_amount': min_amount, 'records': records_no.get((store_id, contract_id), 0),
+                 'remaining': max(min_amount - records_no.get((store_id, contract_id), 0), 0)}
+                for (contract_id, nick) in contracts for (store_id, min_amount, name) in stores]
 
     @classmethod
     def find_by(cls, program_id, name):
@@ -147,18 +181,52 @@ class ProductStoreModel(db.Model, BaseDatabaseQuery):
 
     @classmethod
     def find(cls, program_id, product_type):
+        """Returns ProductStoreSnapshot of program with products of given type from reference cache"""
+        from models.reference_cache import reference_cache
         product_types = []
         if product_type == ProductTypeModel.fruit_veg_name():
-            product_types.append(ProductTypeModel.find_one_by_name(ProductTypeModel.FRUIT_TYPE).id)
-            product_types.append(ProductTypeModel.find_one_by_name(ProductTypeModel.VEGETABLE_TYPE).id)
+            product_types.append(reference_cache.product_type_by_name(ProductTypeModel.FRUIT_TYPE).id)
+            product_types.append(reference_cache.product_type_by_name(ProductTypeModel.VEGETABLE_TYPE).id)
         else:
-            product_types.append(ProductTypeModel.find_one_by_name(product_type).id)
-        results = []
-        for type_id in product_types:
-            results.extend(cls.query.filter_by(program_id=program_id).join(cls.product).filter_by(type_id=type_id).all())
-        return results
+            product_types.append(reference_cache.product_type_by_name(product_type).id)
+        stores = reference_cache.product_stores(int(program_id))
+        return [store for type_id in product_types for store in stores if store.product.type.id == type_id]
 
     def json(self):
         data: {} = super().json()
         data['product'] = self.product.json()
         return data
+
+
+REFERENCE_DATA_CHANGED = "reference_data_changed"
+REFERENCE_MODELS = (WeightTypeModel, ProductTypeModel, ProductModel, ProductStoreModel)
+
+
+def _reference_data_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[REFERENCE_DATA_CHANGED] = True
+
+
+for _model in REFERENCE_MODELS:
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _reference_data_changed)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+@event.listens_for(db.session, "after_bulk_delete")
+def _reference_data_bulk_changed(context):
+    if context.mapper.class_ in REFERENCE_MODELS:
+        context.session.info[REFERENCE_DATA_CHANGED] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_reference_cache(session):
+    if session.info.pop(REFERENCE_DATA_CHANGED, False):
+        from models.reference_cache import reference_cache
+        reference_cache.invalidate()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_reference_data_changes(session):
+    session.info.pop(REFERENCE_DATA_CHANGED, None)
@@ -1,14 +1,18 @@
 import enum
+from typing import Dict, Iterable, List, Tuple
 
 from helpers.date_converter import DateConverter
 from helpers.db import db
-from models.application import ApplicationType, ApplicationModel
+from models.application import ApplicationType, ApplicationModel, application_contract, application_week
 from models.base_database_query import BaseDatabaseQuery
-from models.contract import ContractModel
-from models.product import ProductTypeModel
+from models.contract import ContractModel, AnnexModel, TimedAnnexModel
+from models.product import ProductTypeModel, ProductModel, ProductStoreModel
+from models.program import ProgramModel
+from models.school import SchoolModel
 from models.week import WeekModel
 from helpers.logger import app_logger
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, update, case, func, and_, or_, exists, event
+from sqlalchemy.orm import joinedload, object_session
 
 
 class RecordState(enum.Enum):
@@ -45,50 +49,99 @@ class RecordModel(db.Model, BaseDatabaseQuery):
     week = db.relationship('WeekModel',
                            backref=db.backref('records', lazy=True))
 
-    __table_args__ = (db.UniqueConstraint('date', 'product_type_id', 'contract_id'),)
+    __table_args__ = (db.UniqueConstraint('date', 'product_type_id', 'contract_id'),
+                      db.Index('ix_record_product_store_id_contract_id', 'product_store_id', 'contract_id'))
 
     def __init__(self, date, contract_id, product_store):
         self.date = DateConverter.convert_to_date(date)
         self.state = RecordState.PLANNED
         self.product_store_id = product_store.id
         self.contract_id = contract_id
-        self.week_id = WeekModel.find_by_date(self.date).id
+        self.week_id = WeekModel.find_by_date(self.date, product_store.program_id).id
         self.product_type_id = product_store.product.type.id
 
     def is_in_middle(self):
-        is_current_dairy_type = ProductTypeModel.find_by_id(self.product_type_id).is_dairy()
+        from models.reference_cache import reference_cache
+        is_current_dairy_type = reference_cache.product_type(self.product_type_id).is_dairy()
         previous_records_no = [record.no for record in
                                RecordModel.query.join(RecordModel.contract).filter_by(id=self.contract_id).order_by(
                                    RecordModel.no)
-                               if ProductTypeModel.find_by_id(record.product_type_id).is_dairy() == is_current_dairy_type]
+                               if reference_cache.product_type(record.product_type_id).is_dairy() == is_current_dairy_type]
         return self.no != previous_records_no[-1]
 
     def __assign_record_no(self) -> bool:
-        is_current_dairy_type = ProductTypeModel.find_by_id(self.product_type_id).is_dairy()
-        previous_records_no = [record for record in RecordModel.query.join(RecordModel.contract).filter_by(id=self.contract_id).order_by(RecordModel.date)
-                               if ProductTypeModel.find_by_id(record.product_type_id).is_dairy() == is_current_dairy_type]
-        numbers_changed = False
-        for i in range(len(previous_records_no)):
-            if previous_records_no[i].no != i + 1:
-                if previous_records_no[i].no:
-                    previous_records_no[i].no = i + 1
-                    numbers_changed = True
-                    app_logger.debug(f"Overriding the number for {repr(self)} {previous_records_no[i].no} -> {i+1}")
-                elif previous_records_no[i].date == self.date:
-                    previous_records_no[i].no = i + 1
-        return numbers_changed
+        return bool(RecordModel.renumber([self.contract_id], [self.id]))
+
+    @classmethod
+    def renumber(cls, contract_ids, record_ids) -> List[int]:
+        """
+        Numbers records of contracts by date, separately for dairy and fruit-veg records, with one UPDATE.
+        Only the product kinds of records from record_ids are renumbered. Records without a number get one when they
+        are delivered on the same date as a record from record_ids, numbers of other records are only fixed when
+        they changed.
+        Returns ids of contracts with an already assigned number changed.
+        """
+        is_dairy = case((ProductTypeModel.name == ProductTypeModel.DAIRY_TYPE, 1), else_=0)
+        numbered = select(cls.id.label("id"), cls.no.label("old_no"), cls.contract_id.label("contract_id"),
+                          cls.date.label("date"), is_dairy.label("is_dairy"),
+                          func.row_number().over(partition_by=(cls.contract_id, is_dairy),
+                                                 order_by=(cls.date, cls.id)).label("new_no")) \
+            .join(ProductTypeModel, cls.product_type_id == ProductTypeModel.id) \
+            .where(cls.contract_id.in_(contract_ids)) \
+            .subquery()
+        assigned = select(cls.contract_id.label("contract_id"), cls.date.label("date"), is_dairy.label("is_dairy")) \
+            .join(ProductTypeModel, cls.product_type_id == ProductTypeModel.id) \
+            .where(cls.id.in_(record_ids)) \
+            .subquery()
+        same_kind = and_(assigned.c.contract_id == numbered.c.contract_id, assigned.c.is_dairy == numbered.c.is_dairy)
+        number_changed = and_(func.coalesce(numbered.c.old_no, 0) != 0, numbered.c.old_no != numbered.c.new_no,
+                              exists().where(same_kind))
+        number_missing = and_(func.coalesce(numbered.c.old_no, 0) == 0,
+                              exists().where(same_kind, assigned.c.date == numbered.c.date))
+        db.session.flush()
+        changed = list(db.session.execute(select(numbered.c.contract_id).where(number_changed)
+                                          .distinct().order_by(numbered.c.contract_id)).scalars())
+        record = cls.__table__
+        if db.engine.dialect.name == "sqlite":
+            # SQLAlchemy can not render UPDATE FROM for SQLite
+            new_no = select(numbered.c.new_no).where(numbered.c.id == record.c.id).scalar_subquery()
+            statement = update(record).values(no=new_no) \
+                .where(record.c.id.in_(select(numbered.c.id).where(or_(number_changed, number_missing))))
+        else:
+            statement = update(record).values(no=numbered.c.new_no) \
+                .where(record.c.id == numbered.c.id, or_(number_changed, number_missing))
+        db.session.execute(statement)
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, RecordModel) and obj.contract_id in contract_ids:
+                db.session.expire(obj, ["no"])
+        if changed:
+            app_logger.debug(f"Overriding record numbers for contracts {changed}")
+        return changed
+
+    @classmethod
+    def assign_numbers(cls, records) -> List[int]:
+        """Bulk version of change_state(RecordState.ASSIGN_NUMBER), returns contracts with changed numbers"""
+        for record in records:
+            record.state = RecordState.ASSIGN_NUMBER
+        return cls.renumber({record.contract_id for record in records}, [record.id for record in records])
+
+    @staticmethod
+    def format_record_no(no, is_dairy, contract_no, program):
+        if not no:
+            return "-"
+        product_prefix = "NB" if is_dairy else "WO"
+        return f"{product_prefix} {no}/{contract_no}/{program}"
 
     def get_record_no(self):
+        if not self.no:
+            return "-"
         product_type_obj: ProductTypeModel = getattr(self, 'product_type', None)
-        if product_type_obj is not None:
-            product_prefix = "NB" if product_type_obj.is_dairy() else "WO"
-        else:
+        if product_type_obj is None:
             # fallback, but ideally this is never needed!
-            product_prefix = "NB" if ProductTypeModel.find_by_id(self.product_type_id).is_dairy() else "WO"
-        if self.no:
-            return f"{product_prefix} {self.no}/{self.contract.contract_no}/{self.contract.program}"
-        else:
-            return f"-"
+            from models.reference_cache import reference_cache
+            product_type_obj = reference_cache.product_type(self.product_type_id)
+        return RecordModel.format_record_no(self.no, product_type_obj.is_dairy(), self.contract.contract_no,
+                                            self.contract.program)
 
     def __str__(self):
         return f"{self.product_store.product.name}  {self.delivered_kids_no}"
@@ -110,16 +163,53 @@ class RecordModel(db.Model, BaseDatabaseQuery):
         return cls.query.filter_by(week_id=week_id).join(cls.product_store)
 
     def json(self):
+        from models.reference_cache import reference_cache
         data: {} = super().json()
         DateConverter.replace_date_to_converted(data, "date")
         DateConverter.replace_date_to_converted(data, "delivery_date")
         if data["state"]:
             data["state"] = RecordState(data["state"]).name
-        data["product_type"] = ProductTypeModel.find_by_id(data["product_type_id"]).json()
+        data["product_type"] = reference_cache.product_type(data["product_type_id"]).json()
         data["no"] = self.get_record_no()
         del data["product_type_id"]
         return data
 
+    @classmethod
+    def json_filtered_by_program(cls, program_id):
+        """Same result as json() of every record in program, built from one joined query"""
+        return cls.json_filtered(ContractModel.program_id == program_id)
+
+    @classmethod
+    def json_by_ids(cls, ids):
+        return cls.json_filtered(cls.id.in_(ids))
+
+    @classmethod
+    def json_filtered(cls, *criteria):
+        query = select(cls.__table__,
+                       ProductTypeModel.name.label("product_type_name"),
+                       ContractModel.contract_no.label("contract_no"),
+                       ProgramModel.semester_no.label("semester_no"),
+                       ProgramModel.school_year.label("school_year")) \
+            .join(ContractModel, cls.contract_id == ContractModel.id) \
+            .join(ProgramModel, ContractModel.program_id == ProgramModel.id) \
+            .join(ProductTypeModel, cls.product_type_id == ProductTypeModel.id) \
+            .where(*criteria) \
+            .order_by(cls.id)
+        results = []
+        for row in db.session.execute(query).mappings():
+            data = {column.name: row[column.name] for column in cls.__table__.columns
+                    if column.name != "product_type_id"}
+            DateConverter.replace_date_to_converted(data, "date")
+            DateConverter.replace_date_to_converted(data, "delivery_date")
+            if data["state"]:
+                data["state"] = RecordState(data["state"]).name
+            data["product_type"] = row["product_type_name"]
+            is_dairy = row["product_type_name"] == ProductTypeModel.DAIRY_TYPE
+            data["no"] = RecordModel.format_record_no(row["no"], is_dairy, row["contract_no"],
+                                                      f"{row['semester_no']}/{row['school_year']}")
+            results.append(data)
+        return results
+
     def change_state(self, state, **kwargs):
         numbers_changed = False
         if isinstance(state, int):
@@ -169,22 +259,94 @@ class RecordModel(db.Model, BaseDatabaseQuery):
                     ).filter(cls.id.in_(ids)).all()
 
     @classmethod
-    def filter_records(cls, application: ApplicationModel, state=RecordState.DELIVERED):
+    def application_criteria(cls, application: ApplicationModel, contract_ids=None):
+        """Filter of records which belong to application weeks, contracts and product types"""
+        from models.reference_cache import reference_cache
         weeks = [week.id for week in application.weeks]
-        contracts = [contract.id for contract in application.contracts]
+        contracts = [contract.id for contract in application.contracts] if contract_ids is None else contract_ids
         product_types = []
         if application.type == ApplicationType.DAIRY or application.type == ApplicationType.FULL:
-            product_types.append(ProductTypeModel.find_one_by_name(ProductTypeModel.DAIRY_TYPE).id)
+            product_types.append(reference_cache.product_type_by_name(ProductTypeModel.DAIRY_TYPE).id)
         if application.type == ApplicationType.FRUIT_VEG or application.type == ApplicationType.FULL:
-            product_types.append(ProductTypeModel.find_one_by_name(ProductTypeModel.FRUIT_TYPE).id)
-            product_types.append(ProductTypeModel.find_one_by_name(ProductTypeModel.VEGETABLE_TYPE).id)
-        return cls.query.filter(cls.state == state,
-                                cls.week_id.in_(weeks),
-                                cls.contract_id.in_(contracts),
-                                cls.product_type_id.in_(product_types)).order_by(RecordModel.date).all()
+            product_types.append(reference_cache.product_type_by_name(ProductTypeModel.FRUIT_TYPE).id)
+            product_types.append(reference_cache.product_type_by_name(ProductTypeModel.VEGETABLE_TYPE).id)
+        return [cls.week_id.in_(weeks), cls.contract_id.in_(contracts), cls.product_type_id.in_(product_types)]
+
+    @classmethod
+    def filter_application_records(cls, application: ApplicationModel, states, contract_ids=None):
+        """Records of application weeks, contracts and product types in given states ordered by date"""
+        from models.product import ProductStoreModel, ProductModel
+        return cls.query.options(joinedload(cls.product_store).joinedload(ProductStoreModel.product)
+                                 .joinedload(ProductModel.type)) \
+            .filter(cls.state.in_(states), *cls.application_criteria(application, contract_ids)) \
+            .order_by(RecordModel.date).all()
+
+    @classmethod
+    def filter_records(cls, application: ApplicationModel, state=RecordState.DELIVERED):
+        return cls.filter_application_records(application, [state])
 
     @classmethod
     def filter_records_by_contract(cls, application: ApplicationModel, contract: ContractModel,
                                    state=RecordState.DELIVERED):
-        records = cls.filter_records(application, state)
-        return [record for record in records if record.contract_id == contract.id]
+        return cls.filter_application_records(application, [state], [contract.id])
+
+
+class ApplicationRecords:
+    """
+    Records of an application fetched with one query and partitioned by contract and state,
+    shared by consistency check, statements and application document.
+    """
+    STATES = (RecordState.DELIVERED, RecordState.PLANNED, RecordState.GENERATED, RecordState.GENERATION_IN_PROGRESS,
+              RecordState.DELIVERY_PLANNED)
+
+    def __init__(self, application: ApplicationModel, states: Iterable[RecordState] = STATES):
+        self.states = tuple(states)
+        self.records: List[RecordModel] = RecordModel.filter_application_records(application, self.states)
+        self.__partitions: Dict[Tuple[int, RecordState], List[RecordModel]] = dict()
+        for record in self.records:
+            self.__partitions.setdefault((record.contract_id, record.state), []).append(record)
+
+    def by_contract(self, contract_id, states: Iterable[RecordState] = (RecordState.DELIVERED,)) -> List[RecordModel]:
+        """Records of contract ordered by date within each state, states in given order"""
+        return [record for state in states for record in self.__partitions.get((contract_id, state), [])]
+
+    def in_state(self, state=RecordState.DELIVERED) -> List[RecordModel]:
+        return [record for record in self.records if record.state == state]
+
+
+APPLICATION_DATA_CHANGED = "application_data_changed"
+APPLICATION_DATA_MODELS = (RecordModel, ApplicationModel, ContractModel, AnnexModel, TimedAnnexModel, WeekModel,
+                           ProgramModel, SchoolModel, ProductModel, ProductStoreModel)
+APPLICATION_DATA_TABLES = frozenset([model.__table__ for model in APPLICATION_DATA_MODELS] +
+                                    [application_contract, application_week])
+
+
+def _application_data_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info[APPLICATION_DATA_CHANGED] = True
+
+
+for _model in APPLICATION_DATA_MODELS:
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _application_data_changed)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def _application_data_statement(orm_execute_state):
+    # records are inserted, renumbered and deleted with statements which bypass mapper events
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and orm_execute_state.statement.table in APPLICATION_DATA_TABLES:
+        orm_execute_state.session.info[APPLICATION_DATA_CHANGED] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_validations(session):
+    if session.info.pop(APPLICATION_DATA_CHANGED, False):
+        from helpers.application_consistency import invalidate_validations
+        invalidate_validations()
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_application_data_changes(session):
+    session.info.pop(APPLICATION_DATA_CHANGED, None)
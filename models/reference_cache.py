@@ -0,0 +1,155 @@
+from os import getpid
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, List, Optional
+
+from redis import RedisError
+from sqlalchemy.exc import NoResultFound
+
+from helpers.logger import app_logger
+from models.snapshot import ProductTypeSnapshot, WeightTypeSnapshot, ProductSnapshot, ProductStoreSnapshot, \
+    load_product_types, load_weight_types, load_products, load_product_stores
+
+REFERENCE_DATA_VERSION = "referenceDataVersion"
+REFERENCE_DATA_CHANNEL = "referenceDataChanged"
+UNAVAILABLE_DATA_TTL = 30
+RECONNECT_BACKOFF = 1
+RECONNECT_BACKOFF_MAX = 60
+
+
+def _find_one(values: Dict, key, kind):
+    try:
+        return values[key]
+    except KeyError:
+        raise NoResultFound(f"No {kind} found for {key}")
+
+
+class ReferenceData:
+    """Product types, weight types, products and product stores of all programs loaded at once"""
+    __slots__ = ("version", "loaded_at", "product_types", "product_types_by_name", "weight_types",
+                 "weight_types_by_name", "products", "products_by_name", "products_by_template_name",
+                 "product_stores", "product_stores_by_program")
+
+    def __init__(self, version: Optional[int]):
+        self.version = version
+        self.loaded_at = monotonic()
+        self.product_types: Dict[int, ProductTypeSnapshot] = load_product_types()
+        self.product_types_by_name = {product_type.name: product_type for product_type in self.product_types.values()}
+        self.weight_types: Dict[int, WeightTypeSnapshot] = load_weight_types()
+        self.weight_types_by_name = {weight_type.name: weight_type for weight_type in self.weight_types.values()}
+        self.products: Dict[int, ProductSnapshot] = load_products(types=self.product_types,
+                                                                  weights=self.weight_types)
+        self.products_by_name = {product.name: product for product in self.products.values()}
+        self.products_by_template_name = {product.template_name: product for product in self.products.values()
+                                          if product.template_name}
+        self.product_stores: Dict[int, ProductStoreSnapshot] = load_product_stores(products=self.products)
+        self.product_stores_by_program: Dict[int, List[ProductStoreSnapshot]] = dict()
+        for store in sorted(self.product_stores.values(), key=lambda product_store: product_store.id):
+            self.product_stores_by_program.setdefault(store.program_id, []).append(store)
+
+
+class ReferenceCache:
+    """
+    Process local copy of rarely changing lookup tables: product types, weight types, products and product stores.
+    Data is loaded once with a few queries and kept until any of these tables is written. Writer increments
+    version key in Redis and publishes new version, every process listening on the channel reloads on next lookup.
+    Without Redis data loaded from database is kept for UNAVAILABLE_DATA_TTL seconds and subscribing is retried
+    with exponential backoff.
+    """
+
+    def __init__(self, redis_connection=None):
+        self.__redis_connection = redis_connection
+        self.__data: Optional[ReferenceData] = None
+        self.__announced_version: Optional[int] = None
+        self.__listener = None
+        self.__listener_pid = None
+        self.__reconnect_at = 0
+        self.__reconnect_backoff = RECONNECT_BACKOFF
+        self.__lock = Lock()
+
+    @property
+    def redis_connection(self):
+        if self.__redis_connection is None:
+            from helpers.redis_commands import conn
+            self.__redis_connection = conn
+        return self.__redis_connection
+
+    def __on_version(self, message):
+        self.__announced_version = int(message["data"])
+
+    def __is_listening(self) -> bool:
+        if self.__listener is not None and self.__listener_pid == getpid() and self.__listener.is_alive():
+            return True
+        if monotonic() < self.__reconnect_at:
+            return False
+        try:
+            pubsub = self.redis_connection.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{REFERENCE_DATA_CHANNEL: self.__on_version})
+            self.__listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except RedisError as e:
+            app_logger.warning(f"[{self.__class__.__name__}] Redis not available, retry in "
+                               f"{self.__reconnect_backoff}s: {e}")
+            self.__listener = None
+            self.__reconnect_at = monotonic() + self.__reconnect_backoff
+            self.__reconnect_backoff = min(self.__reconnect_backoff * 2, RECONNECT_BACKOFF_MAX)
+            return False
+        self.__listener_pid = getpid()
+        self.__reconnect_backoff = RECONNECT_BACKOFF
+        self.__data = None
+        return True
+
+    def __is_valid(self, data: Optional[ReferenceData], listening: bool) -> bool:
+        if data is None:
+            return False
+        if listening and data.version is not None:
+            return self.__announced_version is None or self.__announced_version <= data.version
+        return monotonic() - data.loaded_at < UNAVAILABLE_DATA_TTL
+
+    def data(self) -> ReferenceData:
+        with self.__lock:
+            listening = self.__is_listening()
+            if self.__is_valid(self.__data, listening):
+                return self.__data
+            try:
+                version = int(self.redis_connection.get(REFERENCE_DATA_VERSION) or 0)
+            except RedisError as e:
+                app_logger.warning(f"[{self.__class__.__name__}] Failed to read version: {e}")
+                version = None
+            self.__data = ReferenceData(version)
+            return self.__data
+
+    def product_type(self, product_type_id) -> Optional[ProductTypeSnapshot]:
+        return self.data().product_types.get(product_type_id)
+
+    def product_type_by_name(self, name) -> ProductTypeSnapshot:
+        return _find_one(self.data().product_types_by_name, name, "product type")
+
+    def product_types(self) -> Iterable[ProductTypeSnapshot]:
+        return self.data().product_types.values()
+
+    def weight_type_by_name(self, name) -> WeightTypeSnapshot:
+        return _find_one(self.data().weight_types_by_name, name, "weight type")
+
+    def product_by_name(self, name) -> ProductSnapshot:
+        return _find_one(self.data().products_by_name, name, "product")
+
+    def products_by_template_names(self, template_names) -> Dict[str, ProductSnapshot]:
+        products = self.data().products_by_template_name
+        return {name: products[name] for name in template_names if name in products}
+
+    def product_stores(self, program_id) -> List[ProductStoreSnapshot]:
+        return self.data().product_stores_by_program.get(program_id, [])
+
+    def invalidate(self):
+        with self.__lock:
+            self.__data = None
+        try:
+            version = self.redis_connection.incr(REFERENCE_DATA_VERSION)
+            self.redis_connection.publish(REFERENCE_DATA_CHANNEL, version)
+        except RedisError as e:
+            app_logger.error(f"[{self.__class__.__name__}] Failed to publish new version: {e}")
+            return
+        app_logger.debug(f"[{self.__class__.__name__}] Published version {version}")
+
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,52 @@
+from typing import Callable, List
+
+from sqlalchemy import inspect, text
+
+from helpers.logger import app_logger
+
+backfills: List[Callable] = []
+
+
+def register_backfill(func):
+    """Registers function(db) run after schema update to fill values of newly added columns"""
+    backfills.append(func)
+    return func
+
+
+def add_missing_columns(db) -> List[str]:
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                app_logger.error(f"Column {table.name}.{column.name} can not be added without default value")
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            added.append(f"{table.name}.{column.name}")
+    db.session.commit()
+    return added
+
+
+def create_missing_indexes(db):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def upgrade_schema(db, backfill_functions=None):
+    """
+    Brings tables created by earlier versions up to date with models: adds new nullable columns,
+    creates new indexes and fills new columns with registered backfills. Safe to run many times.
+    """
+    added = add_missing_columns(db)
+    if added:
+        app_logger.info(f"Added columns: {added}")
+    for backfill in (backfills if backfill_functions is None else backfill_functions):
+        backfill(db)
+    create_missing_indexes(db)
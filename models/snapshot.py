@@ -0,0 +1,301 @@
+from dataclasses import dataclass, replace
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from helpers.db import db
+from models.contract import ContractModel, AnnexModel, TimedAnnexModel, KidsNoIndex
+from models.product import ProductTypeModel, WeightTypeModel, ProductModel, ProductStoreModel
+from models.program import ProgramModel
+from models.record import RecordModel
+from models.school import SchoolModel
+from models.week import WeekModel
+
+
+class Snapshot:
+    """
+    Base of immutable copies of database rows used by document generators.
+    Snapshots are not bound to session, so they can be read from any thread and pickled to render processes.
+    Methods of models are reused, snapshot has the same attribute names as its model.
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_row(cls, row, **related):
+        return cls(**{name: related[name] if name in related else row[name] for name in cls.__slots__})
+
+
+@dataclass(frozen=True)
+class ProductTypeSnapshot(Snapshot):
+    __slots__ = ("id", "name")
+    id: int
+    name: str
+
+    json = ProductTypeModel.json
+    is_dairy = ProductTypeModel.is_dairy
+    is_fruit_veg = ProductTypeModel.is_fruit_veg
+    get_complementary_type = ProductTypeModel.get_complementary_type
+    template_name = ProductTypeModel.template_name
+
+
+@dataclass(frozen=True)
+class WeightTypeSnapshot(Snapshot):
+    __slots__ = ("id", "name")
+    id: int
+    name: str
+
+    json = WeightTypeModel.json
+    is_kg = WeightTypeModel.is_kg
+
+
+@dataclass(frozen=True)
+class ProductSnapshot(Snapshot):
+    __slots__ = ("id", "name", "template_name", "vat", "type", "weight")
+    id: int
+    name: str
+    template_name: Optional[str]
+    vat: float
+    type: ProductTypeSnapshot
+    weight: WeightTypeSnapshot
+
+    json = ProductModel.json
+
+
+@dataclass(frozen=True)
+class ProductStoreSnapshot(Snapshot):
+    __slots__ = ("id", "program_id", "weight", "min_amount", "product")
+    id: int
+    program_id: int
+    weight: Optional[float]
+    min_amount: int
+    product: ProductSnapshot
+
+    def json(self):
+        return {'id': self.id, 'program_id': self.program_id, 'product_id': self.product.id, 'weight': self.weight,
+                'min_amount': self.min_amount, 'product': self.product.json()}
+
+
+@dataclass(frozen=True)
+class WeekSnapshot(Snapshot):
+    __slots__ = ("id", "week_no", "start_date", "end_date", "program_id")
+    id: int
+    week_no: int
+    start_date: object
+    end_date: object
+    program_id: int
+
+    __str__ = WeekModel.__str__
+    str_for_docs = WeekModel.str_for_docs
+
+
+@dataclass(frozen=True)
+class ProgramSnapshot(Snapshot):
+    __slots__ = ("id", "semester_no", "school_year", "start_date", "end_date", "fruitVeg_price", "dairy_price",
+                 "weeks")
+    id: int
+    semester_no: int
+    school_year: str
+    start_date: object
+    end_date: object
+    fruitVeg_price: Optional[float]
+    dairy_price: Optional[float]
+    weeks: Tuple[WeekSnapshot, ...]
+
+    __str__ = ProgramModel.__str__
+    get_current_semester = ProgramModel.get_current_semester
+    get_main_dir = ProgramModel.get_main_dir
+    get_part_with_year_and_sem = ProgramModel.get_part_with_year_and_sem
+
+
+@dataclass(frozen=True)
+class SchoolSnapshot(Snapshot):
+    __slots__ = ("id", "nick", "name", "address", "city", "nip", "regon", "email", "phone", "responsible_person",
+                 "representative", "representative_nip", "representative_regon")
+    id: int
+    nick: str
+    name: Optional[str]
+    address: Optional[str]
+    city: Optional[str]
+    nip: Optional[str]
+    regon: Optional[str]
+    email: Optional[str]
+    phone: Optional[str]
+    responsible_person: Optional[str]
+    representative: Optional[str]
+    representative_nip: Optional[str]
+    representative_regon: Optional[str]
+
+    fill_responsible_person = SchoolModel.fill_responsible_person
+
+
+@dataclass(frozen=True)
+class TimedAnnexSnapshot(Snapshot):
+    __slots__ = ("id", "validity_date_end")
+    id: int
+    validity_date_end: object
+
+
+@dataclass(frozen=True)
+class AnnexSnapshot(Snapshot):
+    __slots__ = ("id", "no", "contract_id", "validity_date", "fruitVeg_products", "dairy_products", "timed_annex")
+    id: int
+    no: int
+    contract_id: int
+    validity_date: object
+    fruitVeg_products: int
+    dairy_products: int
+    timed_annex: Tuple[TimedAnnexSnapshot, ...]
+
+    get_validity_date_end = AnnexModel.get_validity_date_end
+
+
+@dataclass(frozen=True)
+class ContractSnapshot(Snapshot):
+    __slots__ = ("id", "contract_no", "contract_year", "validity_date", "fruitVeg_products", "dairy_products",
+                 "school_id", "program_id", "school", "program", "annex", "kids_no_index")
+    id: int
+    contract_no: str
+    contract_year: int
+    validity_date: object
+    fruitVeg_products: int
+    dairy_products: int
+    school_id: int
+    program_id: int
+    school: SchoolSnapshot
+    program: ProgramSnapshot
+    annex: Tuple[AnnexSnapshot, ...]
+    kids_no_index: Optional[KidsNoIndex]
+
+    __str__ = ContractModel.__str__
+    get_kids_no = ContractModel.get_kids_no
+
+    def get_kids_no_index(self) -> KidsNoIndex:
+        return self.kids_no_index
+
+
+@dataclass(frozen=True)
+class RecordSnapshot(Snapshot):
+    __slots__ = ("id", "no", "date", "delivery_date", "delivered_kids_no", "state", "contract_id", "week_id",
+                 "product_type_id", "product_store_id", "product_type", "product_store", "contract", "week")
+    id: int
+    no: Optional[int]
+    date: object
+    delivery_date: object
+    delivered_kids_no: Optional[int]
+    state: object
+    contract_id: int
+    week_id: int
+    product_type_id: int
+    product_store_id: int
+    product_type: ProductTypeSnapshot
+    product_store: ProductStoreSnapshot
+    contract: ContractSnapshot
+    week: WeekSnapshot
+
+    __str__ = RecordModel.__str__
+    get_record_no = RecordModel.get_record_no
+
+
+def _rows(model, *criteria, order_by=None):
+    query = select(model.__table__).where(*criteria)
+    if order_by is not None:
+        query = query.order_by(order_by)
+    return db.session.execute(query).mappings().all()
+
+
+def _by_id(rows: Iterable, snapshot_cls, **related) -> Dict[int, Snapshot]:
+    return {row["id"]: snapshot_cls.from_row(row, **related) for row in rows}
+
+
+def load_product_types() -> Dict[int, ProductTypeSnapshot]:
+    return _by_id(_rows(ProductTypeModel), ProductTypeSnapshot)
+
+
+def load_weight_types() -> Dict[int, WeightTypeSnapshot]:
+    return _by_id(_rows(WeightTypeModel), WeightTypeSnapshot)
+
+
+def load_products(*criteria, types=None, weights=None) -> Dict[int, ProductSnapshot]:
+    types = load_product_types() if types is None else types
+    weights = load_weight_types() if weights is None else weights
+    return {row["id"]: ProductSnapshot.from_row(row, type=types[row["type_id"]], weight=weights[row["weight_id"]])
+            for row in _rows(ProductModel, *criteria)}
+
+
+def load_product_stores(product_store_ids=None, types=None, products=None) -> Dict[int, ProductStoreSnapshot]:
+    """Product stores of given ids, all product stores when ids are not given"""
+    criteria = [] if product_store_ids is None else [ProductStoreModel.id.in_(product_store_ids)]
+    stores = _rows(ProductStoreModel, *criteria)
+    if products is None:
+        products = load_products(ProductModel.id.in_({row["product_id"] for row in stores}), types=types)
+    return {row["id"]: ProductStoreSnapshot.from_row(row, product=products[row["product_id"]]) for row in stores}
+
+
+def load_weeks(*criteria) -> Dict[int, WeekSnapshot]:
+    return _by_id(_rows(WeekModel, *criteria, order_by=WeekModel.start_date), WeekSnapshot)
+
+
+def load_programs(program_ids, with_weeks=False) -> Dict[int, ProgramSnapshot]:
+    weeks: Dict[int, List[WeekSnapshot]] = {program_id: [] for program_id in program_ids}
+    if with_weeks:
+        for week in load_weeks(WeekModel.program_id.in_(program_ids)).values():
+            weeks[week.program_id].append(week)
+    return {row["id"]: ProgramSnapshot.from_row(row, weeks=tuple(weeks[row["id"]]))
+            for row in _rows(ProgramModel, ProgramModel.id.in_(program_ids))}
+
+
+def load_annexes(contract_ids) -> Dict[int, Tuple[AnnexSnapshot, ...]]:
+    annexes = _rows(AnnexModel, AnnexModel.contract_id.in_(contract_ids), order_by=AnnexModel.validity_date.desc())
+    timed_annexes = {row["annex_id"]: (TimedAnnexSnapshot.from_row(row),)
+                     for row in _rows(TimedAnnexModel, TimedAnnexModel.annex_id.in_({row["id"] for row in annexes}))}
+    annexes = sorted(annexes, key=itemgetter("contract_id"))
+    return {contract_id: tuple(AnnexSnapshot.from_row(row, timed_annex=timed_annexes.get(row["id"], tuple()))
+                               for row in rows)
+            for (contract_id, rows) in groupby(annexes, key=itemgetter("contract_id"))}
+
+
+def load_contracts(contract_ids, with_weeks=False) -> Dict[int, ContractSnapshot]:
+    """Loads contracts with schools, programs and annexes, one query per table"""
+    contracts = _rows(ContractModel, ContractModel.id.in_(contract_ids))
+    schools = _by_id(_rows(SchoolModel, SchoolModel.id.in_({row["school_id"] for row in contracts})), SchoolSnapshot)
+    programs = load_programs({row["program_id"] for row in contracts}, with_weeks=with_weeks)
+    annexes = load_annexes(contract_ids)
+    result = dict()
+    for row in contracts:
+        contract = ContractSnapshot.from_row(row, school=schools[row["school_id"]], program=programs[row["program_id"]],
+                                             annex=annexes.get(row["id"], tuple()), kids_no_index=None)
+        result[row["id"]] = replace(contract, kids_no_index=KidsNoIndex(contract))
+    return result
+
+
+def load_records(*criteria) -> List[RecordSnapshot]:
+    """Loads records with everything needed by delivery and summary documents, one query per table"""
+    records = _rows(RecordModel, *criteria, order_by=RecordModel.id)
+    if not records:
+        return []
+    product_types = load_product_types()
+    product_stores = load_product_stores({row["product_store_id"] for row in records}, product_types)
+    contracts = load_contracts({row["contract_id"] for row in records})
+    weeks = load_weeks(WeekModel.id.in_({row["week_id"] for row in records}))
+    return [RecordSnapshot.from_row(row, product_type=product_types[row["product_type_id"]],
+                                    product_store=product_stores[row["product_store_id"]],
+                                    contract=contracts[row["contract_id"]],
+                                    week=weeks[row["week_id"]])
+            for row in records]
+
+
+def load_records_by_ids(record_ids) -> List[RecordSnapshot]:
+    return load_records(RecordModel.id.in_(record_ids))
+
+
+def load_records_by_week(week_id) -> List[RecordSnapshot]:
+    return load_records(RecordModel.week_id == week_id)
@@ -1,4 +1,5 @@
-import sqlalchemy.exc
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from helpers.db import db
 from models.base_database_query import BaseDatabaseQuery
 from helpers.date_converter import DateConverter
@@ -36,12 +37,10 @@ class WeekModel(db.Model, BaseDatabaseQuery):
                f"- {DateConverter.convert_date_to_string(self.end_date)}"
 
     @classmethod
-    def find_by_date(cls, date):
-        try:
-            res = cls.query.filter(WeekModel.start_date <= date).filter(date <= WeekModel.end_date).one()
-        except sqlalchemy.exc.MultipleResultsFound:
-            raise ValueError(f"More than one week found for date: {date}. Weeks should never overlap.")
-        return res
+    def find_by_date(cls, date, program_id=None):
+        """Returns WeekSnapshot from week calendar of the program, or of all programs when program_id is not given"""
+        from helpers.week_calendar import week_calendar
+        return week_calendar.find_by_date(date, program_id)
 
     @classmethod
     def find(cls, week_no, program_id):
@@ -56,3 +55,38 @@ class WeekModel(db.Model, BaseDatabaseQuery):
         return "{0}-{1}\n{2}".format(DateConverter.convert_date_to_string(self.start_date, "%d.%m"),
                                      DateConverter.convert_date_to_string(self.end_date, "%d.%m"),
                                      DateConverter.convert_date_to_string(self.end_date, "%Y"))
+
+
+INVALIDATED_WEEK_PROGRAMS = "invalidated_week_programs"
+
+
+@event.listens_for(WeekModel, "after_insert")
+@event.listens_for(WeekModel, "after_update")
+@event.listens_for(WeekModel, "after_delete")
+def _week_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        history = db.inspect(target).attrs.program_id.history
+        session.info.setdefault(INVALIDATED_WEEK_PROGRAMS, set()).update(
+            program_id for program_id in [target.program_id, *history.deleted] if program_id is not None)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+@event.listens_for(db.session, "after_bulk_delete")
+def _weeks_changed(context):
+    if context.mapper.class_ is WeekModel:
+        context.session.info.setdefault(INVALIDATED_WEEK_PROGRAMS, set()).add(None)
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate_week_calendars(session):
+    programs = session.info.pop(INVALIDATED_WEEK_PROGRAMS, set())
+    if programs:
+        from helpers.week_calendar import week_calendar
+        for program_id in [None] if None in programs else programs:
+            week_calendar.invalidate(program_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _forget_changed_weeks(session):
+    session.info.pop(INVALIDATED_WEEK_PROGRAMS, None)
@@ -2,14 +2,14 @@ from flask import request
 from flask_restful import Resource
 
 from auth.accesscontrol import handle_exception_pretty, roles_required, AllowedRoles
-from documents_generator.ApplicationGenerator import ApplicationGenerator
+from helpers.application_consistency import validate_application
 from helpers.resource import simple_get_all_by_program, replace_ids_with_models, validate_body, \
     successful_response, put_action, simple_delete, simple_get
 from helpers.schema_validators import ApplicationSchema, program_schema, ApplicationUpdateSchema
 from models.application import ApplicationModel, ApplicationType
 from models.contract import ContractModel
 from models.week import WeekModel
-from tasks.generate_application_tasks import queue_application
+from tasks.generate_application_tasks import queue_application, queue_application_validation
 
 
 class ApplicationRegister(Resource):
@@ -73,12 +73,12 @@ class ApplicationsResource(Resource):
 
 
 def validate_application_impl(application_id):
+    if request.args.get("queued", "").lower() in ("1", "true", "yes"):
+        return queue_application_validation(application_id)
     application = ApplicationModel.find_by_id(application_id)
-    results = []
-    for r in ApplicationGenerator.check_record_consistency(application):
-        results.append({"school": r.school.nick, "type": r.message.__class__.__name__, "message": str(r.message)})
-    return {"application": str(application),
-            "errors": results}, 200
+    if not application:
+        return {'message': f'Application {application_id} does not exists'}, 404
+    return validate_application(application), 200
 
 
 def create_application_impl(application_id):
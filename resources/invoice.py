@@ -5,8 +5,11 @@ from auth.accesscontrol import roles_required, AllowedRoles, handle_exception_pr
 from helpers.resource import simple_post, simple_put, simple_get, simple_delete, simple_get_all, \
     simple_get_all_by_program, validate_body
 from helpers.schema_validators import InvoiceQuerySchema, SuppliersNickAndNameReqQuery, SuppliersOptQuery, \
-    InvoiceUpdateQuerySchema, InvoiceProductSchema, AmountFloatQuerySchema, InvoiceDisposalSchema
+    InvoiceUpdateQuerySchema, InvoiceProductSchema, AmountFloatQuerySchema, InvoiceDisposalSchema, \
+    InvoiceDisposalAssignSchema, program_schema
+from models.application import ApplicationModel
 from models.invoice import SupplierModel, InvoiceModel, InvoiceProductModel, InvoiceDisposalModel
+from models.invoice_allocation import InvoiceAllocation
 from tasks.generate_invoice_disposal_task import queue_invoice_disposal
 
 
@@ -118,6 +121,17 @@ class InvoiceProductsResource(Resource):
         return simple_get_all_by_program(InvoiceProductModel)
 
 
+class InvoiceProductsRemainingResource(Resource):
+    @classmethod
+    @handle_exception_pretty
+    @roles_required([AllowedRoles.admin.name, AllowedRoles.program_manager.name])
+    def get(cls):
+        errors = program_schema.validate(request.args)
+        if errors:
+            return {"message": f"{errors}"}, 400
+        return {'invoice_product': InvoiceProductModel.remaining_by_program(request.args["program_id"])}, 200
+
+
 class InvoiceDisposalRegister(Resource):
     @classmethod
     @handle_exception_pretty
@@ -154,6 +168,25 @@ class InvoiceDisposalsResource(Resource):
         return simple_get_all_by_program(InvoiceDisposalModel)
 
 
+invoice_disposal_assign_schema = InvoiceDisposalAssignSchema()
+
+
+class InvoiceDisposalAssignResource(Resource):
+    @classmethod
+    @handle_exception_pretty
+    @roles_required([AllowedRoles.admin.name, AllowedRoles.program_manager.name])
+    def post(cls):
+        if err := validate_body(invoice_disposal_assign_schema):
+            return err
+        try:
+            disposals = InvoiceDisposalModel.assign(request.json["application_id"],
+                                                    [(product["invoice_product_id"], product["amount"])
+                                                     for product in request.json["invoice_products"]])
+        except ValueError as e:
+            return {'message': f'{e}'}, 400
+        return {'invoice_disposal': [disposal.json() for disposal in disposals]}, 201
+
+
 class InvoiceDisposalCreateQuerySchema(Schema):
     applications = fields.List(fields.Int(), required=True, allow_none=False)
 
@@ -170,3 +203,21 @@ class InvoiceDisposalCreateResource(Resource):
         if errors:
             return {"message": f"{errors}"}, 400
         return queue_invoice_disposal(request)
+
+
+class InvoiceDisposalAllocateResource(Resource):
+    @classmethod
+    @handle_exception_pretty
+    @roles_required([AllowedRoles.admin.name, AllowedRoles.program_manager.name])
+    def post(cls):
+        if err := validate_body(invoice_disposal_create_query):
+            return err
+        application_ids = request.json["applications"]
+        applications = ApplicationModel.query.filter(ApplicationModel.id.in_(application_ids)).all()
+        if missing := sorted(set(application_ids) - {application.id for application in applications}):
+            return {'message': f'Application {", ".join(map(str, missing))} does not exists'}, 404
+        try:
+            allocation = InvoiceAllocation(applications).allocate()
+        except ValueError as e:
+            return {'message': f'{e}'}, 400
+        return allocation.json(), 201
@@ -2,7 +2,7 @@ from flask import request
 from flask_restful import Resource
 from auth.accesscontrol import AllowedRoles, handle_exception_pretty, roles_required
 from helpers.schema_validators import ProductQuerySchema, ProductStoreQueryPostSchema, ProductStoreByTypeQuerySchema, \
-    ProductStoreQuerySchema, AmountQuerySchema
+    ProductStoreQuerySchema, AmountQuerySchema, program_schema
 from models.product import WeightTypeModel, ProductTypeModel, ProductModel, ProductStoreModel, ProductBoxModel
 from helpers.resource import simple_get_all, simple_post, simple_put
 
@@ -77,6 +77,19 @@ class ProductStoreUpdateResource(Resource):
         return simple_put(ProductStoreModel, product_id, validator=ProductStoreQuerySchema())
 
 
+class ProductStoreRemainingResource(Resource):
+    @classmethod
+    @handle_exception_pretty
+    @roles_required([AllowedRoles.admin.name, AllowedRoles.program_manager.name])
+    def get(cls):
+        errors = program_schema.validate(request.args)
+        if errors:
+            return {"message": f"{errors}"}, 400
+        return {
+                   'remaining': ProductStoreModel.remaining_amounts(request.args["program_id"])
+               }, 200
+
+
 class ProductBoxResource(Resource):
     @classmethod
     @handle_exception_pretty
@@ -1,18 +1,23 @@
 import enum
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 from flask import request
 from flask_restful import Resource
 from marshmallow import fields, Schema, ValidationError, validate
 from auth.accesscontrol import AllowedRoles, handle_exception_pretty, roles_required
 from helpers.schema_validators import program_schema, DateQuerySchema, ProgramQuerySchema
 from models.contract import ContractModel
-from models.product import ProductStoreModel, ProductTypeModel
+from models.product import ProductStoreModel
+from models.reference_cache import reference_cache
 from models.record import RecordModel, RecordState
 from models.school import SchoolModel
 from tasks.generate_delivery_task import queue_delivery, queue_week_summary
 from helpers.logger import app_logger
 from models.week import WeekModel
 from helpers.db import db
+from helpers.date_converter import DateConverter
+from sqlalchemy import func, insert
+from sqlalchemy.exc import NoResultFound, SQLAlchemyError
+from sqlalchemy.orm import lazyload
 from tasks.generate_register_task import queue_record_register
 
 
@@ -70,10 +75,10 @@ class RecordResponse:
     def __repr__(self):
         return self.__str__()
 
-    def json(self):
+    def json(self, record_json=None):
         data = {'nick': self.nick, 'product': self.product, 'result': self.result.value}
         if self.result == RecordAdditionResult.SUCCESS:
-            data['record'] = RecordModel.find_by_id(self.record_id).json()
+            data['record'] = record_json if record_json else RecordModel.find_by_id(self.record_id).json()
         return data
 
 
@@ -84,30 +89,94 @@ def is_contract_valid(product_store: ProductStoreModel, contract: ContractModel)
         return not contract.invalid_fruit_veg_contract()
 
 
-def try_to_insert_record(program_id, date, record_response) -> RecordResponse:
-    product_store: ProductStoreModel = ProductStoreModel.find_by(program_id, record_response.product)
-    if product_store:
-        contract = ContractModel.find(program_id, SchoolModel.find_one_by_nick(record_response.nick).id)
-        check_other_type = product_store.product.type.get_complementary_type() if product_store.product.type.is_fruit_veg() else False
-        if RecordModel.find(date, product_type=product_store.product.type, contract_id=contract.id):
-            record_response.result = RecordAdditionResult.RECORD_OF_THIS_TYPE_EXISTS
-        elif check_other_type and RecordModel.find(date, product_type=ProductTypeModel.find_by(name=check_other_type),
-                                                   contract_id=contract.id):
+class RecordsPlanner:
+    """
+    Plans records of one day for many schools and products.
+    Contracts, product stores, records existing on that day and records per product store are loaded with a few
+    queries, rules are checked in memory in request order and all accepted records are inserted with one statement.
+    """
+
+    def __init__(self, program_id, date):
+        self.program_id = program_id
+        self.date = DateConverter.convert_to_date(date)
+        self.week_id = None
+        self.product_stores: Dict[str, ProductStoreModel] = dict()
+        self.contracts: Dict[str, ContractModel] = dict()
+        self.product_type_ids: Dict[str, int] = dict()
+        self.existing: Set[Tuple[int, int]] = set()
+        self.amounts: Dict[Tuple[int, int], int] = dict()
+
+    def load(self, nicks, products):
+        self.product_stores = {store.product.name: store for store in
+                               reference_cache.product_stores(int(self.program_id)) if store.product.name in products}
+        self.contracts = {nick: contract for (nick, contract) in
+                          db.session.query(SchoolModel.nick, ContractModel).options(lazyload('*'))
+                          .join(ContractModel, ContractModel.school_id == SchoolModel.id)
+                          .filter(ContractModel.program_id == self.program_id, SchoolModel.nick.in_(nicks)).all()}
+        self.product_type_ids = {product_type.name: product_type.id for product_type in reference_cache.product_types()}
+        contract_ids = [contract.id for contract in self.contracts.values()]
+        self.existing = set(db.session.query(RecordModel.contract_id, RecordModel.product_type_id)
+                            .filter(RecordModel.date == self.date, RecordModel.contract_id.in_(contract_ids)).all())
+        self.amounts = {(store_id, contract_id): amount for (store_id, contract_id, amount) in
+                        db.session.query(RecordModel.product_store_id, RecordModel.contract_id,
+                                         func.count(RecordModel.id))
+                        .filter(RecordModel.contract_id.in_(contract_ids),
+                                RecordModel.product_store_id.in_([store.id for store in self.product_stores.values()]))
+                        .group_by(RecordModel.product_store_id, RecordModel.contract_id).all()}
+
+    def __get_week_id(self):
+        if self.week_id is None:
+            try:
+                self.week_id = WeekModel.find_by_date(self.date, self.program_id).id
+            except (ValueError, NoResultFound) as e:
+                self.week_id = False
+                app_logger.error(f"Failed to insert new Record due to {e}")
+        return self.week_id
+
+    def check(self, record_response: RecordResponse) -> Optional[dict]:
+        """Sets result of record_response, returns values of record to insert when it is accepted"""
+        product_store = self.product_stores.get(record_response.product)
+        contract = self.contracts.get(record_response.nick)
+        if not product_store or not contract:
+            return None
+        product_type = product_store.product.type
+        other_type = product_type.get_complementary_type() if product_type.is_fruit_veg() else None
+        if (contract.id, product_type.id) in self.existing or \
+                (other_type and (contract.id, self.product_type_ids.get(other_type)) in self.existing):
             record_response.result = RecordAdditionResult.RECORD_OF_THIS_TYPE_EXISTS
         elif not is_contract_valid(product_store, contract):
             record_response.result = RecordAdditionResult.NO_CONTRACT_FOR_PRODUCT_TYPE
-        elif product_store.is_min_amount_exceeded(record_response.nick):
+        elif self.amounts.get((product_store.id, contract.id), 0) >= product_store.min_amount:
             record_response.result = RecordAdditionResult.MIN_AMOUNT_EXCEED
-        else:
+        elif self.__get_week_id():
+            self.existing.add((contract.id, product_type.id))
+            self.amounts[(product_store.id, contract.id)] = self.amounts.get((product_store.id, contract.id), 0) + 1
+            return {"date": self.date, "state": RecordState.PLANNED, "product_store_id": product_store.id,
+                    "product_type_id": product_type.id, "contract_id": contract.id, "week_id": self.week_id}
+        return None
+
+    def plan(self, record_responses: List[RecordResponse]) -> List[RecordResponse]:
+        self.load({response.nick for response in record_responses}, {response.product for response in record_responses})
+        accepted = []
+        for record_response in record_responses:
+            values = self.check(record_response)
+            if values:
+                accepted.append((record_response, values))
+        if accepted:
             try:
-                rc = RecordModel(date=date, contract_id=contract.id, product_store=product_store)
-                rc.save_to_db()
+                db.session.execute(insert(RecordModel.__table__).values([values for (_, values) in accepted]))
+                ids = {(contract_id, product_type_id): _id for (_id, contract_id, product_type_id) in
+                       db.session.query(RecordModel.id, RecordModel.contract_id, RecordModel.product_type_id)
+                       .filter(RecordModel.date == self.date,
+                               RecordModel.contract_id.in_({values["contract_id"] for (_, values) in accepted}))}
+                db.session.commit()
+            except SQLAlchemyError:
+                db.session.rollback()
+                raise
+            for (record_response, values) in accepted:
                 record_response.result = RecordAdditionResult.SUCCESS
-                record_response.record_id = rc.id
-            except ValueError as e:
-                record_response.result = RecordAdditionResult.FAILED_WITH_OTHER_REASON
-                app_logger.error(f"Failed to insert new Record due to {e}")
-    return record_response
+                record_response.record_id = ids[(values["contract_id"], values["product_type_id"])]
+        return record_responses
 
 
 class RecordsAllResource(Resource):
@@ -119,19 +188,16 @@ class RecordsAllResource(Resource):
         body_errors = RecordsAllSchema().validate(request.json)
         if errors or body_errors:
             return {"message": f"url: {errors} body: {body_errors}"}, 400
-        results: List[RecordResponse] = []
         date = request.json["date"]
         program_id = request.args["program_id"]
-        for record in request.json["records"]:
-            school_nick = record["nick"]
-            for product in record["products"]:
-                record_response = RecordResponse(nick=school_nick, product=product)
-                results.append(try_to_insert_record(date=date,
-                                                    program_id=program_id,
-                                                    record_response=record_response))
+        results: List[RecordResponse] = RecordsPlanner(program_id, date).plan(
+            [RecordResponse(nick=record["nick"], product=product)
+             for record in request.json["records"] for product in record["products"]])
+        records = {data["id"]: data for data in RecordModel.json_by_ids([res.record_id for res in results
+                                                                         if res.record_id])}
         return {
                    "date": date,
-                   "records": [res.json() for res in results]
+                   "records": [res.json(records.get(res.record_id)) for res in results]
                }, 200
 
     @classmethod
@@ -141,9 +207,8 @@ class RecordsAllResource(Resource):
         errors = program_schema.validate(request.args)
         if errors:
             return {"message": f"url: {errors}"}, 400
-        results = RecordModel.all_filtered_by_program(request.args["program_id"])
         return {
-                   "records": [res.json() for res in results]
+                   "records": RecordModel.json_filtered_by_program(request.args["program_id"])
                }, 200
 
 
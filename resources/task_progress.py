@@ -23,6 +23,12 @@ class TaskProgressStatus(Resource):
                            }, 500
                 if create_task.is_finished:
                     app_logger.info(notification)
+                    if isinstance(create_task.result, dict):
+                        return {
+                               'progress': progress,
+                               'notification': notification,
+                               'result': create_task.result
+                           }, 200
                     if isinstance(create_task.result, str):
                         return {
                                'progress': -1,
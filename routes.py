@@ -9,9 +9,11 @@ from resources.contracts import ContractsCreateResource, ContractResource, Contr
     AnnexResource
 from resources.invoice import SupplierResource, SupplierRegister, SuppliersResource, InvoiceResource, InvoiceRegister, \
     InvoiceProductsResource, InvoiceProductResource, InvoiceProductRegister, InvoicesResource, InvoiceDisposalResource, \
-    InvoiceDisposalsResource, InvoiceDisposalCreateResource, InvoiceDisposalRegister
+    InvoiceDisposalsResource, InvoiceDisposalCreateResource, InvoiceDisposalRegister, \
+    InvoiceProductsRemainingResource, InvoiceDisposalAssignResource, InvoiceDisposalAllocateResource
 from resources.product import WeightTypeResource, ProductTypeResource, \
-    ProductResource, ProductStoreResource, ProductBoxResource, ProductStoreUpdateResource
+    ProductResource, ProductStoreResource, ProductBoxResource, ProductStoreUpdateResource, \
+    ProductStoreRemainingResource
 from resources.program import ProgramResource, ProgramRegister, ProgramsResource
 from resources.record import RecordsAllResource, RecordResource, RecordDeliveryCreate, SummarizeDeliveryCreate, \
     RecordBulkDelete, RecordRegister
@@ -68,6 +70,7 @@ def create_routes(app):
     api.add_resource(ProductResource, '/product')
     api.add_resource(ProductStoreResource, '/product_store')
     api.add_resource(ProductStoreUpdateResource, '/product_store/<int:product_id>')
+    api.add_resource(ProductStoreRemainingResource, '/product_store/remaining')
     api.add_resource(ProductBoxResource, '/product_box')
 
     api.add_resource(RecordsAllResource, '/records')
@@ -88,10 +91,13 @@ def create_routes(app):
     api.add_resource(InvoiceProductResource, '/invoice_product/<int:invoice_product_id>')
     api.add_resource(InvoiceProductRegister, '/invoice_product')
     api.add_resource(InvoiceProductsResource, '/invoice_product/all')
+    api.add_resource(InvoiceProductsRemainingResource, '/invoice_product/remaining')
 
     api.add_resource(InvoiceDisposalRegister, '/invoice_disposal')
     api.add_resource(InvoiceDisposalResource, '/invoice_disposal/<int:invoice_disposal_id>')
     api.add_resource(InvoiceDisposalsResource, '/invoice_disposal/all')
+    api.add_resource(InvoiceDisposalAssignResource, '/invoice_disposal/assign')
+    api.add_resource(InvoiceDisposalAllocateResource, '/invoice_disposal/allocate')
     api.add_resource(InvoiceDisposalCreateResource, '/create_invoice_disposal')
 
     api.add_resource(ApplicationRegister, '/application')
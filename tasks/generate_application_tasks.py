@@ -1,4 +1,5 @@
 from documents_generator.ApplicationGenerator import application_factory
+from helpers.application_consistency import validate_application
 from models.application import ApplicationModel
 from tasks.generate_documents_task import queue_task, setup_progress_meta, generate_documents_async
 from helpers.db_context import async_with_db_context
@@ -19,3 +20,15 @@ async def create_application_async(**request):
 
 def queue_application(request):
     return queue_task(func=create_application_async, request=request)
+
+
+@async_with_db_context
+async def validate_application_async(**request):
+    application = ApplicationModel.find_by_id(request.get("application_id"))
+    if not application:
+        return f"Application {request.get('application_id')} does not exists"
+    return validate_application(application)
+
+
+def queue_application_validation(application_id):
+    return queue_task(func=validate_application_async, request={"application_id": application_id})
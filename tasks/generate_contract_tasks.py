@@ -6,8 +6,8 @@ from documents_generator.ContractGenerator import ContractGenerator
 from sqlalchemy.exc import SQLAlchemyError
 from models.program import ProgramModel
 from models.school import SchoolModel
+from models.snapshot import load_contracts
 from helpers.db_context import async_with_db_context
-from helpers.db import db
 
 def find_contract(school_id, program_id):
     try:
@@ -46,12 +46,7 @@ async def create_contracts_async(**request):
         if contract:
             contracts.append(contract)
 
-    # IMPORTANT: Eagerly load all relationships BEFORE preparing for generation
-    contracts = ContractModel.get_contracts_eager_load([c.id for c in contracts])
-
-    # Now safe to detach - all data is loaded
-    db.session.expunge_all()
-
+    contracts = list(load_contracts([contract.id for contract in contracts], with_weeks=True).values())
     input_docs = [(ContractGenerator, {'contract': contract, 'date': request['date']}) for contract in contracts]
     setup_progress_meta(len(input_docs))
     return await create_generator_and_run(input_docs)
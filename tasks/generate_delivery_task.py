@@ -1,9 +1,7 @@
 from operator import attrgetter
 
-from sqlalchemy.orm import load_only
-
-from models.product import ProductTypeModel
 from models.record import RecordModel, RecordState, RecordNumbersChangedError
+from models.snapshot import load_records_by_ids, load_records_by_week
 from documents_generator.DeliveryGenerator import DeliveryGenerator, DeliveryRecordsGenerator, SummaryGenerator
 from tasks.generate_documents_task import queue_task, setup_progress_meta, create_generator_and_run, \
     measure_time_callback
@@ -18,49 +16,26 @@ async def create_delivery_async(**request):
     records.sort(key=attrgetter('contract_id', 'date'))
     delivery_date = request["date"]
 
-    # Prefetch all ProductTypeIds
-    product_type_ids = {record.product_type_id for record in records}
-    product_types = (
-        ProductTypeModel.query
-            .filter(ProductTypeModel.id.in_(product_type_ids))
-            .options(load_only('id', 'name'))
-            .all()
-    )
-
-    product_type_map = {pt.id: pt for pt in product_types}
-
     for record in records:
-        record.product_type = product_type_map.get(record.product_type_id)
         record.change_state(RecordState.GENERATION_IN_PROGRESS, date=delivery_date)
 
     driver = request.get("driver", None)
+    discovered_changed_records = []
+    if driver:
+        nicks = {record.contract_id: record.contract.school.nick for record in records}
+        discovered_changed_records = [str(RecordNumbersChangedError(nicks[contract_id]))
+                                      for contract_id in RecordModel.assign_numbers(records)]
+    db.session.commit()
+    app_logger.info(f"create_delivery_async to database records_no: {len(records)}")
+
+    records = load_records_by_ids([record.id for record in records])
+    records.sort(key=attrgetter('contract_id', 'date'))
     delivery_args = {'records': records, 'date': delivery_date,
                      'driver': driver,
                      'comments': request.get("comments", "")}
     input_docs = [(DeliveryGenerator, delivery_args)]
-    discovered_changed_records = []
-
     if driver:
-        for record in records:
-            try:
-                record.change_state(RecordState.ASSIGN_NUMBER)
-            except RecordNumbersChangedError as e:
-                discovered_changed_records.append(str(e))
         input_docs.append((DeliveryRecordsGenerator, delivery_args))
-    db.session.commit()
-    app_logger.info(f"create_delivery_async to database records_no: {len(records)}")
-
-    # Ensure all relationships are loaded before expunge
-    for record in records:
-        _ = record.product_store.product.weight.name
-        _ = record.product_store.product.type.name
-        _ = record.contract.program.id
-        for annex in record.contract.annex:
-            _ = annex.id
-            if annex.timed_annex:
-                _ = annex.timed_annex[0].id
-
-    db.session.expunge_all()
 
     setup_progress_meta(len(input_docs), notification=discovered_changed_records)
     generated_files = await create_generator_and_run(input_docs)
@@ -100,12 +75,11 @@ def queue_delivery(request):
 
 @async_with_db_context
 async def create_week_summary_async(**request):
-    records = RecordModel.all_filtered_by_week(request["week_id"]).all()
+    records = load_records_by_week(request["week_id"])
     records.sort(key=attrgetter('contract_id', 'date'))
     input_docs = [(SummaryGenerator, {"records": records})]
 
     setup_progress_meta(len(input_docs))
-    db.session.expunge_all()
 
     return await create_generator_and_run(input_docs)
 
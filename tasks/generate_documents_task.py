@@ -1,45 +1,46 @@
+from functools import partial
 from typing import List, Type, Tuple, Dict
-from threading import Thread
 from rq import get_current_job
 from documents_generator.DocumentGenerator import DocumentGenerator
 from helpers.file_folder_creator import DirectoryCreatorError
-from helpers.google_drive import GoogleDriveCommandsAsync
+from helpers.google_drive import GoogleDriveCommandsAsync, drive_session, drive_api
+from helpers.adaptive_limiter import drive_limiter
 from helpers.logger import app_logger
 from helpers.redis_commands import remove_old_save_new
-from helpers.common import FileData, TimeMeasure
+from helpers.common import FileData, TimeMeasure, IN_MEMORY_DOCUMENTS
+from helpers.template_registry import template_registry
+from helpers.document_renderer import RenderExecutor, RenderJob, render_executor
+from helpers.pipeline import Pipeline, Stage, UPLOAD_CONCURRENCY, PDF_CONCURRENCY
 from helpers.redis_commands import conn as redis_connection
 from rq import Queue, Connection
-from app import create_app
 
 NO_OF_GOOGLE_DRIVE_ACTIONS = 4  # 1. Docx gen, 2. upload, 3. pdf gen, 4. upload
 
 
 def measure_time_callback(job, connection, result, *args, **kwargs):
-    with create_app().app_context():
-        app_logger.debug(f"Delivery job time diff: {job.ended_at - job.started_at}")
+    app_logger.debug(f"Delivery job time diff: {job.ended_at - job.started_at}")
 
 
 def queue_task(*, func, request, callback=measure_time_callback, callback_failure=measure_time_callback):
-    with create_app().app_context():
-        with Connection(redis_connection):
-            q = Queue()
-            req_in = dict()
-            if isinstance(request, dict):
-                req_in = request
-            else:
-                if request.args:
-                    req_in.update(**request.args)
-                if request.is_json:
-                    req_in.update(**request.json)
-            create_task = q.enqueue(func,
-                                    result_ttl=60 * 60,
-                                    on_success=callback,
-                                    on_failure=callback_failure,
-                                    job_timeout=10 * 60,
-                                    **req_in)
-        return {
-                   'task_id': create_task.get_id()
-               }, 202
+    with Connection(redis_connection):
+        q = Queue()
+        req_in = dict()
+        if isinstance(request, dict):
+            req_in = request
+        else:
+            if request.args:
+                req_in.update(**request.args)
+            if request.is_json:
+                req_in.update(**request.json)
+        create_task = q.enqueue(func,
+                                result_ttl=60 * 60,
+                                on_success=callback,
+                                on_failure=callback_failure,
+                                job_timeout=10 * 60,
+                                **req_in)
+    return {
+               'task_id': create_task.get_id()
+           }, 202
 
 
 def setup_progress_meta(documents_no: int, notification=None):
@@ -61,6 +62,31 @@ def update_finished_documents_meta(documents_no: int):
     job.save_meta()
 
 
+def update_failed_documents_meta(failures: List[str]):
+    if not failures:
+        return
+    app_logger.error(f"{len(failures)} documents failed: {failures}")
+    job = get_current_job()
+    if not job:
+        return
+    notification = job.meta.get("notification")
+    if not isinstance(notification, list):
+        notification = []
+    job.meta["failed_documents"] = failures
+    job.meta["notification"] = notification + [f"Nie udało się wygenerować: {failure}" for failure in failures]
+    job.save_meta()
+
+
+def update_drive_limiter_meta():
+    stats = drive_limiter.stats()
+    app_logger.info(f"Google Drive limiter: {stats}")
+    job = get_current_job()
+    if not job:
+        return
+    job.meta["drive_limiter"] = stats
+    job.save_meta()
+
+
 DECREASE_FACTOR = 1
 
 
@@ -103,28 +129,47 @@ def get_generator_list(generators_init_data: List):
     return generators
 
 
-def start_thread(func, *args):
-    _thread = Thread(target=func, args=args)
-    _thread.start()
-    return _thread
+def prepare_render_jobs(generators: List[DocumentGenerator], in_memory) \
+        -> Tuple[List[Tuple[DocumentGenerator, RenderJob]], List[str]]:
+    """
+    Merge data of all documents is read before the pipeline starts, queries of prepare_data would block
+    the event loop and with it uploads and pdf exports of documents already rendered
+    """
+    jobs = []
+    failures = []
+    for gen in generators:
+        try:
+            jobs.append((gen, gen.render_job(in_memory)))
+        except Exception as e:
+            app_logger.error(f"[prepare] Problem occurred during preparing data of {gen.file_path}: {e}")
+            failures.append(f"[prepare] {gen.file_path}: {e}")
+    return jobs, failures
 
 
-def stop_threads(threads):
-    for thread in threads:
-        thread.join()
+async def render_document(gen_job: Tuple[DocumentGenerator, RenderJob], executor: RenderExecutor):
+    (gen, job) = gen_job
+    return gen.complete(job, await executor.render_async(job)).generated_document
 
 
-def run_generate_documents(generators: List[DocumentGenerator]):
-    threads = []
-    for gen in generators:
-        threads.append(start_thread(gen.generate))
-    stop_threads(threads)
+def generator_label(gen_job: Tuple[DocumentGenerator, RenderJob]) -> str:
+    return gen_job[0].file_path
 
 
-async def upload_and_update_meta(func, input_doc):
-    documents = await func(input_doc)
-    update_finished_documents_meta(len(documents))
-    return documents
+def file_label(file_data: FileData) -> str:
+    return file_data.name
+
+
+def document_stages(in_memory, pdf, executor: RenderExecutor) -> List[Stage]:
+    stages = [Stage("render", partial(render_document, executor=executor),
+                    concurrency=max(executor.max_in_flight, 1), label=generator_label),
+              Stage("upload", GoogleDriveCommandsAsync.upload_file, concurrency=UPLOAD_CONCURRENCY, collect=True,
+                    label=file_label)]
+    if pdf:
+        stages += [Stage("pdf", partial(GoogleDriveCommandsAsync.convert_to_pdf, in_memory=in_memory),
+                         concurrency=PDF_CONCURRENCY, label=file_label),
+                   Stage("upload_pdf", GoogleDriveCommandsAsync.upload_file, concurrency=UPLOAD_CONCURRENCY,
+                         collect=True, label=file_label)]
+    return stages
 
 
 async def create_generator_and_run(generators_init_data: List[Tuple[Type[DocumentGenerator], Dict]], redis_conn=None) \
@@ -142,25 +187,25 @@ async def create_generator_and_run(generators_init_data: List[Tuple[Type[Documen
     return await generate_documents_async(produced_generators, redis_conn)
 
 
-async def generate_documents_async(produced_generators: List, redis_conn=None, pdf=True):
-    with TimeMeasure("run_generate_documents"):
-        run_generate_documents(produced_generators)
-    generator: DocumentGenerator
-    uploaded_documents = []
-    docx_files_to_upload = [generator.generated_document for generator in produced_generators if
-                            generator.generated_document]
-    update_finished_documents_meta(len(docx_files_to_upload))
-    with TimeMeasure("upload_and_update_meta"):
-        output = await upload_and_update_meta(GoogleDriveCommandsAsync.upload_many, docx_files_to_upload)
-        uploaded_documents.extend(output)
-    if pdf:
-        with TimeMeasure("upload_and_update_meta(GoogleDriveCommandsAsync.convert_to_pdf_many, output"):
-            output = await upload_and_update_meta(GoogleDriveCommandsAsync.convert_to_pdf_many, output)
-        with TimeMeasure("upload_and_update_meta(GoogleDriveCommandsAsync.upload_many, output)"):
-            output = await upload_and_update_meta(GoogleDriveCommandsAsync.upload_many, output)
-            uploaded_documents.extend(output)
+async def generate_documents_async(produced_generators: List, redis_conn=None, pdf=True, in_memory=IN_MEMORY_DOCUMENTS,
+                                   executor: RenderExecutor = render_executor):
+    pipeline = Pipeline(document_stages(in_memory, pdf, executor),
+                        on_stage_done=lambda stage, document: update_finished_documents_meta(1))
+    with TimeMeasure("prepare render jobs"):
+        (jobs, failures) = prepare_render_jobs(produced_generators, in_memory)
+    try:
+        async with drive_session() as aiogoogle:
+            await drive_api(aiogoogle)
+            with TimeMeasure("document pipeline"):
+                results = await pipeline.run(jobs)
+    finally:
+        executor.release()
+    update_drive_limiter_meta()
+    update_failed_documents_meta(failures + pipeline.failures)
+    uploaded_documents = results["upload"] + results.get("upload_pdf", [])
     with TimeMeasure("remove_old_save_new"):
         remove_old_save_new(uploaded_documents, redis_conn)
+    app_logger.debug(f"Template registry: {template_registry.stats()}")
     return uploaded_documents
 
 
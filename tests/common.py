@@ -1,4 +1,9 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
 from helpers.common import FileData
+from helpers.db import db
 from helpers.google_drive import DriveCommands
 from models.contract import TimedAnnexModel, AnnexModel, ContractModel
 from models.directory_tree import DirectoryTreeModel
@@ -42,6 +47,20 @@ def add_record(date, contract_id, product_store, final_state=RecordState.DELIVER
     return record
 
 
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
 def clear_tables_schools():
     RecordModel.query.delete()
     TimedAnnexModel.query.delete()
@@ -80,5 +99,5 @@ class GoogleDriveFakeCommands(DriveCommands):
         pass
 
     @staticmethod
-    def prepare_remote_parent(output_directory, file_path):
-        return DirectoryTreeModel(file_path, "goolge_id", 1, "parent_id")
+    def prepare_remote_parent(output_directory, file_path, program_id):
+        return DirectoryTreeModel(file_path, "goolge_id", program_id, "parent_id", path=file_path)
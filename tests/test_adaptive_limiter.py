@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from aiogoogle.excs import HTTPError
+from aiogoogle.models import Response
+
+from helpers.adaptive_limiter import AdaptiveLimiter, is_rate_limit_error, is_retryable_error
+
+
+def http_error(status_code, reason=None):
+    json = {"error": {"code": status_code, "errors": [{"reason": reason}] if reason else []}}
+    return HTTPError("error", res=Response(status_code=status_code, json=json))
+
+
+@pytest.fixture
+def limiter():
+    yield AdaptiveLimiter(initial=4, maximum=8, max_retries=3, base_delay=0.001, max_delay=0.002)
+
+
+def test_error_classification():
+    assert is_rate_limit_error(http_error(429))
+    assert is_rate_limit_error(http_error(403, "userRateLimitExceeded"))
+    assert not is_rate_limit_error(http_error(403, "insufficientFilePermissions"))
+    assert is_retryable_error(http_error(503))
+    assert not is_retryable_error(http_error(404))
+    assert not is_retryable_error(ValueError())
+
+
+@pytest.mark.asyncio
+async def test_retries_rate_limit_and_decreases_limit(limiter):
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise http_error(403, "rateLimitExceeded")
+        return "done"
+
+    assert await limiter.run(request) == "done"
+    assert len(attempts) == 3
+    assert limiter.current_limit == 1
+    assert limiter.stats()["retries"] == 2
+    assert limiter.stats()["throttled"] == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_throttling_decreases_limit_once(limiter):
+    async def request():
+        await asyncio.sleep(0.001)
+        raise http_error(429)
+
+    limiter.max_retries = 0
+    results = await asyncio.gather(*[limiter.run(request) for _ in range(4)], return_exceptions=True)
+    assert all(isinstance(result, HTTPError) for result in results)
+    assert limiter.current_limit == 2
+
+
+@pytest.mark.asyncio
+async def test_not_retryable_error_is_raised(limiter):
+    async def request():
+        raise http_error(404)
+
+    with pytest.raises(HTTPError):
+        await limiter.run(request)
+    assert limiter.stats()["retries"] == 0
+    assert limiter.stats()["failures"] == 1
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_bounds_concurrency_and_grows_on_success(limiter):
+    running = []
+    max_running = []
+
+    async def request():
+        running.append(1)
+        max_running.append(len(running))
+        await asyncio.sleep(0.001)
+        running.pop()
+
+    await asyncio.gather(*[limiter.run(request) for _ in range(40)])
+    assert max(max_running) <= 8
+    assert limiter.current_limit > 4
@@ -1,7 +1,9 @@
 import pytest
+from pytest_redis import factories
 
 from documents_generator.ApplicationGenerator import get_application_dir, get_application_dir_per_school, \
     RecordsSummaryGenerator, StatementGenerator, application_factory, ApplicationGenerator
+from helpers.application_consistency import validate_application
 from models.application import ApplicationModel, ApplicationType
 
 from models.contract import AnnexModel
@@ -10,6 +12,9 @@ from tests import common_data
 from tests.common import all_fields_to_marge_are_in_file, add_record, GoogleDriveFakeCommands, validate_document_creation
 import os
 
+redis_external = factories.redisdb('redis_nooproc')
+
+
 def assert_value(value, expected, precision=0):
     assert f"{value}" == f"{expected:.{precision}f}"
 
@@ -139,7 +144,7 @@ def test_application_generator_fruit_veg(contract_for_school_no_dairy, second_co
 
 
 def test_consistency_check(contract_for_school_no_dairy, second_contract_for_school,
-                           week, second_week, product_store_apple, vegetable):
+                           week, second_week, product_store_apple, vegetable, redis_external):
     application = ApplicationModel(week.program_id, [contract_for_school_no_dairy, second_contract_for_school],
                                    [week, second_week],
                                    ApplicationType.FRUIT_VEG)
@@ -158,11 +163,17 @@ def test_consistency_check(contract_for_school_no_dairy, second_contract_for_sch
     assert str(results[0].message) == f"2: 17.12.2023 - 22.12.2023"
 
     add_record("18.12.2023", second_contract_for_school.id, product_store_apple)
-    add_record("03.12.2023", second_contract_for_school.id, product_store_apple, final_state=RecordState.GENERATED)
+    generated = add_record("03.12.2023", second_contract_for_school.id, product_store_apple,
+                           final_state=RecordState.GENERATED)
 
     results = ApplicationGenerator.check_record_consistency(application)
     assert results[0].school == second_contract_for_school.school
     assert str(results[0].message) == f"03.12.2023: apple  22 != RecordState.DELIVERED"
+    payload = validate_application(application, redis_connection=redis_external)
+    assert [error["message"] for error in payload["errors"]] == [str(result.message) for result in results]
+    assert validate_application(application, redis_connection=redis_external) == payload
+    generated.update_db(state=RecordState.DELIVERED)
+    assert validate_application(application, redis_connection=redis_external) != payload
     application.delete_from_db()
 
 
@@ -0,0 +1,12 @@
+from helpers.db import db
+from helpers.db_context import get_app, get_engine_options
+
+
+def test_worker_app_and_pool_created_once():
+    app = get_app()
+    assert get_app() is app
+    with app.app_context():
+        engine = db.engine
+        assert engine.pool.size() == get_engine_options()["pool_size"]
+    with app.app_context():
+        assert db.engine is engine
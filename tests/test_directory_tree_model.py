@@ -1,11 +1,18 @@
 import pytest
-from models.directory_tree import DirectoryTreeModel
+from helpers.db import db
+from models.directory_tree import DirectoryTreeModel, merge_duplicated_directories
+from models.schema_updates import create_missing_indexes
 from models.program import ProgramModel
 from tests.common_data import get_program_data
 from tests.common_data import company as company_data
 from models.company import CompanyModel
 from helpers.common import get_parent_and_children_directories
+from helpers.directory_cache import DirectoryCache
 from os import path
+from sqlalchemy.exc import NoResultFound
+from pytest_redis import factories
+
+redis_external = factories.redisdb('redis_nooproc')
 
 DUMMY_GOOGLE_ID = "asdfas343"
 SECOND_DUMMY_GOOGLE_ID = "55sdf3r3qsdf"
@@ -25,14 +32,16 @@ def setup_base_data(program_setup):
         name="second_dir",
         google_id=SECOND_DUMMY_GOOGLE_ID,
         parent_id=main_directory_tree.id,
-        program_id=program_setup.id
+        program_id=program_setup.id,
+        path="main_dir/second_dir"
     )
     second_directory.save_to_db()
     third_directory = DirectoryTreeModel(
         name="third_dir",
         google_id=THIRD_DUMMY_GOOGLE_ID,
         parent_id=second_directory.id,
-        program_id=program_setup.id
+        program_id=program_setup.id,
+        path="main_dir/second_dir/third_dir"
     )
     third_directory.save_to_db()
     yield main_directory_tree, second_directory, third_directory
@@ -44,14 +53,72 @@ def setup_base_data(program_setup):
 def test_get_children_and_parent(setup_base_data):
     main_directory_tree, second_directory, third_directory = setup_base_data
     path_to_file = path.join(main_directory_tree.name, second_directory.name, third_directory.name)
-    (parent, children) = DirectoryTreeModel.get_children_and_parent(path_to_file, contains_file_name=True)
+    program_id = main_directory_tree.program_id
+    (parent, children) = DirectoryTreeModel.get_children_and_parent(path_to_file, program_id, contains_file_name=True)
     assert parent is main_directory_tree
     assert children == ["second_dir"]
-    (parent, children) = DirectoryTreeModel.get_children_and_parent(path_to_file, contains_file_name=False)
+    (parent, children) = DirectoryTreeModel.get_children_and_parent(path_to_file, program_id, contains_file_name=False)
     assert parent is main_directory_tree
     assert children == ["second_dir", "third_dir"]
 
 
+def test_root_lookup_scoped_to_program(setup_base_data):
+    main_directory_tree, second_directory, _ = setup_base_data
+    other_program = ProgramModel(**dict(get_program_data(main_directory_tree.program.company_id), semester_no=2))
+    other_program.save_to_db()
+    other_root = DirectoryTreeModel(name="main_dir", google_id="other_google_id", program_id=other_program.id)
+    other_root.save_to_db()
+    path_to_file = path.join(main_directory_tree.name, second_directory.name)
+    assert DirectoryTreeModel.get_children_and_parent(path_to_file, main_directory_tree.program_id).parent \
+           is main_directory_tree
+    assert DirectoryTreeModel.get_children_and_parent(path_to_file, other_program.id).parent is other_root
+    other_root.delete_from_db()
+    other_program.delete_from_db()
+
+
+def test_duplicated_directories_merged(program_setup):
+    db.session.commit()
+    unique_path = next(index for index in DirectoryTreeModel.__table__.indexes
+                       if index.name == "ix_directorytree_path_program_id")
+    unique_path.drop(bind=db.engine)
+    try:
+        roots = [DirectoryTreeModel(name="duplicated_dir", google_id=f"root_{i}", program_id=program_setup.id)
+                 for i in range(2)]
+        for root in roots:
+            root.save_to_db()
+        for (i, root) in enumerate(roots):
+            DirectoryTreeModel(name="child", google_id=f"child_{i}", program_id=program_setup.id, parent_id=root.id,
+                               path="duplicated_dir/child").save_to_db()
+        DirectoryTreeModel(name="other", google_id="other", program_id=program_setup.id, parent_id=roots[1].id,
+                           path="duplicated_dir/other").save_to_db()
+        merge_duplicated_directories(db)
+    finally:
+        create_missing_indexes(db)
+    rows = DirectoryTreeModel.query.filter(DirectoryTreeModel.path.startswith("duplicated_dir")) \
+        .order_by(DirectoryTreeModel.path).all()
+    assert [(row.path, row.google_id) for row in rows] == [("duplicated_dir", "root_0"),
+                                                           ("duplicated_dir/child", "child_0"),
+                                                           ("duplicated_dir/other", "other")]
+    assert rows[1].parent_id == rows[2].parent_id == rows[0].id
+    for row in reversed(rows):
+        row.delete_from_db()
+
+
+def test_path_resolved_with_single_lookup(setup_base_data):
+    main_directory_tree, second_directory, third_directory = setup_base_data
+    assert third_directory.path == "main_dir/second_dir/third_dir"
+    path_to_file = path.join(main_directory_tree.name, second_directory.name, third_directory.name, "file.docx")
+    assert DirectoryTreeModel.get_google_parent_directory(path_to_file, third_directory.program_id) is third_directory
+    with pytest.raises(NoResultFound):
+        DirectoryTreeModel.get_google_parent_directory(path_to_file, third_directory.program_id + 1)
+    with pytest.raises(ValueError):
+        DirectoryTreeModel(name="fourth_dir", google_id="id", program_id=third_directory.program_id,
+                           parent_id=third_directory.id)
+    found = DirectoryTreeModel.find_by_paths(["main_dir", "main_dir/second_dir", "main_dir/missing"],
+                                             main_directory_tree.program_id)
+    assert found == {"main_dir": main_directory_tree, "main_dir/second_dir": second_directory}
+
+
 @pytest.mark.parametrize('path_to_file, skip_last, expected_parent, expected_children', [
     ("/main_dir/second_directory", True, "main_dir", []),
     ("main_dir/second_directory", False, "main_dir", ["second_directory"]),
@@ -63,3 +130,23 @@ def test_parent_and_children_split_success(path_to_file, skip_last, expected_par
     (parent, children) = get_parent_and_children_directories(path_to_file, skip_last=skip_last)
     assert parent == expected_parent
     assert children == expected_children
+
+
+def test_directory_cache_resolves_and_invalidates(setup_base_data, redis_external):
+    main_directory_tree, second_directory, third_directory = setup_base_data
+    cache = DirectoryCache(redis_connection=redis_external)
+    path_to_file = path.join(main_directory_tree.name, second_directory.name, third_directory.name, "file.docx")
+    program_id = main_directory_tree.program_id
+    resolved = cache.resolve(path_to_file, program_id, contains_file_name=True)
+    assert (resolved.id, resolved.google_id) == (third_directory.id, THIRD_DUMMY_GOOGLE_ID)
+    assert cache.resolve(path_to_file, program_id + 1, contains_file_name=True) is None
+    assert cache.resolve(path.join(main_directory_tree.name, "fourth_dir"), program_id) is None
+    fourth_directory = DirectoryTreeModel(name="fourth_dir", google_id="fourth_google_id",
+                                          parent_id=main_directory_tree.id, program_id=main_directory_tree.program_id,
+                                          path="main_dir/fourth_dir")
+    fourth_directory.save_to_db()
+    cache.invalidate(main_directory_tree.program_id)
+    assert cache.resolve(path.join(main_directory_tree.name, "fourth_dir"), program_id).google_id == "fourth_google_id"
+    assert DirectoryCache(redis_connection=redis_external).resolve(
+        path.join(main_directory_tree.name, "fourth_dir"), program_id).id == fourth_directory.id
+    fourth_directory.delete_from_db()
@@ -1,12 +1,13 @@
 from documents_generator.DocumentGenerator import DocumentGenerator
 from helpers.config_parser import config_parser
 from os import path, remove
+from io import BytesIO
 from tests.common import all_fields_to_marge_are_in_file
 from shutil import rmtree
 from typing import List
 from helpers.google_drive import FileData, GoogleDriveCommands, GoogleDriveCommandsAsync
 from helpers.common import DOC_GOOGLE_MIME_TYPE, DOCX_EXT, PDF_EXT, get_mime_type
-from tasks.generate_documents_task import generate_documents
+from tasks.generate_documents_task import generate_documents, generate_documents_async, get_generator_list
 from models.directory_tree import DirectoryTreeModel
 import pytest
 
@@ -19,19 +20,20 @@ class CustomDocumentGenerator(DocumentGenerator):
     def prepare_data(self):
         self.merge(**self.fields_to_merge)
 
-    def __init__(self, drive_tool=GoogleDriveCommands, directory_name="TEST", **fields_to_merge):
+    def __init__(self, program_id, drive_tool=GoogleDriveCommands, directory_name="TEST", **fields_to_merge):
         self.test_directory_path = path.join(CustomDocumentGenerator.main_directory_name, directory_name)
         self.fields_to_merge = fields_to_merge
         DocumentGenerator.__init__(self,
                                    template_document=CustomDocumentGenerator.template_document,
                                    output_directory=self.test_directory_path,
                                    output_name="test_file.docx",
+                                   program_id=program_id,
                                    drive_tool=drive_tool)
 
 
 @pytest.fixture
-def document_generator(request):
-    test_doc_gen = CustomDocumentGenerator(drive_tool=GoogleDriveCommands, **request.param)
+def document_generator(request, initial_app_setup):
+    test_doc_gen = CustomDocumentGenerator(initial_app_setup.id, drive_tool=GoogleDriveCommands, **request.param)
     yield test_doc_gen
     remove_local_directory()
 
@@ -43,19 +45,24 @@ def remove_local_directory():
 valid_fields = {'dummy_data_no': 125, 'dummy_data': "Testing document generation"}
 
 
+@pytest.mark.parametrize('in_memory', [False, True])
 @pytest.mark.parametrize('document_generator', [valid_fields], indirect=["document_generator"])
-def test_successful_generation(initial_app_setup, document_generator):
-    document_generator.generate()
+def test_successful_generation(initial_app_setup, document_generator, in_memory):
+    document_generator.generate(in_memory=in_memory)
     assert isinstance(document_generator, CustomDocumentGenerator)
     assert len(document_generator.generated_documents) == 1
     assert path.isdir(document_generator.test_directory_path)
-    all_fields_to_marge_are_in_file(document_generator.generated_documents[0].name,
+    generated = document_generator.generated_documents[0]
+    assert path.exists(generated.name) is not in_memory
+    assert (generated.content is not None) is in_memory
+    all_fields_to_marge_are_in_file(BytesIO(generated.content) if in_memory else generated.name,
                                     **document_generator.fields_to_merge)
 
 
+@pytest.mark.parametrize('in_memory', [False, True])
 @pytest.mark.parametrize('document_generator', [valid_fields], indirect=["document_generator"])
-def test_successful_remote_upload(initial_app_setup, document_generator):
-    document_generator.generate()
+def test_successful_remote_upload(initial_app_setup, document_generator, in_memory):
+    document_generator.generate(in_memory=in_memory)
     document_generator.upload_files_to_remote_drive()
     assert len([gen.web_view_link for gen in document_generator.generated_documents if gen.web_view_link]) == 1
 
@@ -139,3 +146,18 @@ async def test_successful_generate_documents_async(initial_app_setup, remove_cre
     __validate_successful_generation_test([str(res) for res in second], no_of_items=loop_size)
     assert len(await GoogleDriveCommandsAsync.search(first[0].parent_id,
                                                      mime_type_query=get_mime_type(DOC_GOOGLE_MIME_TYPE))) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('in_memory', [False, True])
+async def test_generate_documents_async_in_memory(initial_app_setup, remove_created_resources, redis_external,
+                                                  in_memory):
+    GoogleDriveCommandsAsync.clear_tmp()
+    loop_size = 2
+    test_documents = prepare_generate_documents_data(loop_size)
+    results: List[FileData] = await generate_documents_async(get_generator_list(test_documents),
+                                                             redis_conn=redis_external, in_memory=in_memory)
+    __validate_successful_generation_test([str(res) for res in results], no_of_items=loop_size)
+    for res in results:
+        assert (res.content is not None) is in_memory
+        assert path.exists(res.name) is not in_memory
@@ -0,0 +1,67 @@
+from io import BytesIO
+from os import path
+
+import pytest
+
+from helpers.document_renderer import RenderExecutor, RenderJob, render
+from helpers.pipeline import Pipeline, Stage
+from tasks.generate_documents_task import prepare_render_jobs
+from tests.common import all_fields_to_marge_are_in_file
+
+TEMPLATE = path.join("helper_files", "test_file.docx")
+
+
+def render_job(no, output_file="", in_memory=True):
+    return RenderJob(template_document=TEMPLATE,
+                     operations=(("merge", (), {"dummy_data_no": str(no), "dummy_data": f"document {no}"}),),
+                     output_file=output_file, in_memory=in_memory)
+
+
+def test_render_to_file(tmp_path):
+    output_file = path.join(tmp_path, "rendered.docx")
+    assert render(render_job(1, output_file, in_memory=False)) is None
+    all_fields_to_marge_are_in_file(output_file, dummy_data_no="1", dummy_data="document 1")
+
+
+async def render_all(executor: RenderExecutor, jobs):
+    pipeline = Pipeline([Stage("render", executor.render_async, concurrency=max(executor.max_in_flight, 1),
+                               collect=True)])
+    try:
+        return (await pipeline.run(jobs))["render"]
+    finally:
+        executor.release()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("processes", [0, 2])
+async def test_render_in_pipeline_keeps_order(processes):
+    results = await render_all(RenderExecutor(processes=processes), (render_job(no) for no in range(7)))
+    assert len(results) == 7
+    for no, result in enumerate(results):
+        all_fields_to_marge_are_in_file(BytesIO(result), dummy_data_no=str(no), dummy_data=f"document {no}")
+
+
+@pytest.mark.asyncio
+async def test_render_error_drops_only_failed_job():
+    broken = RenderJob(template_document=TEMPLATE, operations=(("not_existing", (), {}),), output_file="")
+    results = await render_all(RenderExecutor(processes=0), [render_job(1), broken, render_job(2)])
+    assert len(results) == 2
+    all_fields_to_marge_are_in_file(BytesIO(results[1]), dummy_data_no="2", dummy_data="document 2")
+
+
+class PreparedGenerator:
+    def __init__(self, no):
+        self.no = no
+        self.file_path = f"documents/{no}.docx"
+
+    def render_job(self, in_memory):
+        if self.no == 1:
+            raise ValueError("no records")
+        return render_job(self.no, self.file_path, in_memory)
+
+
+def test_render_jobs_prepared_before_pipeline():
+    generators = [PreparedGenerator(no) for no in range(3)]
+    (jobs, failures) = prepare_render_jobs(generators, in_memory=True)
+    assert [(gen.no, job.output_file) for (gen, job) in jobs] == [(0, "documents/0.docx"), (2, "documents/2.docx")]
+    assert failures == ["[prepare] documents/1.docx: no records"]
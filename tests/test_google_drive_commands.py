@@ -103,3 +103,21 @@ async def test_convert_to_pdf_async():
             assert b"PDF" in file.readline()
             assert current_file.id is None
     GoogleDriveCommandsAsync.clear_tmp()
+
+
+@pytest.mark.asyncio
+async def test_drive_api_loaded_from_discovery_cache(tmp_path, monkeypatch):
+    import json
+    import helpers.google_drive as google_drive
+    cache_file = path.join(tmp_path, "drive_v3_discovery.json")
+    with open(cache_file, "w") as cache:
+        json.dump({"name": "drive", "version": "v3", "rootUrl": "https://www.googleapis.com/",
+                   "servicePath": "drive/v3/", "resources": {}}, cache)
+    monkeypatch.setattr(google_drive, "drive_discovery_cache", cache_file)
+    monkeypatch.setattr(google_drive, "drive_api_service", None)
+    async with google_drive.drive_session() as aiogoogle:
+        async with google_drive.drive_session() as shared:
+            assert shared is aiogoogle
+            first = await google_drive.drive_api(aiogoogle)
+            assert first is await google_drive.drive_api(shared)
+    assert first.discovery_document["name"] == "drive"
@@ -0,0 +1,65 @@
+import pickle
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from models.contract import KidsNoIndex, ContractModel
+from models.product import ProductTypeModel
+from models.snapshot import ProductTypeSnapshot
+
+DAIRY = ProductTypeSnapshot(id=1, name=ProductTypeModel.DAIRY_TYPE)
+FRUIT = ProductTypeSnapshot(id=2, name=ProductTypeModel.FRUIT_TYPE)
+
+
+def annex(validity_date, dairy_products, fruit_veg_products, validity_date_end=None):
+    timed_annex = [SimpleNamespace(validity_date_end=validity_date_end)] if validity_date_end else []
+    return SimpleNamespace(validity_date=validity_date, dairy_products=dairy_products,
+                           fruitVeg_products=fruit_veg_products, timed_annex=timed_annex)
+
+
+def contract(annexes):
+    return SimpleNamespace(contract_no="1", contract_year=2023, validity_date=datetime(2023, 12, 1),
+                           dairy_products=5, fruitVeg_products=10,
+                           program=SimpleNamespace(end_date=datetime(2024, 1, 31)),
+                           annex=sorted(annexes, key=lambda a: a.validity_date, reverse=True))
+
+
+def test_contract_without_annex():
+    index = KidsNoIndex(contract([]))
+    assert index.get_kids_no(DAIRY, datetime(2020, 1, 1)) == 5
+    assert index.get_kids_no(FRUIT, "01.12.2023") == 10
+
+
+@pytest.mark.parametrize("date,expected_dairy,expected_fruit", [("01.12.2023", 5, 10),
+                                                                ("07.12.2023", 1, 2),
+                                                                ("08.12.2023", 11, 12),
+                                                                ("09.12.2023", 22, 23),
+                                                                ("12.12.2023", 22, 23),
+                                                                ("13.12.2023", 22, 23),
+                                                                ("14.12.2023", 1, 2),
+                                                                ("31.01.2024", 1, 2)])
+def test_latest_valid_annex_wins(date, expected_dairy, expected_fruit):
+    index = KidsNoIndex(contract([annex(datetime(2023, 12, 7), 1, 2),
+                                  annex(datetime(2023, 12, 8), 11, 12, datetime(2023, 12, 12)),
+                                  annex(datetime(2023, 12, 9), 22, 23, datetime(2023, 12, 13))]))
+    assert index.get_kids_no(DAIRY, date) == expected_dairy
+    assert index.get_kids_no(FRUIT, date) == expected_fruit
+    assert pickle.loads(pickle.dumps(index)) == index
+
+
+def test_date_out_of_contract_raises():
+    index = KidsNoIndex(contract([annex(datetime(2023, 12, 7), 1, 2)]))
+    with pytest.raises(ValueError):
+        index.get_kids_no(DAIRY, "30.11.2023")
+    with pytest.raises(ValueError):
+        index.get_kids_no(DAIRY, "01.02.2024")
+
+
+def test_index_is_built_once():
+    data = contract([annex(datetime(2023, 12, 7), 1, 2)])
+    data.get_kids_no_index = lambda: ContractModel.get_kids_no_index(data)
+    assert ContractModel.get_kids_no(data, DAIRY, "08.12.2023") == 1
+    index = data.get_kids_no_index()
+    data.annex = []
+    assert data.get_kids_no_index() is index
@@ -1,14 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
+from flask import current_app
 
 from models.application import ApplicationModel, ApplicationType
-from models.invoice import InvoiceDisposalModel
+from models.invoice import InvoiceDisposalModel, InvoiceProductModel
+from models.invoice_allocation import InvoiceAllocation
 from models.contract import ContractModel, AnnexModel
 from models.week import WeekModel
 from models.product import ProductTypeModel, ProductStoreModel
-from models.record import RecordModel, RecordState
-from tests.common import add_record
+from models.record import RecordModel, RecordState, ApplicationRecords
+from tests.common import add_record, count_queries
 from tests.common_data import school_data, annex_data, week_data
 from helpers.date_converter import DateConverter
+from helpers.db import db
 
 def test_school_model_with_contract(contract_for_school):
     contract = ContractModel.find(contract_for_school.program_id, contract_for_school.school_id)
@@ -60,6 +65,49 @@ def test_record_model(date, expected_kids_no, expected_min_amount, setup_record_
     assert product_store_dairy.is_min_amount_exceeded(school_data["nick"]) is False
 
 
+def test_product_store_remaining_amounts(setup_record_test_init):
+    contract, product_store_dairy, _ = setup_record_test_init
+    records_no = RecordModel.query.filter_by(product_store_id=product_store_dairy.id, contract_id=contract.id).count()
+    remaining = [item for item in ProductStoreModel.remaining_amounts(contract.program_id)
+                 if item["product_store_id"] == product_store_dairy.id and item["contract_id"] == contract.id]
+    assert remaining == [{'nick': school_data["nick"], 'contract_id': contract.id,
+                          'product_store_id': product_store_dairy.id, 'product': product_store_dairy.product.name,
+                          'min_amount': product_store_dairy.min_amount, 'records': records_no,
+                          'remaining': max(product_store_dairy.min_amount - records_no, 0)}]
+    assert product_store_dairy.is_min_amount_exceeded(school_data["nick"]) == \
+           (records_no >= product_store_dairy.min_amount)
+
+
+def test_assign_numbers(setup_record_test_init, second_contract_for_school, product_store_apple,
+                        product_store_carrot):
+    contract = second_contract_for_school
+    _, product_store_dairy, _ = setup_record_test_init
+    records = {date: RecordModel(date, contract.id, product_store_dairy) for date in ["05.12.2023", "06.12.2023",
+                                                                                         "07.12.2023"]}
+    apple = RecordModel("05.12.2023", contract.id, product_store_apple)
+    carrot = RecordModel("05.12.2023", contract.id, product_store_carrot)
+    for record in [*records.values(), apple, carrot]:
+        record.save_to_db()
+
+    assert RecordModel.assign_numbers([records["05.12.2023"], records["07.12.2023"], apple]) == []
+    assert [record.no for record in records.values()] == [1, None, 3]
+    assert apple.no == 1 and apple.state == RecordState.ASSIGN_NUMBER
+    assert carrot.no == 2
+    earlier_apple = RecordModel("04.12.2023", contract.id, product_store_apple)
+    earlier_apple.save_to_db()
+    assert RecordModel.assign_numbers([records["06.12.2023"]]) == []
+    assert records["06.12.2023"].no == 2
+    assert [earlier_apple.no, apple.no, carrot.no] == [None, 1, 2]
+
+    earlier = RecordModel("04.12.2023", contract.id, product_store_dairy)
+    earlier.save_to_db()
+    assert RecordModel.assign_numbers([earlier, earlier_apple]) == [contract.id]
+    assert [earlier.no] + [record.no for record in records.values()] == [1, 2, 3, 4]
+    assert [earlier_apple.no, apple.no, carrot.no] == [1, 2, 3]
+    for record in [*records.values(), apple, carrot, earlier, earlier_apple]:
+        record.delete_from_db()
+
+
 def test_week_overlap_throws_value_error(week):
     week_two = WeekModel(week_no=2, start_date=week_data["start_date"], end_date=week_data["end_date"],
                          program_id=week.program_id)
@@ -131,6 +179,12 @@ def test_filter_records(setup_record_test_init, second_week, third_week,
     second_application_dairy_record = RecordModel.filter_records(second_application_dairy)
     assert len(second_application_dairy_record) == 1
     assert second_application_dairy_record[0].id == second_contract_dairy_week_3.id
+
+    application_records = ApplicationRecords(application_dairy)
+    assert application_records.in_state() == application_dairy_records
+    assert application_records.by_contract(first_contract.id, ApplicationRecords.STATES) == \
+           [first_contract_dairy_week_1, first_contract_dairy_week_1_generated]
+    assert application_records.by_contract(contract_for_school_no_dairy.id) == []
     application_dairy.delete_from_db()
     application_fruit_veg.delete_from_db()
     second_application_dairy.delete_from_db()
@@ -160,3 +214,95 @@ def test_invoice_model(invoice_data, create_application):
     assert second_invoice_disposal.id is not None
     with pytest.raises(ValueError):
         InvoiceDisposalModel(product.id, application_id, 481)
+    second_invoice_disposal.update_db(amount=0)
+    assert second_invoice_disposal.amount == 0
+    assert product_second.disposed_amount == 0
+    second_invoice_disposal.update_db(amount=15)
+    assert product_second.disposed_amount == 15
+
+
+def test_invoice_filtered_by_program(invoice_data):
+    invoices, products, _, invoice_disposals = invoice_data
+    program_id = invoices[0].program_id
+    db.session.expire_all()
+    with count_queries() as statements:
+        disposals = InvoiceDisposalModel.all_filtered_by_program(program_id).all()
+        assert sorted(str(disposal) for disposal in disposals) == \
+               sorted(str(disposal) for disposal in invoice_disposals)
+    assert len([statement for statement in statements if "invoice_product" in statement]) == 1
+    assert InvoiceDisposalModel.all_filtered_by_program(program_id + 1).all() == []
+    assert sorted(product.id for product in InvoiceProductModel.all_filtered_by_program(program_id)) == \
+           sorted(product.id for product in products)
+    assert InvoiceProductModel.all_filtered_by_program(program_id + 1).all() == []
+
+
+def test_invoice_disposal_ledger(invoice_data):
+    _, products, _, invoice_disposals = invoice_data
+    milk, kohlrabi, apple = products[3], products[1], products[4]
+    application_id = invoice_disposals[0].application_id
+    assert [product.remaining_amount for product in (milk, kohlrabi, apple)] == [2, 5.5, 5]
+    with pytest.raises(ValueError):
+        InvoiceDisposalModel.assign(application_id, [(milk.id, 2), (kohlrabi.id, 5.6)])
+    assert [product.remaining_amount for product in (milk, kohlrabi)] == [2, 5.5]
+    disposals = InvoiceDisposalModel.assign(application_id, [(kohlrabi.id, 5.5), (milk.id, 1)])
+    assert [product.remaining_amount for product in (milk, kohlrabi)] == [1, 0]
+    with pytest.raises(ValueError):
+        invoice_disposals[4].update_db(amount=10.1)
+    invoice_disposals[4].update_db(amount=10)
+    assert apple.remaining_amount == 0
+    with pytest.raises(ValueError):
+        kohlrabi.update_db(amount=20)
+    remaining = {product["id"]: product["remaining_amount"]
+                 for product in InvoiceProductModel.remaining_by_program(milk.invoice.program_id)}
+    assert remaining[milk.id] == 1 and remaining[apple.id] == 0
+    for disposal in disposals:
+        disposal.delete_from_db()
+    assert [product.remaining_amount for product in (milk, kohlrabi)] == [2, 5.5]
+
+
+def test_invoice_allocation_fifo(invoice_data, create_application):
+    _, products, _, invoice_disposals = invoice_data
+    application, _, contract = create_application
+    record = add_record("04.12.2023", contract.id, products[0].product_store)
+    record.update_db(delivered_kids_no=2060)
+    allocation = InvoiceAllocation([application]).allocate()
+    assert allocation.disposals == [{'invoice_product_id': products[3].id, 'application_id': application.id,
+                                     'amount': 2}]
+    assert allocation.missing == {application.id: {'milk': 5}}
+    assert products[3].remaining_amount == 0
+    rerun = InvoiceAllocation([application]).allocate()
+    assert rerun.disposals == [] and rerun.missing == {application.id: {'milk': 5}}
+    product_store = products[0].product_store
+    (weight, product_store.weight) = (product_store.weight, None)
+    db.session.commit()
+    without_weight = InvoiceAllocation([application]).allocate()
+    assert without_weight.disposals == [] and without_weight.missing == {application.id: {'milk': None}}
+    product_store.weight = weight
+    db.session.commit()
+    for disposal in InvoiceDisposalModel.all_filtered_by_application([application.id]):
+        if disposal not in invoice_disposals:
+            disposal.delete_from_db()
+
+
+def test_invoice_allocation_concurrent(invoice_data, create_application):
+    _, products, _, invoice_disposals = invoice_data
+    application, _, contract = create_application
+    record = add_record("05.12.2023", contract.id, products[0].product_store)
+    record.update_db(delivered_kids_no=2060)
+    app = current_app._get_current_object()
+
+    def allocate(_):
+        with app.app_context():
+            try:
+                return InvoiceAllocation([ApplicationModel.find_by_id(application.id)]).allocate().disposals
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(allocate, range(2)))
+    assert sorted(len(disposals) for disposals in results) == [0, 1]
+    db.session.expire_all()
+    assert InvoiceProductModel.find_by_id(products[3].id).remaining_amount == 0
+    for disposal in InvoiceDisposalModel.all_filtered_by_application([application.id]):
+        if disposal not in invoice_disposals:
+            disposal.delete_from_db()
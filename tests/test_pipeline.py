@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from helpers.pipeline import Pipeline, Stage
+
+
+class ConcurrencyCounter:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def run(self, func, item):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            return await func(item)
+        finally:
+            self.running -= 1
+
+
+@pytest.mark.asyncio
+async def test_pipeline_keeps_input_order_and_drops_none():
+    async def first(item):
+        await asyncio.sleep(0.001 * (10 - item))
+        return None if item == 3 else item * 2
+
+    async def second(item):
+        return f"doc_{item}"
+
+    pipeline = Pipeline([Stage("first", first, concurrency=4, collect=True),
+                         Stage("second", second, concurrency=2, collect=True)])
+    results = await pipeline.run(range(10))
+    assert results["first"] == [item * 2 for item in range(10) if item != 3]
+    assert results["second"] == [f"doc_{item * 2}" for item in range(10) if item != 3]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_respects_stage_concurrency_and_streams():
+    counter = ConcurrencyCounter()
+    finished_first = []
+    started_second_before_first_done = []
+
+    async def slow(item):
+        await asyncio.sleep(0.005)
+        finished_first.append(item)
+        return item
+
+    async def record(item):
+        started_second_before_first_done.append(len(finished_first) < 12)
+        return item
+
+    pipeline = Pipeline([Stage("slow", lambda item: counter.run(slow, item), concurrency=3),
+                         Stage("record", record, concurrency=1, collect=True)])
+    results = await pipeline.run(range(12))
+    assert counter.max_running == 3
+    assert results["record"] == list(range(12))
+    assert any(started_second_before_first_done)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_stage_error_does_not_stop_other_items():
+    done = []
+
+    async def failing(item):
+        if item == 1:
+            raise ValueError("failed")
+        return item
+
+    pipeline = Pipeline([Stage("failing", failing, concurrency=2, collect=True)],
+                        on_stage_done=lambda stage, item: done.append(item))
+    results = await pipeline.run(range(3))
+    assert results["failing"] == [0, 2]
+    assert sorted(done) == [0, 2]
+    assert pipeline.failures == ["[failing] 1: failed"]
+
+
+class Document:
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+
+@pytest.mark.asyncio
+async def test_pipeline_failure_described_with_stage_label():
+    async def render(document):
+        raise ValueError("template missing")
+
+    pipeline = Pipeline([Stage("render", render, label=lambda document: document.file_path)])
+    await pipeline.run([Document("WNIOSKI/wniosek_1.docx")])
+    assert pipeline.failures == ["[render] WNIOSKI/wniosek_1.docx: template missing"]
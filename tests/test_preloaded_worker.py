@@ -0,0 +1,21 @@
+from pytest_redis import factories
+
+from helpers.preloaded_worker import PreloadedWorker, get_rss_mb
+
+redis_external = factories.redisdb('redis_nooproc')
+
+
+def test_worker_recycled_after_max_jobs(redis_external):
+    worker = PreloadedWorker(["default"], connection=redis_external, max_jobs=2, max_memory_mb=0)
+    worker.executed_jobs = 1
+    assert not worker.should_recycle()
+    worker.executed_jobs = 2
+    assert worker.should_recycle()
+
+
+def test_worker_recycled_after_memory_limit(redis_external):
+    assert get_rss_mb() > 0
+    worker = PreloadedWorker(["default"], connection=redis_external, max_jobs=0, max_memory_mb=1)
+    assert worker.should_recycle()
+    worker.max_memory_mb = 1024 * 1024
+    assert not worker.should_recycle()
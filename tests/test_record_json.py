@@ -0,0 +1,24 @@
+from helpers.db import db
+from models.record import RecordModel
+from tests.common import add_record, count_queries
+
+
+def test_json_filtered_by_program_matches_json(setup_record_test_init, product_store_carrot):
+    contract, product_store_milk, _ = setup_record_test_init
+    records = [add_record(date, contract.id, product_store) for date in ["04.12.2023", "05.12.2023", "06.12.2023"]
+               for product_store in [product_store_milk, product_store_carrot]]
+    db.session.expire_all()
+
+    with count_queries() as per_record_queries:
+        expected = sorted([record.json() for record in RecordModel.all_filtered_by_program(contract.program_id)],
+                          key=lambda data: data["id"])
+    db.session.expire_all()
+    with count_queries() as bulk_queries:
+        result = RecordModel.json_filtered_by_program(contract.program_id)
+
+    assert result == expected
+    assert len(result) == len(records)
+    assert len(bulk_queries) == 1
+    assert len(per_record_queries) > len(bulk_queries)
+    for record in records:
+        record.delete_from_db()
@@ -0,0 +1,27 @@
+from models.record import RecordModel
+from resources.record import RecordsPlanner, RecordResponse, RecordAdditionResult
+from tests.common_data import school_data
+
+
+def test_records_planner(setup_record_test_init, product_store_apple, product_store_carrot):
+    contract, product_store_milk, _ = setup_record_test_init
+    nick = school_data["nick"]
+    responses = [RecordResponse(nick, "milk"), RecordResponse(nick, "apple"), RecordResponse(nick, "carrot"),
+                 RecordResponse(nick, "milk"), RecordResponse(nick, "unknown"), RecordResponse("unknown", "milk")]
+    results = RecordsPlanner(contract.program_id, "13.12.2023").plan(responses)
+
+    assert [result.result for result in results] == [RecordAdditionResult.SUCCESS,
+                                                      RecordAdditionResult.SUCCESS,
+                                                      RecordAdditionResult.RECORD_OF_THIS_TYPE_EXISTS,
+                                                      RecordAdditionResult.RECORD_OF_THIS_TYPE_EXISTS,
+                                                      RecordAdditionResult.FAILED_WITH_OTHER_REASON,
+                                                      RecordAdditionResult.FAILED_WITH_OTHER_REASON]
+    milk_record = RecordModel.find_by_id(results[0].record_id)
+    assert milk_record.product_store_id == product_store_milk.id and milk_record.contract_id == contract.id
+    assert RecordModel.find_by_id(results[1].record_id).product_store_id == product_store_apple.id
+    assert results[0].json(RecordModel.json_by_ids([results[0].record_id])[0]) == results[0].json()
+
+    again = RecordsPlanner(contract.program_id, "13.12.2023").plan([RecordResponse(nick, "milk")])
+    assert again[0].result == RecordAdditionResult.RECORD_OF_THIS_TYPE_EXISTS
+    for result in results[:2]:
+        RecordModel.find_by_id(result.record_id).delete_from_db()
@@ -1,7 +1,8 @@
 import pytest
 
 from helpers.common import FileData
-from helpers.redis_commands import save_uploaded_files, remove_file, get_uploaded_file
+from helpers.redis_commands import save_uploaded_files, remove_file, get_uploaded_file, get_uploaded_files, \
+    remove_old_save_new
 from pytest_redis import factories
 
 redis_external = factories.redisdb('redis_nooproc')
@@ -21,4 +22,14 @@ def test_successful_save_and_removed(redis_external):
         get_uploaded_file(test_file_1.name, redis_connection=redis_external)
 
 
-
+def test_remove_old_save_new_schedules_removing_superseded_files(redis_external):
+    from rq import Queue
+    old_files = [FileData(_name=f"test_file_{i}", _webViewLink="http://dummy.com/old", _id=f"old_{i}") for i in range(3)]
+    assert save_uploaded_files(old_files, redis_connection=redis_external) == 3
+    new_files = [FileData(_name=f"test_file_{i}", _webViewLink="http://dummy.com/new", _id=f"new_{i}") for i in range(2)]
+    remove_old_save_new(new_files, redis_connection=redis_external, deferred=True)
+    found = get_uploaded_files(["test_file_0", "test_file_1", "test_file_2", "missing"], redis_external)
+    assert {name: file.id for name, file in found.items()} == {"test_file_0": "new_0", "test_file_1": "new_1",
+                                                                "test_file_2": "old_2"}
+    (job,) = Queue(connection=redis_external).jobs
+    assert job.args == (["old_0", "old_1"],)
@@ -0,0 +1,56 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from pytest_redis import factories
+from redis import Redis
+from sqlalchemy.exc import NoResultFound
+
+from models.product import WeightTypeModel, ProductTypeModel, ProductStoreModel
+from models.reference_cache import ReferenceCache
+
+redis_external = factories.redisdb('redis_nooproc')
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.1)
+    return condition()
+
+
+def test_reference_cache_lookups(product_store_milk, redis_external):
+    cache = ReferenceCache(redis_connection=redis_external)
+    dairy = cache.product_type_by_name(ProductTypeModel.DAIRY_TYPE)
+    assert cache.product_type(dairy.id).is_dairy()
+    assert cache.product_by_name("milk").type == dairy
+    assert [store.id for store in cache.product_stores(product_store_milk.program_id)] == \
+           [store.id for store in ProductStoreModel.query.filter_by(program_id=product_store_milk.program_id)
+            .order_by(ProductStoreModel.id)]
+    assert ProductStoreModel.find(product_store_milk.program_id, ProductTypeModel.DAIRY_TYPE)[0].json() == \
+           ProductStoreModel.find_by_id(product_store_milk.id).json()
+    with pytest.raises(NoResultFound):
+        cache.product_by_name("unknown")
+
+
+def test_reference_cache_reloads_after_published_version(product_store_milk, redis_external):
+    listening = ReferenceCache(redis_connection=redis_external)
+    data = listening.data()
+    assert listening.data() is data
+    weight_type = WeightTypeModel("reference_cache_test")
+    ReferenceCache(redis_connection=redis_external).invalidate()
+    assert wait_for(lambda: listening.data() is not data)
+    assert listening.weight_type_by_name("reference_cache_test").id == weight_type.id
+    weight_type.delete_from_db()
+
+
+def test_reference_cache_without_redis_keeps_data(product_store_milk):
+    unavailable = Redis(host="localhost", port=1, socket_connect_timeout=0.1)
+    cache = ReferenceCache(redis_connection=unavailable)
+    data = cache.data()
+    with patch.object(unavailable, "pubsub", wraps=unavailable.pubsub) as pubsub:
+        assert cache.data() is data
+        assert cache.product_by_name("milk").id == product_store_milk.product_id
+        pubsub.assert_not_called()
+    cache.invalidate()
+    assert cache.data() is not data
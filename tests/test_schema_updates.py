@@ -0,0 +1,32 @@
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+
+from models.schema_updates import upgrade_schema
+
+
+def test_upgrade_schema_adds_columns_indexes_and_runs_backfills():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite://"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db = SQLAlchemy(app)
+
+    class Folder(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        name = db.Column(db.String(80), nullable=False)
+        path = db.Column(db.String(500), nullable=True, index=True)
+
+    def backfill(_db):
+        _db.session.execute(text("UPDATE folder SET path = name WHERE path IS NULL"))
+        _db.session.commit()
+
+    with app.app_context():
+        db.session.execute(text("CREATE TABLE folder (id INTEGER PRIMARY KEY, name VARCHAR(80) NOT NULL)"))
+        db.session.execute(text("INSERT INTO folder (name) VALUES ('main')"))
+        db.session.commit()
+        upgrade_schema(db, backfill_functions=[backfill])
+        upgrade_schema(db, backfill_functions=[backfill])
+        inspector = inspect(db.engine)
+        assert "path" in [column["name"] for column in inspector.get_columns("folder")]
+        assert [index["column_names"] for index in inspector.get_indexes("folder")] == [["path"]]
+        assert Folder.query.one().path == "main"
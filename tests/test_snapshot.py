@@ -0,0 +1,52 @@
+import pickle
+from dataclasses import FrozenInstanceError
+
+import pytest
+
+from models.record import RecordModel, RecordState
+from models.snapshot import load_records_by_ids, load_contracts, RecordSnapshot
+from tests.common import add_record
+
+
+@pytest.fixture(scope="module")
+def delivered_records(setup_record_test_init):
+    contract, product_store_milk, week = setup_record_test_init
+    records = [add_record(date, contract.id, product_store_milk) for date in ["05.12.2023", "12.12.2023"]]
+    yield records
+    for record in records:
+        record.delete_from_db()
+
+
+def test_records_snapshot_has_same_data_as_models(delivered_records):
+    snapshots = load_records_by_ids([record.id for record in delivered_records])
+    assert len(snapshots) == len(delivered_records)
+    for (record, snapshot) in zip(sorted(delivered_records, key=lambda r: r.id), snapshots):
+        record = RecordModel.find_by_id(record.id)
+        assert isinstance(snapshot, RecordSnapshot)
+        assert snapshot.state == RecordState.DELIVERED
+        assert snapshot.get_record_no() == record.get_record_no()
+        assert str(snapshot) == str(record)
+        assert snapshot.contract.school.nick == record.contract.school.nick
+        assert snapshot.contract.get_kids_no(snapshot.product_type, snapshot.date) == record.delivered_kids_no
+        assert snapshot.contract.program.get_main_dir() == record.contract.program.get_main_dir()
+        assert snapshot.product_store.product.weight.name == record.product_store.product.weight.name
+        assert str(snapshot.week) == str(record.week)
+    assert snapshots[0].contract is snapshots[1].contract
+
+
+def test_snapshot_is_immutable_and_picklable(delivered_records):
+    snapshot = load_records_by_ids([delivered_records[0].id])[0]
+    with pytest.raises(FrozenInstanceError):
+        snapshot.no = 10
+    assert not hasattr(snapshot, "__dict__")
+    restored = pickle.loads(pickle.dumps(snapshot))
+    assert restored == snapshot
+    assert restored.get_record_no() == snapshot.get_record_no()
+
+
+def test_contracts_snapshot_with_weeks(setup_record_test_init):
+    contract, _, week = setup_record_test_init
+    snapshot = load_contracts([contract.id], with_weeks=True)[contract.id]
+    assert [annex.no for annex in snapshot.annex] == [annex.no for annex in contract.annex]
+    assert week.id in [program_week.id for program_week in snapshot.program.weeks]
+    assert snapshot.school.fill_responsible_person() == contract.school.fill_responsible_person()
@@ -0,0 +1,44 @@
+from os import path, utime, stat
+from shutil import copy
+
+import pytest
+
+from helpers.template_registry import TemplateRegistry
+from tests.common import all_fields_to_marge_are_in_file
+
+TEMPLATE = path.join("helper_files", "test_file.docx")
+
+
+@pytest.fixture
+def registry():
+    yield TemplateRegistry()
+
+
+def test_template_parsed_once(registry):
+    first = registry.get(TEMPLATE)
+    second = registry.get(TEMPLATE)
+    assert first is second
+    assert first.merge_fields == {"dummy_data", "dummy_data_no"}
+    assert registry.stats() == {"hits": 1, "misses": 1, "templates": 1}
+
+
+def test_clones_are_independent(registry, tmp_path):
+    template = registry.get(TEMPLATE)
+    first, second = template.clone(), template.clone()
+    first.merge(dummy_data_no="1", dummy_data="first document")
+    second.merge(dummy_data_no="2", dummy_data="second document")
+    first_file, second_file = path.join(tmp_path, "first.docx"), path.join(tmp_path, "second.docx")
+    first.write(first_file)
+    second.write(second_file)
+    all_fields_to_marge_are_in_file(first_file, dummy_data_no="1", dummy_data="first document")
+    all_fields_to_marge_are_in_file(second_file, dummy_data_no="2", dummy_data="second document")
+
+
+def test_template_reloaded_after_change(registry, tmp_path):
+    template_copy = path.join(tmp_path, "template.docx")
+    copy(TEMPLATE, template_copy)
+    first = registry.get(template_copy)
+    modified = stat(template_copy).st_mtime + 10
+    utime(template_copy, (modified, modified))
+    assert registry.get(template_copy) is not first
+    assert registry.stats()["misses"] == 2
@@ -0,0 +1,46 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import NoResultFound
+
+from helpers.week_calendar import WeekCalendar
+from models.snapshot import WeekSnapshot
+
+
+def week(week_id, week_no, start_date, end_date, program_id=1):
+    return WeekSnapshot(id=week_id, week_no=week_no, start_date=start_date, end_date=end_date, program_id=program_id)
+
+
+WEEKS = [week(3, 3, datetime(2023, 12, 18), datetime(2023, 12, 22)),
+         week(1, 1, datetime(2023, 12, 4), datetime(2023, 12, 8)),
+         week(2, 2, datetime(2023, 12, 11), datetime(2023, 12, 15))]
+
+
+@pytest.mark.parametrize("date,week_no", [("04.12.2023", 1), ("08.12.2023", 1), ("2023-12-13", 2),
+                                          (datetime(2023, 12, 22), 3)])
+def test_find_by_date(date, week_no):
+    calendar = WeekCalendar(WEEKS)
+    assert not calendar.overlapping
+    assert calendar.find_by_date(date).week_no == week_no
+
+
+@pytest.mark.parametrize("date", ["01.12.2023", "09.12.2023", "23.12.2023"])
+def test_date_without_week_raises(date):
+    with pytest.raises(NoResultFound):
+        WeekCalendar(WEEKS).find_by_date(date)
+
+
+def test_overlapping_weeks_found_at_load():
+    calendar = WeekCalendar([*WEEKS, week(4, 4, datetime(2023, 12, 1), datetime(2023, 12, 12))])
+    assert [calendar.weeks[i].id for i in sorted(calendar.overlapping)] == [4, 1, 2]
+    with pytest.raises(ValueError):
+        calendar.find_by_date("05.12.2023")
+    assert calendar.find_by_date("02.12.2023").id == 4
+    assert calendar.find_by_date("14.12.2023").id == 2
+    assert calendar.find_by_date("20.12.2023").id == 3
+
+
+def test_find_by_id():
+    calendar = WeekCalendar(WEEKS)
+    assert calendar.find_by_id(2) is WEEKS[2]
+    assert calendar.find_by_id(5) is None
@@ -1,9 +1,64 @@
+from multiprocessing import get_context
+from os import getpid
+import signal
+import sys
+import time
+
 from rq import Connection, Worker
 
+from helpers.config_parser import config_parser
+from helpers.logger import app_logger
 from helpers.redis_commands import conn as redis_conn
+from helpers.db_context import get_app
 
+QUEUES = [queue.strip() for queue in config_parser.get("Worker", "queues", fallback="default").split(",")]
+WORKER_PROCESSES = config_parser.getint("Worker", "processes", fallback=1)
+PRELOADED_WORKER = config_parser.getboolean("Worker", "preloaded", fallback=True)
+RESPAWN_DELAY = 1
 
-if __name__ == '__main__':
+
+def run_preloaded_worker():
+    from helpers.preloaded_worker import PreloadedWorker, preload
+    preload()
     with Connection(redis_conn):
-        worker = Worker(['default'])
+        worker = PreloadedWorker(QUEUES)
         worker.work()
+
+
+def supervise(processes):
+    """Keeps given number of preloaded workers running, worker which recycled itself is replaced by a new one"""
+    context = get_context("spawn")
+    children = dict()
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for child in children.values():
+            if child.is_alive():
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while not stopping:
+        for slot in range(processes):
+            child = children.get(slot)
+            if child is None or not child.is_alive():
+                if child is not None:
+                    app_logger.info(f"Worker {child.pid} exited with {child.exitcode}, starting new one")
+                    time.sleep(RESPAWN_DELAY)
+                children[slot] = context.Process(target=run_preloaded_worker, name=f"worker-{slot}")
+                children[slot].start()
+        time.sleep(RESPAWN_DELAY)
+    for child in children.values():
+        child.join()
+    app_logger.info(f"Supervisor {getpid()} stopped")
+
+
+if __name__ == '__main__':
+    if not PRELOADED_WORKER or "--forking" in sys.argv:
+        get_app()
+        with Connection(redis_conn):
+            worker = Worker(QUEUES)
+            worker.work()
+    else:
+        supervise(WORKER_PROCESSES)